@@ -0,0 +1,158 @@
+import os
+import sys
+import glob
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+SUFFIX = "_featurecounts.txt"
+QUANTS_DIR = "data/quants"
+
+def read_counts(file_path: str) -> tuple:
+    """
+    Gene ids and counts of a featureCounts output file (columns 1 and 7, as count_matrix.R).
+
+    The '#' lines before the header are skipped and only the two columns are parsed.
+
+    Returns
+    -------
+    genes : ndarray of str
+    counts : ndarray of int64
+    """
+
+    with open(file_path, 'r') as f:
+        line = f.readline()
+        while line.startswith("#"):
+            line = f.readline()
+        # line is the header (Geneid, Chr, Start, End, Strand, Length, <bam>)
+        table = pd.read_csv(f, sep="\t", header=None, usecols=[0, 6], dtype={0: str, 6: np.int64}, engine="c")
+    return table[0].to_numpy(dtype=str), table[6].to_numpy()
+
+def _genes_hash(genes: np.ndarray) -> str:
+    return hashlib.sha256("\n".join(genes).encode()).hexdigest()
+
+def _read_counts_hashed(file_path: str) -> tuple:
+    """Counts of a file with the hash of its gene ids, so that only the counts are sent back by the worker processes."""
+    genes, counts = read_counts(file_path)
+    return _genes_hash(genes), counts
+
+def sample_name(file_path: str) -> str:
+    """Sample of a featureCounts file: its name without _featurecounts.txt."""
+    return os.path.basename(file_path).replace(SUFFIX, "")
+
+def build_count_matrix(files: list, workers: int = 1, sort: bool = True) -> tuple:
+    """
+    Stack the counts of featureCounts files into a genes x samples matrix.
+
+    The files are read in a process pool if workers > 1 and their counts are written straight into
+    a preallocated matrix (one column per file, stored column by column). All the files must have
+    the same gene ids: a file listing them in another order is reordered, a file with other gene ids
+    raises a ValueError (count_matrix.R silently kept the genes present in all files).
+
+    Parameters
+    ----------
+    files : list of str
+        featureCounts output files, one per sample, in the order of the columns.
+    workers : int
+        Number of processes.
+    sort : bool
+        Sort the genes by id, as merge() in count_matrix.R. Otherwise keep the order of the files.
+
+    Returns
+    -------
+    genes : ndarray of str
+    samples : list of str
+    counts : ndarray of int64
+        Genes x samples.
+    """
+
+    if not files:
+        raise ValueError("No featureCounts file")
+    genes, first_counts = read_counts(files[0])
+    reference = _genes_hash(genes)
+    order = np.argsort(genes, kind="stable") if sort else np.arange(len(genes))
+    index = pd.Index(genes)
+    if not index.is_unique:
+        raise ValueError(f"{files[0]} has duplicated gene ids")
+
+    counts = np.empty((len(genes), len(files)), dtype=np.int64, order="F")
+    counts[:, 0] = first_counts[order]
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(files) > 2 else None
+    try:
+        if executor is not None:
+            results = executor.map(_read_counts_hashed, files[1:], chunksize=max(1, min(16, len(files) // (workers * 4))))
+        else:
+            results = (_read_counts_hashed(file_path) for file_path in files[1:])
+        for j, (file_path, (genes_hash, file_counts)) in enumerate(zip(files[1:], results), 1):
+            if genes_hash != reference:
+                file_genes, _ = read_counts(file_path)
+                position = index.get_indexer(file_genes)
+                if len(file_genes) != len(genes) or (position < 0).any() or len(np.unique(position)) != len(position):
+                    missing = index.difference(file_genes)
+                    extra = pd.Index(file_genes).difference(index)
+                    raise ValueError(f"{file_path} does not have the gene ids of {files[0]}: "
+                                     f"{len(missing)} missing, {len(extra)} others, {len(file_genes)} in total")
+                print(f"{file_path}: genes in another order, reordered", file=sys.stderr)
+                reordered = np.empty_like(file_counts)
+                reordered[position] = file_counts
+                file_counts = reordered
+            counts[:, j] = file_counts[order]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return genes[order], [sample_name(file_path) for file_path in files], counts
+
+def save_count_matrix(path: str, genes: np.ndarray, samples: list, counts: np.ndarray) -> None:
+    """Write the matrix to a compressed .npz file (arrays counts, genes and samples)."""
+    np.savez_compressed(path, counts=counts, genes=np.asarray(genes, dtype=str), samples=np.asarray(samples, dtype=str))
+
+def load_count_matrix(path: str) -> pd.DataFrame:
+    """Count matrix of save_count_matrix as a DataFrame: one row per gene (index Gene), one column per sample."""
+    with np.load(path) as data:
+        return pd.DataFrame(data["counts"], index=pd.Index(data["genes"], name="Gene"), columns=data["samples"])
+
+def write_tsv(path: str, genes: np.ndarray, samples: list, counts: np.ndarray) -> None:
+    """Write the matrix as count_matrix.R: tab-separated, Gene column then one column per sample, no quotes."""
+    table = pd.DataFrame(counts, columns=samples)
+    table.insert(0, "Gene", genes)
+    table.to_csv(path, sep="\t", index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the gene x sample count matrix of featureCounts files.")
+    parser.add_argument('quants', nargs='?', default=QUANTS_DIR,
+                        help=f'Directory of the *{SUFFIX} files (default: {QUANTS_DIR})')
+    parser.add_argument('--tsv', type=str, default='data/count_matrix.txt',
+                        help='Tab-separated matrix, as written by count_matrix.R, "" to skip (default: data/count_matrix.txt)')
+    parser.add_argument('--npz', type=str, default='data/count_matrix.npz',
+                        help='Compressed binary matrix (numpy .npz: counts, genes, samples), "" to skip (default: data/count_matrix.npz)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes reading the files (default: all cores)')
+    parser.add_argument('--keep-order', action='store_true', help='Keep the gene order of the files instead of sorting the genes by id')
+
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(glob.escape(args.quants), f"*{SUFFIX}")))
+    if not files:
+        print(f"No *{SUFFIX} file in {args.quants}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    try:
+        genes, samples, counts = build_count_matrix(files, workers=args.workers, sort=not args.keep_order)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(f"{len(genes)} genes x {len(samples)} samples read in {time.perf_counter() - start:.1f} s")
+
+    if args.npz:
+        save_count_matrix(args.npz, genes, samples, counts)
+        print(f"Count matrix saved to {args.npz}")
+    if args.tsv:
+        write_tsv(args.tsv, genes, samples, counts)
+        print(f"Count matrix saved to {args.tsv}")
+
+if __name__ == "__main__":
+    main()
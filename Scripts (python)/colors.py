@@ -38,3 +38,44 @@ def lighter_colors(base_color, num_colors):
         lighter_colors.append(f'#{new_r:02X}{new_g:02X}{new_b:02X}')
 
     return lighter_colors
+
+
+_HEX = [f'{value:02X}' for value in range(256)]
+_PALETTES = {}
+
+def lighter_palettes(base_colors, num_colors):
+    """
+    Generate the lighter_colors palettes of many base colors at once.
+
+    The RGB components of all the base colors are computed in one numpy array, with the same
+    steps and rounding as lighter_colors. Palettes are memoised, only new (base color, num_colors)
+    pairs are computed.
+
+    Parameters:
+    -----------
+    base_colors : iterable of str
+        Hex color codes ('#' followed by six hexadecimal digits). Duplicates are computed once.
+
+    num_colors : int
+        The number of lighter color variations of each base color. Must be a positive integer.
+
+    Returns:
+    --------
+    dict
+        {base color: list of hex color codes}, as returned by lighter_colors(base color, num_colors).
+
+    """
+
+    import numpy as np
+
+    base_colors = list(dict.fromkeys(base_colors))
+    missing = [color for color in base_colors if (color, num_colors) not in _PALETTES]
+    if missing:
+        rgb = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in missing], dtype=float)
+        steps = (255 - rgb) / num_colors
+        # (base color, variation, component), truncated like int() in lighter_colors
+        values = (rgb[:, None, :] + np.arange(num_colors)[None, :, None] * steps[:, None, :]).astype(int)
+        for color, palette in zip(missing, values.tolist()):
+            _PALETTES[(color, num_colors)] = [f'#{_HEX[r]}{_HEX[g]}{_HEX[b]}' for r, g, b in palette]
+
+    return {color: list(_PALETTES[(color, num_colors)]) for color in base_colors}
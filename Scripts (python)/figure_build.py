@@ -0,0 +1,262 @@
+"""
+Build the panels of a figure from a script, without a display.
+
+The panels are declared in a spec file, a Python file defining a PANELS dict:
+
+    def prepare_abundance(sources):
+        # Aggregate the source files into the data of the panel
+        counts = pd.read_csv(sources[0], sep="\\t")
+        counts["taxa"] = rename_taxa_series(counts["taxa"])
+        return counts.groupby("taxa", as_index=False)["reads"].sum()
+
+    def draw_abundance(data, fig):
+        ax = fig.subplots()
+        palette = lighter_palettes(["#1F77B4"], len(data))["#1F77B4"]
+        ax.barh(data["taxa"], data["reads"], color=palette)
+        letter_annotation(ax, -.2, 1.05, "A")
+
+    PANELS = {
+        "abundance": {"sources": ["counts.tsv"], "prepare": prepare_abundance, "draw": draw_abundance, "figsize": (5, 4)},
+    }
+
+Source paths are relative to the spec file. Each panel is built in a worker process:
+- its data (the output of prepare, a DataFrame or any picklable object) is cached in the cache
+  directory, keyed by the SHA-256 of the source files and of the code of prepare;
+- it is rendered to <output>/<panel>.<format> only when its data, the code of draw or the figure
+  options changed since the last build, recorded in <output>/.figure_build.json.
+So after a change of one source file, only the panels using it are prepared and rendered again.
+
+Usage: figure_build.py spec.py [--panels NAME ...] [--output figures] [--cache .figure_cache]
+                               [--format png] [--dpi 300] [--workers N] [--force]
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import pickle
+import hashlib
+import inspect
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from colors import lighter_palettes
+from rename_taxa import rename_taxa_series
+
+MANIFEST = ".figure_build.json"
+_CHUNK_SIZE = 1 << 20
+
+# Spec modules loaded by this process, by path
+_SPECS = {}
+
+def letter_annotation(ax, xoffset, yoffset, letter):
+    """Write the letter of a panel in bold, at (xoffset, yoffset) in axes coordinates (see figures.ipynb)."""
+    ax.text(xoffset, yoffset, letter, transform=ax.transAxes, size=12, weight='bold')
+
+def load_spec(spec_path: str) -> dict:
+    """
+    Load the PANELS of a spec file, once per process.
+
+    Returns
+    -------
+    panels : dict
+        {name: {"sources": list of absolute paths, "prepare": function, "draw": function, "figsize": tuple}}
+    """
+
+    spec_path = os.path.abspath(spec_path)
+    if spec_path not in _SPECS:
+        spec = importlib.util.spec_from_file_location(f"figure_spec_{len(_SPECS)}", spec_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if not isinstance(getattr(module, "PANELS", None), dict):
+            raise ValueError(f"{spec_path} does not define a PANELS dict")
+        directory = os.path.dirname(spec_path)
+        panels = {}
+        for name, panel in module.PANELS.items():
+            missing = {"sources", "prepare", "draw"} - set(panel)
+            if missing:
+                raise ValueError(f"Panel {name} of {spec_path} has no {', '.join(sorted(missing))}")
+            panels[name] = {**panel, "figsize": tuple(panel.get("figsize", (6, 4))),
+                            "sources": [os.path.join(directory, source) for source in panel["sources"]]}
+        _SPECS[spec_path] = panels
+    return _SPECS[spec_path]
+
+def _file_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _code(function) -> str:
+    """Source code of a function, its qualified name if the source is not available."""
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return f"{function.__module__}.{function.__qualname__}"
+
+def _key(*parts) -> str:
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode()).hexdigest()
+
+def data_key(name: str, panel: dict) -> str:
+    """Key of the data of a panel: hash of its source files and of the code of its prepare function."""
+    return _key(name, _code(panel["prepare"]), *(_file_hash(source) for source in panel["sources"]))
+
+def panel_data(name: str, panel: dict, cache_dir: str, key: str = None) -> tuple:
+    """
+    Data of a panel, from the cache if its key did not change, else from prepare (then cached).
+
+    Returns
+    -------
+    data : object
+        Output of prepare.
+    cached : bool
+    """
+
+    key = key or data_key(name, panel)
+    cache_path = os.path.join(cache_dir, f"{name}-{key[:16]}.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f), True
+
+    data = panel["prepare"](panel["sources"])
+    os.makedirs(cache_dir, exist_ok=True)
+    # Previous versions of the data of the panel are no longer used
+    for old_path in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(name)}-*.pkl")):
+        os.remove(old_path)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return data, False
+
+def build_panel(spec_path: str, name: str, cache_dir: str, output_dir: str, fmt: str = "png", dpi: int = 300,
+                previous_key: str = None, force: bool = False) -> dict:
+    """
+    Prepare (or load from the cache) and render one panel, unless its output is up to date.
+
+    Parameters
+    ----------
+    spec_path : str
+    name : str
+        Name of the panel in PANELS.
+    cache_dir, output_dir : str
+    fmt : str
+        Format of the output file (any format of matplotlib savefig).
+    dpi : int
+    previous_key : str, optional
+        Render key of the last build of the panel: the panel is not rendered again if it did not change.
+    force : bool
+        Prepare and render the panel even if it is up to date.
+
+    Returns
+    -------
+    result : dict
+        panel, output, key (render key), data ('cached', 'prepared' or 'unused'), rendered (bool), seconds.
+    """
+
+    start = time.perf_counter()
+    panel = load_spec(spec_path)[name]
+    output = os.path.join(output_dir, f"{name}.{fmt}")
+    key_of_data = data_key(name, panel)
+    key = _key(key_of_data, _code(panel["draw"]), panel["figsize"], fmt, dpi)
+    result = {"panel": name, "output": output, "key": key, "data": "unused", "rendered": False}
+
+    if force or key != previous_key or not os.path.exists(output):
+        if force:
+            for old_path in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(name)}-*.pkl")):
+                os.remove(old_path)
+        data, cached = panel_data(name, panel, cache_dir, key_of_data)
+        result["data"] = "cached" if cached else "prepared"
+        fig = plt.figure(figsize=panel["figsize"])
+        try:
+            panel["draw"](data, fig)
+            os.makedirs(output_dir, exist_ok=True)
+            fig.savefig(output, format=fmt, dpi=dpi, bbox_inches="tight")
+        finally:
+            plt.close(fig)
+        result["rendered"] = True
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def build(spec_path: str, panels: list = None, output_dir: str = "figures", cache_dir: str = ".figure_cache",
+          fmt: str = "png", dpi: int = 300, workers: int = 1, force: bool = False) -> list:
+    """
+    Build the panels of a spec file, in a process pool if workers > 1.
+
+    Parameters
+    ----------
+    spec_path : str
+    panels : list of str, optional
+        Names of the panels to build, all by default.
+    output_dir, cache_dir, fmt, dpi, force
+        See build_panel.
+    workers : int
+        Number of processes.
+
+    Returns
+    -------
+    results : list of dict
+        Output of build_panel, in the order of the panels.
+    """
+
+    names = list(load_spec(spec_path))
+    if panels:
+        unknown = set(panels) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown panels: {', '.join(sorted(unknown))} (available: {', '.join(names)})")
+        names = [name for name in names if name in panels]
+
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    arguments = [(spec_path, name, cache_dir, output_dir, fmt, dpi, manifest.get(name), force) for name in names]
+    if workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(names))) as executor:
+            results = list(executor.map(build_panel, *zip(*arguments)))
+    else:
+        results = [build_panel(*argument) for argument in arguments]
+
+    manifest.update({result["panel"]: result["key"] for result in results})
+    os.makedirs(output_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the panels of a figure spec file, caching their data and rendering only the panels that changed.")
+    parser.add_argument('spec', help='Python file defining PANELS')
+    parser.add_argument('--panels', nargs='+', default=None, help='Panels to build (default: all)')
+    parser.add_argument('--output', type=str, default='figures', help='Output directory of the panels (default: figures)')
+    parser.add_argument('--cache', type=str, default='.figure_cache', help='Directory of the cached panel data (default: .figure_cache)')
+    parser.add_argument('--format', type=str, default='png', help='Output format: png, pdf, svg... (default: png)')
+    parser.add_argument('--dpi', type=int, default=300, help='Resolution of raster outputs (default: 300)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Prepare and render all the panels again')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        results = build(args.spec, args.panels, args.output, args.cache, args.format, args.dpi, args.workers, args.force)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    for result in results:
+        status = f"rendered ({result['data']} data)" if result["rendered"] else "up to date"
+        print(f"{result['panel']}: {status}, {result['seconds']:.2f} s -> {result['output']}")
+    n_rendered = sum(result["rendered"] for result in results)
+    print(f"{n_rendered}/{len(results)} panels rendered in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
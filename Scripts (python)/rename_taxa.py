@@ -18,3 +18,35 @@ def rename_taxa(string):
         return string
 
     return f"{string_list[0][0]}. {' '.join(string_list[1:])}"
+
+
+_RENAMED = {}
+
+def rename_taxa_series(series):
+    """
+    Rename all the taxa names of a pandas Series with rename_taxa.
+
+    Each distinct name is renamed once (pandas.factorize), and the renamed names are memoised
+    across calls, so a column with many repeated taxa costs one rename_taxa call per new name.
+
+    Argument:
+        series (pandas.Series): Taxa names. Missing values are kept.
+
+    Return:
+        pandas.Series: Reformatted taxa names, with the index and name of series.
+
+    Example:
+        rename_taxa_series(pd.Series(["Lactobacillus_crispatus", "Gardnerella_vaginalis", "Lactobacillus_crispatus"]))
+        -> ["L. crispatus", "G. vaginalis", "L. crispatus"]
+    """
+
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series)
+    for name in uniques:
+        if name not in _RENAMED:
+            _RENAMED[name] = rename_taxa(name)
+    renamed = np.array([_RENAMED[name] for name in uniques] + [np.nan], dtype=object)
+    # Missing values have code -1, the last element
+    return pd.Series(renamed[codes], index=series.index, name=series.name)
@@ -1,56 +1,62 @@
 import os
-import sys
 import shutil
-import subprocess
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functions import has_relevant_record
 
-# Function to display help message
-def show_help():
-    print("\nUsage: script.py <antismash_results_path> <jsons_mkdir_path>")
-    print("\nProcess JSON files from the specified antismash results directory.")
-    print("\nArguments:")
-    print("    <antismash_results_path>   Path to the directory containing antismash results.")
-    print("    <jsons_mkdir_path>         Path to create the directory where JSON files will be copied.")
-    print("\nOptions:")
-    print("    --help                    Display this help message.\n")
-    sys.exit(0)
-
-# Function to check JSON file status by calling get_json_status.py
+# Function to check JSON file status, in the worker processes
 def process_json_file(json_file):
     try:
-        # Run the external Python script on the JSON file
-        result = subprocess.run(["python3", "get_json_status.py", json_file], check=True)
-        return result.returncode == 0  # Return True if script succeeded
-    except subprocess.CalledProcessError:
-        # print(f"Error: get_json_status.py failed for {json_file}")
-        return print(f"Not copied: {json_file} (no results found from antiSMASH)")
+        return has_relevant_record(json_file)
+    except (OSError, ValueError):
+        # Unreadable or malformed JSON files are treated as without results
+        return False
 
-# Function to copy the valid JSON file
-def copy_json_file(json_file, destination):
+# Function to link (or copy) the valid JSON file
+def copy_json_file(json_file, destination, mode="hard"):
+    target = os.path.join(destination, os.path.basename(json_file))
     try:
-        shutil.copy(json_file, destination)
-        print(f"Copied:     {json_file}")
-    except shutil.Error as e:
+        # Replace the file of a previous run
+        if os.path.lexists(target):
+            os.remove(target)
+        action = "Copied:"
+        if mode in ("hard", "symlink"):
+            try:
+                if mode == "hard":
+                    os.link(json_file, target)
+                else:
+                    os.symlink(os.path.abspath(json_file), target)
+                action = "Linked:"
+            except OSError:
+                # e.g. destination on another filesystem for a hard link, no symlink support
+                shutil.copy(json_file, target)
+        else:
+            shutil.copy(json_file, target)
+        print(f"{action:<12}{json_file}")
+    except (OSError, shutil.Error) as e:
         print(f"Copy failed for {json_file}: {e}")
 
 # Main function
 def main():
-    # Check if the help option is passed
-    if "--help" in sys.argv:
-        show_help()
+    parser = argparse.ArgumentParser(description="Process JSON files from the specified antismash results directory.")
+    parser.add_argument('antismash_results_path', type=str, help='Path to the directory containing antismash results.')
+    parser.add_argument('jsons_mkdir_path', type=str, help='Path to create the directory where JSON files will be copied.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to check the JSON files (default: 1)')
+    parser.add_argument('--link', choices=['hard', 'symlink', 'copy'], default='hard',
+                        help='How relevant JSON files are placed in jsons_mkdir_path: hard link or symbolic link (both '
+                             'fall back to a copy if the link cannot be made), or copy (default: hard)')
 
-    # Check if the correct number of arguments is passed
-    if len(sys.argv) < 3:
-        print("\nError: Not enough arguments.\n")
-        show_help()
+    args = parser.parse_args()
 
-    # Assign arguments to variables
-    antismash_results_path = sys.argv[1]
-    json_output_path = sys.argv[2]
+    antismash_results_path = args.antismash_results_path
+    json_output_path = args.jsons_mkdir_path
 
     # Create the output directory if it doesn't exist
     os.makedirs(json_output_path, exist_ok=True)
 
     # List files in the antismash_results_path directory
+    json_files = []
     for entry in sorted(os.listdir(antismash_results_path)):
         # Skip hidden files or ignored files
         if entry.startswith("."):
@@ -60,16 +66,22 @@ def main():
 
         # Check if the JSON file exists
         if os.path.isfile(json_file):
-            if process_json_file(json_file):
-                # Copy the file if processing was successful
-                copy_json_file(json_file, json_output_path)
-            else:
-                continue
-                # print(f"File {json_file} is not relevant and will not be copied.")
+            json_files.append(json_file)
         else:
             print(f"Warning: No JSON file found for directory {entry}")
 
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            status = list(executor.map(process_json_file, json_files, chunksize=max(1, len(json_files) // (args.workers * 4))))
+    else:
+        status = [process_json_file(json_file) for json_file in json_files]
+
+    for json_file, relevant in zip(json_files, status):
+        if relevant:
+            copy_json_file(json_file, json_output_path, mode=args.link)
+        else:
+            print(f"Not copied: {json_file} (no results found from antiSMASH)")
+
 # Run the main function when the script is executed
 if __name__ == "__main__":
     main()
-
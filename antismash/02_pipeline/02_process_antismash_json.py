@@ -7,6 +7,18 @@ def main():
     parser.add_argument('path', type=str, help='Path to the directory containing antismash outputs')
     parser.add_argument('temp_dir', type=str, nargs='?', default=os.path.join(os.getcwd(), "temp_file"),
                         help='Path to the temporary directory for saving output files (default: ./temp_file)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read JSON files one record at a time to keep memory usage to about the size of one record')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to parse the JSON files (default: 1)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only parse new or changed JSON files since the last run, using the manifest and partitions saved in temp_dir')
+    parser.add_argument('--top-k', type=int, default=1,
+                        help='Number of most similar known clusters reported per region in region_summary, 0 for all (default: 1)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='Output format: one CSV per table, or one Parquet dataset per table partitioned by MAG (default: csv)')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Write per-file and per-table timings, rows and memory to this JSON-lines file, and print a summary at the end')
 
     args = parser.parse_args()
 
@@ -15,20 +27,25 @@ def main():
         print("Error: No path provided.")
         return
 
-    # Call the parse_json function
-    region_summary_df, query_to_reference_df, similarity_score_df, blast_score_df, mibig_entries_df, cluster_blast_df = parse_json(args.path)
-
     # Create the temp directory in the specified or default location
     if not os.path.exists(args.temp_dir):
         os.mkdir(args.temp_dir)
 
-    # Save DataFrames to CSV files
-    region_summary_df.to_csv(os.path.join(args.temp_dir, "region_summary.csv"), index=False)
-    query_to_reference_df.to_csv(os.path.join(args.temp_dir, "query_to_reference.csv"), index=False)
-    similarity_score_df.to_csv(os.path.join(args.temp_dir, "similarity_score.csv"), index=False)
-    blast_score_df.to_csv(os.path.join(args.temp_dir, "blast_score.csv"), index=False)
-    mibig_entries_df.to_csv(os.path.join(args.temp_dir, "mibig_entries.csv"), index=False)
-    cluster_blast_df.to_csv(os.path.join(args.temp_dir, "cluster_blast.csv"), index=False)
+    table_options = {"region_summary": {"top_k": args.top_k or None}}
+
+    # Call the parse_json function
+    if args.incremental:
+        tables = parse_json_incremental(args.path, args.temp_dir, stream=args.stream, workers=args.workers,
+                                        with_mag=args.format == 'parquet', table_options=table_options, trace=args.trace)
+    else:
+        tables = parse_json(args.path, stream=args.stream, workers=args.workers, with_mag=args.format == 'parquet',
+                            table_options=table_options, trace=args.trace)
+
+    # Save DataFrames
+    write_tables(tables, args.temp_dir, fmt=args.format)
+
+    if args.trace:
+        print_trace_summary(args.trace)
 
 if __name__ == "__main__":
     main()
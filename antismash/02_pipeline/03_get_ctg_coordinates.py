@@ -1,60 +1,156 @@
-import pandas as pd
 import os
+import argparse
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+COLUMNS = ["Gene", "Start", "End", "Strand", "sequence"]
+
+def parse_clusterblast_file(file_path: str) -> pd.DataFrame:
+    """
+    Read the gene table of a clusterblast text output.
+
+    The table starts at the first line beginning with 'ctg' and stops at the first empty
+    or non-table line.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the clusterblast output of one region (e.g. clusterblast/ctg1_c1.txt).
+
+    Returns
+    -------
+    df : DataFrame
+        Gene, Start (1-based), End, Strand and sequence columns, Start and End as integers.
+    """
 
-# List to collect DataFrames
-list_of_df = []
+    genes, starts, ends, strands = [], [], [], []
+    is_table = False
+
+    # Read the file line by line
+    with open(file_path, "r") as f:
+        for line in f:
+            # Detect the start of the table
+            if line.startswith("ctg"):
+                is_table = True
+            if is_table:
+                # Stop if encountering an empty line or non-table line
+                if line.strip() == "" or not line[0].isalnum():
+                    break
+                gene, start, end, strand = line.split()
+                genes.append(gene)
+                starts.append(int(start) + 1)
+                ends.append(int(end))
+                strands.append(strand)
+
+    return pd.DataFrame({
+        "Gene": genes,
+        "Start": pd.array(starts, dtype="int64"),
+        "End": pd.array(ends, dtype="int64"),
+        "Strand": strands,
+        "sequence": os.path.basename(file_path)[:-7]
+    }, columns=COLUMNS)
+
+def get_mag_coordinates(mag_path: str) -> pd.DataFrame:
+    """
+    Gather the gene tables of all clusterblast outputs of one MAG.
+
+    Parameters
+    ----------
+    mag_path : str
+        antiSMASH output directory of the MAG.
+
+    Returns
+    -------
+    df : DataFrame or None
+        None if the MAG has no clusterblast directory.
+    """
 
-# Loop through each MAG
-#for mag in genes_position['MAG'].unique():
-for mag in sorted(os.listdir('/local/scratch/amaros/antismash/results_antismash/')):
     # Define the path to the clusterblast directory
-    file_path = f'/local/scratch/amaros/antismash/results_antismash/{mag}/clusterblast/'
+    file_path = os.path.join(mag_path, "clusterblast")
 
     # Check if the directory exists
     if not os.path.exists(file_path):
         print(f"Directory not found: {file_path}")
-        continue
+        return None
 
-    # Loop through files in the directory
-    for elt in os.listdir(file_path):
-        # Construct the full file path
+    list_of_df = []
+    for elt in sorted(os.listdir(file_path)):
         full_path = os.path.join(file_path, elt)
-        
+
         # Skip if it's not a file
         if not os.path.isfile(full_path):
             continue
 
-        # Initialize variables
-        table_lines = []
-        is_table = False
-
-        # Read the file line by line
-        with open(full_path, "r") as f:
-            for line in f:
-                # Detect the start of the table (adjust condition as needed)
-                if line.startswith("ctg"):
-                    is_table = True
-                # If within the table, collect lines
-                if is_table:
-                    # Stop if encountering an empty line or non-table line
-                    if line.strip() == "" or not line[0].isalnum():
-                        break
-                    table_lines.append(line.strip())
-
-        # Convert the table to a DataFrame
-        if table_lines:
-            try:
-                table_df = pd.DataFrame(
-                    [line.split() for line in table_lines],
-                    columns=["Gene", "Start", "End", "Strand"]
-                )
-                table_df["Start"] = table_df["Start"].astype(int) + 1
-                table_df["Start"] = table_df["Start"].astype(str)
-                table_df['sequence'] = elt[:-7]
-                list_of_df.append(table_df)
-            except ValueError:
-                print(f"Error processing file: {full_path}")
-                continue
-
-pd.concat(list_of_df).to_csv("/local/scratch/amaros/antismash/03_results/ctg_coordinates.csv", index=False)
+        try:
+            table_df = parse_clusterblast_file(full_path)
+        except ValueError:
+            print(f"Error processing file: {full_path}")
+            continue
+        if not table_df.empty:
+            list_of_df.append(table_df)
+
+    return pd.concat(list_of_df, ignore_index=True) if list_of_df else pd.DataFrame(columns=COLUMNS)
+
+def map_bounded(executor, function, items: list, max_pending: int):
+    """
+    Like executor.map, but with at most max_pending items submitted and not yet consumed.
+
+    executor.map submits all the items up front, so the tables of the MAGs read faster than they
+    are written pile up in memory. Here a new MAG is submitted each time a table is consumed.
+
+    Yields
+    ------
+    result
+        Output of function for each item, in the order of the items.
+    """
+
+    items = iter(items)
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            break
+        yield result
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the coordinates of all genes detected by antiSMASH from the clusterblast outputs.")
+    parser.add_argument('results_path', type=str, help='Path to the directory containing one antiSMASH output directory per MAG')
+    parser.add_argument('output', type=str, help='Path of the output CSV file (e.g. ctg_coordinates.csv)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to read the MAG directories (default: 1)')
+
+    args = parser.parse_args()
+
+    mag_paths = [os.path.join(args.results_path, mag) for mag in sorted(os.listdir(args.results_path))
+                 if not mag.startswith(".")]
+
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+        results = map_bounded(executor, get_mag_coordinates, mag_paths, max_pending=args.workers * 2)
+    else:
+        executor = None
+        results = map(get_mag_coordinates, mag_paths)
+
+    # The table of each MAG is appended to the output as soon as it is read, in MAG order
+    n_genes = 0
+    try:
+        with open(args.output, "w") as f:
+            pd.DataFrame(columns=COLUMNS).to_csv(f, index=False)
+            for df in results:
+                if df is not None and not df.empty:
+                    df.to_csv(f, header=False, index=False)
+                    n_genes += len(df)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"{n_genes} genes written to {args.output}")
 
+if __name__ == "__main__":
+    main()
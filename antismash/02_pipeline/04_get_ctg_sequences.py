@@ -1,64 +1,86 @@
-from Bio import SeqIO
-from Bio.SeqRecord import SeqRecord
-from Bio.Seq import Seq
+import os
+import argparse
 import pandas as pd
+from fasta_index import MappedFasta, write_fasta_record
 
-genes_position = pd.read_csv("../03_results/antiSMASH_geneID_w_coordinates2.csv")
+def get_headers(genes_position: pd.DataFrame) -> pd.Series:
+    """Unique FASTA header of each gene: sequence/ctg/Start/End/Strand."""
+    return (
+        genes_position['sequence'] + "/" +
+        genes_position['ctg'] + "/" +
+        genes_position['Start'].astype(str) + "/" +
+        genes_position['End'].astype(str) + "/" +
+        genes_position['Strand']
+    )
 
-# Create header
-new_header = (
-    genes_position['sequence'] + "/" +
-    genes_position['ctg'] + "/" +
-    genes_position['Start'].astype(str) + "/" +
-    genes_position['End'].astype(str) + "/" +
-    genes_position['Strand']
-)
+def write_mag_sequences(output_file, fasta_file: str, genes: pd.DataFrame, index_dir: str = None) -> int:
+    """
+    Write the sequences of the genes of one MAG.
 
-new_header = new_header.to_list()
+    Parameters
+    ----------
+    output_file : file
+        Open output FASTA file.
+    fasta_file : str
+        FASTA file of the MAG. It is memory-mapped and read through its .fai index, which is built on first use.
+    genes : DataFrame
+        Rows of the MAG, with header, sequence_index (1-based position of the contig in the FASTA),
+        Start, End and Strand columns.
+    index_dir : str, optional
+        Directory of the .fai indexes if the FASTA directory is not writable.
 
-# List to store all SeqRecord objects
-all_records = []
+    Returns
+    -------
+    n : int
+        Number of sequences written.
+    """
 
-# Process each entry in new_header
-for elt in new_header:
-    mag = elt.split("/")[0][:8]
-    sequence_index = int(elt.split("/")[0].split("_")[-1])  # Extract sequence index
-    start = int(elt.split("/")[2])
-    end = int(elt.split("/")[3])
-    strand = elt.split("/")[4]
+    with MappedFasta(fasta_file, index_dir) as fasta:
+        # Ensure the requested sequence indexes are valid
+        invalid = genes['sequence_index'][(genes['sequence_index'] <= 0) | (genes['sequence_index'] > len(fasta))]
+        if not invalid.empty:
+            raise ValueError(f"Invalid sequence index: {invalid.iloc[0]}. Total sequences: {len(fasta)}")
 
-    # File and sequence details
-    #fasta_file = f"../00_test/{mag}.fasta"
-    fasta_file = f"/local/projects-t3/LSVF/VIRGO2/final_bins/{mag}.fasta"
-    
-    # Parse the FASTA file
-    with open(fasta_file, "r") as file:
-        sequences = list(SeqIO.parse(file, "fasta"))
+        # Extract the regions (1-based index and coordinates), reverse complemented in bulk
+        intervals = [(fasta.entries[sequence_index - 1], start, end, strand) for sequence_index, start, end, strand
+                     in genes[['sequence_index', 'Start', 'End', 'Strand']].itertuples(index=False)]
+        for header, subsequence in zip(genes['header'], fasta.fetch_batch(intervals)):
+            write_fasta_record(output_file, header, subsequence)
 
-    # Ensure the requested sequence index is valid
-    if sequence_index <= 0 or sequence_index > len(sequences):
-        raise ValueError(f"Invalid sequence index: {sequence_index}. Total sequences: {len(sequences)}")
+    return len(genes)
 
-    # Extract the sequence (1-based index)
-    target_sequence = sequences[sequence_index - 1]  # Adjust for 0-based indexing
-    subsequence = target_sequence.seq[start - 1:end]  # Extract the region (1-based indexing)
+def main():
+    parser = argparse.ArgumentParser(description="Extract the sequences of the genes listed by 03_get_ctg_coordinates.py from the MAG FASTA files.")
+    parser.add_argument('coordinates', type=str, nargs='?', default="../03_results/antiSMASH_geneID_w_coordinates2.csv",
+                        help='CSV file with sequence, ctg, Start, End and Strand columns')
+    parser.add_argument('fasta_dir', type=str, nargs='?', default="/local/projects-t3/LSVF/VIRGO2/final_bins/",
+                        help='Directory containing one {mag}.fasta file per MAG')
+    parser.add_argument('output', type=str, nargs='?', default="../03_results/antismash_genes_sequences2.fasta",
+                        help='Output FASTA file')
+    parser.add_argument('--index-dir', type=str, default=None,
+                        help='Directory where the .fai indexes are saved (default: next to the FASTA files)')
 
-    # Check strand direction
-    if strand == "-":
-        subsequence = subsequence.reverse_complement()
+    args = parser.parse_args()
 
-    # Create a SeqRecord for the FASTA entry
-    record = SeqRecord(
-        Seq(str(subsequence)),
-        id=elt,  # Use `elt` as the FASTA header
-        description=""  # Leave the description empty
-    )
-    all_records.append(record)
+    genes_position = pd.read_csv(args.coordinates)
+    # 03_get_ctg_coordinates.py names the gene column 'Gene'
+    if 'ctg' not in genes_position.columns:
+        genes_position = genes_position.rename(columns={'Gene': 'ctg'})
+    genes_position['header'] = get_headers(genes_position)
+    genes_position['mag'] = genes_position['sequence'].str[:8]
+    genes_position['sequence_index'] = genes_position['sequence'].str.split("_").str[-1].astype(int)
+
+    if args.index_dir is not None:
+        os.makedirs(args.index_dir, exist_ok=True)
 
-# Write all sequences to a single FASTA file
-output_fasta = "../03_results/antismash_genes_sequences2.fasta"
-with open(output_fasta, "w") as output_file:
-    SeqIO.write(all_records, output_file, "fasta")
+    # Each MAG FASTA is opened once, and the records are written as they are extracted
+    n_genes = 0
+    with open(args.output, "w") as output_file:
+        for mag, genes in genes_position.groupby('mag', sort=False):
+            fasta_file = os.path.join(args.fasta_dir, f"{mag}.fasta")
+            n_genes += write_mag_sequences(output_file, fasta_file, genes, args.index_dir)
 
-print(f"Combined FASTA file created: {output_fasta}")
+    print(f"Combined FASTA file created: {args.output} ({n_genes} sequences)")
 
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,275 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-# Define paths
-#input_fasta = "/local/scratch/amaros/antismash/03_results/antismash_genes_sequences2.fasta"
-#blast_db = "/local/scratch/mfrance/VIRGO2/15_blastdb/Genes/VIRGO2"  
-#output_file = "/local/scratch/amaros/antismash/03_results/blast_results2.txt"
-
-input_fasta = "/local/scratch/mfrance/VIRGO2/12_package/VIRGO2.fa"
-output_file = "/local/scratch/amaros/antismash/03_results/VIRGO2_vs_antismash_DB_nucl.txt"
-blast_db = "/local/scratch/amaros/antismash/05_blast_DB/antismash_blast_db_nucl/antimsash_make_db_nucl"
-
-# BLAST command
-blast_command = [
-    "blastn",  # Use "blastp" for protein sequences
-    "-query", input_fasta,  # Input FASTA file
-    "-db", blast_db,  # BLAST database
-    "-out", output_file,  # Output file
-    "-outfmt", "6",  # Output format (tabular)
-    "-evalue", "1e-5",  # E-value threshold
-    "-num_threads", "4"  # Number of threads for parallelization
-]
-
-# Run BLAST
-try:
-    subprocess.run(blast_command, check=True)
-    print(f"BLAST completed successfully. Results saved to {output_file}")
-except subprocess.CalledProcessError as e:
-    print("BLAST command failed.")
-    print(e)
+def fasta_record_offsets(fasta_path: str) -> list:
+    """Byte offset of each '>' header of a FASTA file, followed by the size of the file."""
+    offsets = []
+    position = 0
+    with open(fasta_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                offsets.append(position)
+            position += len(line)
+    return offsets + [position]
 
+def split_query(fasta_path: str, n_shards: int) -> list:
+    """
+    Split a FASTA file into contiguous shards of about the same size.
+
+    Shards follow the order of the records, so the concatenation of the shard results
+    is in query order.
+
+    Parameters
+    ----------
+    fasta_path : str
+        Query FASTA file.
+    n_shards : int
+        Maximum number of shards, there are fewer if there are fewer records.
+
+    Returns
+    -------
+    shards : list of (start, end)
+        Byte range of each shard in the FASTA file.
+    """
+
+    offsets = fasta_record_offsets(fasta_path)
+    n_records = len(offsets) - 1
+    if n_records <= 0:
+        return []
+
+    shards = []
+    first = 0
+    for i in range(1, n_records + 1):
+        # Cut after record i once the shard reaches its share of the remaining bytes
+        remaining_shards = n_shards - len(shards)
+        target = (offsets[-1] - offsets[first]) / remaining_shards
+        if i == n_records or (remaining_shards > 1 and offsets[i] - offsets[first] >= target):
+            shards.append((offsets[first], offsets[i]))
+            first = i
+    return shards
+
+# Umask of the process, read once: mkstemp creates files readable by the owner only
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def _temporary_path(path: str) -> str:
+    """
+    New empty temporary file next to path, for an atomic rename to path.
+
+    The name is unique on the shared filesystem (mkstemp), as SLURM array tasks on different nodes,
+    whose PIDs may be the same, can write the same file.
+    """
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    return tmp_path
+
+def _write_atomic(path: str, write) -> None:
+    tmp_path = _temporary_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextlib.contextmanager
+def _exclusive_lock(lock_path: str):
+    """Hold an exclusive lock on lock_path (fcntl.flock, also between nodes on a shared filesystem supporting it)."""
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): only the local pool is used there, the split is done by one process
+        yield
+        return
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def shard_paths(work_dir: str, shard: int) -> dict:
+    name = f"shard_{shard:05d}"
+    return {
+        "query": os.path.join(work_dir, f"{name}.fasta"),
+        "result": os.path.join(work_dir, f"{name}.tsv"),
+        "done": os.path.join(work_dir, f"{name}.done")
+    }
+
+def prepare_shards(query: str, work_dir: str, n_shards: int, resplit: bool = True) -> int:
+    """
+    Write the query shards to the working directory, unless they are already there for this query.
+
+    The split is described by shards.json (query path, size, mtime and number of shards).
+    If it does not match, the previous shards and results are removed and the query is split again.
+    The check and the split hold an exclusive lock on shards.json.lock: when the SLURM array tasks
+    start together, the first one splits the query and the others wait, then use its shards.
+
+    Parameters
+    ----------
+    query : str
+        Query FASTA file.
+    work_dir : str
+        Working directory of the run.
+    n_shards : int
+        Requested number of shards.
+    resplit : bool
+        If False, a split that does not match raises a ValueError instead, e.g. in a SLURM
+        array task where other tasks may be running on the current shards.
+
+    Returns
+    -------
+    n_shards : int
+        Actual number of shards.
+    """
+
+    os.makedirs(work_dir, exist_ok=True)
+    with _exclusive_lock(os.path.join(work_dir, "shards.json.lock")):
+        return _prepare_shards(query, work_dir, n_shards, resplit)
+
+def _prepare_shards(query: str, work_dir: str, n_shards: int, resplit: bool) -> int:
+    manifest_path = os.path.join(work_dir, "shards.json")
+    stat = os.stat(query)
+    expected = {"query": os.path.abspath(query), "size": stat.st_size, "mtime": stat.st_mtime, "requested": n_shards}
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if {key: manifest.get(key) for key in expected} == expected:
+            return manifest["n_shards"]
+        if not resplit:
+            raise ValueError(f"{work_dir} was split for another query or number of shards, split it again without --shard")
+        for name in os.listdir(work_dir):
+            if name.startswith("shard_"):
+                os.remove(os.path.join(work_dir, name))
+
+    shards = split_query(query, n_shards)
+    with open(query, "rb") as source:
+        for shard, (start, end) in enumerate(shards):
+            def write(f):
+                source.seek(start)
+                f.write(source.read(end - start))
+            _write_atomic(shard_paths(work_dir, shard)["query"], write)
+
+    manifest = dict(expected, n_shards=len(shards), shards=shards)
+    _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest, indent=1).encode()))
+    print(f"{query} split into {len(shards)} shards in {work_dir}")
+    return len(shards)
+
+def run_shard(work_dir: str, shard: int, blast_command: list) -> bool:
+    """
+    BLAST one shard, unless its done marker exists.
+
+    The outfmt-6 result is written to a temporary file and renamed when blastn succeeds,
+    then the done marker is written, so an interrupted shard is run again from scratch.
+
+    Parameters
+    ----------
+    work_dir : str
+        Working directory of the run.
+    shard : int
+        Shard number.
+    blast_command : list of str
+        blastn command without -query and -out.
+
+    Returns
+    -------
+    ran : bool
+        False if the shard was already done.
+    """
+
+    paths = shard_paths(work_dir, shard)
+    if os.path.exists(paths["done"]) and os.path.exists(paths["result"]):
+        return False
+
+    tmp_result = _temporary_path(paths["result"])
+    try:
+        subprocess.run(blast_command + ["-query", paths["query"], "-out", tmp_result], check=True)
+    except (subprocess.CalledProcessError, OSError):
+        if os.path.exists(tmp_result):
+            os.remove(tmp_result)
+        raise
+    os.replace(tmp_result, paths["result"])
+    _write_atomic(paths["done"], lambda f: f.write(" ".join(blast_command).encode()))
+    return True
+
+def pending_shards(work_dir: str, n_shards: int) -> list:
+    return [shard for shard in range(n_shards) if not os.path.exists(shard_paths(work_dir, shard)["done"])]
+
+def merge_shards(work_dir: str, n_shards: int, output: str) -> None:
+    """Concatenate the shard results in shard order, i.e. in query order, into the output file."""
+    def write(f):
+        for shard in range(n_shards):
+            with open(shard_paths(work_dir, shard)["result"], "rb") as result:
+                shutil.copyfileobj(result, f)
+    _write_atomic(output, write)
+
+def main():
+    parser = argparse.ArgumentParser(description="BLAST a query FASTA against a nucleotide database in size-balanced, checkpointed shards.")
+    parser.add_argument('query', type=str, help='Query FASTA file (e.g. VIRGO2.fa)')
+    parser.add_argument('db', type=str, help='BLAST database')
+    parser.add_argument('output', type=str, help='Merged outfmt 6 output, in query order')
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help='Directory of the shards, their results and done markers (default: <output>.shards)')
+    parser.add_argument('--shards', type=int, default=32, help='Number of shards (default: 32)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of shards BLASTed at the same time (default: 1)')
+    parser.add_argument('--threads', type=int, default=4, help='-num_threads of each blastn process (default: 4)')
+    parser.add_argument('--evalue', type=str, default="1e-5", help='E-value threshold (default: 1e-5)')
+    parser.add_argument('--blastn', type=str, default="blastn", help='blastn executable, on PATH or a path (default: blastn)')
+    parser.add_argument('--shard', type=int, default=None,
+                        help='Only BLAST this shard, e.g. $SLURM_ARRAY_TASK_ID; the output is merged by the last shard to finish')
+    parser.add_argument('--merge-only', action='store_true', help='Only merge the finished shards into the output')
+
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or f"{args.output}.shards"
+    # subprocess looks a bare name up on PATH only, an executable of the current directory is given by its path
+    blastn = os.path.abspath(args.blastn) if os.path.isfile(args.blastn) else args.blastn
+    blast_command = [blastn, "-db", args.db, "-outfmt", "6", "-evalue", args.evalue, "-num_threads", str(args.threads)]
+
+    n_shards = prepare_shards(args.query, work_dir, args.shards, resplit=args.shard is None and not args.merge_only)
+
+    if args.shard is not None:
+        if not 0 <= args.shard < n_shards:
+            print(f"Shard {args.shard} does not exist, the query has {n_shards} shards.")
+            return
+        shards = [args.shard]
+    elif args.merge_only:
+        shards = []
+    else:
+        shards = pending_shards(work_dir, n_shards)
+        print(f"{n_shards - len(shards)} of {n_shards} shards already done")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {shard: executor.submit(run_shard, work_dir, shard, blast_command) for shard in shards}
+        for shard, future in futures.items():
+            try:
+                if future.result():
+                    print(f"Shard {shard} done")
+            except (subprocess.CalledProcessError, OSError) as e:
+                print(f"Shard {shard} failed: {e}")
+                failed.append(shard)
+
+    remaining = pending_shards(work_dir, n_shards)
+    if remaining:
+        if args.shard is None:
+            print(f"{len(remaining)} shards not done: {remaining}. Run the same command again to resume.")
+        sys.exit(1 if failed or args.shard is None else 0)
+
+    merge_shards(work_dir, n_shards, args.output)
+    print(f"BLAST completed successfully. Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
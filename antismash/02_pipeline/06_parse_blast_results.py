@@ -0,0 +1,40 @@
+import argparse
+from blast_tabular import iter_hits, write_chunks
+from fasta_index import load_fai
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter a BLAST tabular output (outfmt 6) by chunks and keep the best hits of each query.")
+    parser.add_argument('blast_output', type=str, help='BLAST output of 05_blast_ctg.py (e.g. VIRGO2_vs_antismash_DB_nucl.txt)')
+    parser.add_argument('output', type=str, help='Output file (.csv or .parquet)')
+    parser.add_argument('--top-k', type=int, default=1,
+                        help='Number of hits kept per query, ranked by bitscore then evalue (0 keeps all hits, default: 1)')
+    parser.add_argument('--max-evalue', type=float, default=None, help='Maximum evalue')
+    parser.add_argument('--min-pident', type=float, default=None, help='Minimum percentage of identity')
+    parser.add_argument('--min-coverage', type=float, default=None, help='Minimum percentage of the antiSMASH gene covered by the alignment')
+    parser.add_argument('--query-fasta', type=str, default=None,
+                        help='Query FASTA file, to compute the percentage of the query covered by the alignment')
+    parser.add_argument('--min-query-coverage', type=float, default=None, help='Minimum percentage of the query covered, requires --query-fasta')
+    parser.add_argument('--headers', choices=['sseqid', 'qseqid', 'none'], default='sseqid',
+                        help='Column holding the sequence/ctg/Start/End/Strand gene headers of 04_get_ctg_sequences.py (default: sseqid)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000, help='Number of lines read at once (default: 1000000)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output format (default: csv)')
+
+    args = parser.parse_args()
+
+    if args.min_query_coverage is not None and args.query_fasta is None:
+        parser.error("--min-query-coverage requires --query-fasta")
+
+    query_lengths = None
+    if args.query_fasta is not None:
+        query_lengths = {entry.name: entry.length for entry in load_fai(args.query_fasta)}
+
+    hits = iter_hits(args.blast_output, top_k=args.top_k or None, chunksize=args.chunksize,
+                     header_col=None if args.headers == 'none' else args.headers, max_evalue=args.max_evalue,
+                     min_pident=args.min_pident, min_coverage=args.min_coverage,
+                     query_lengths=query_lengths, min_query_coverage=args.min_query_coverage)
+    n_hits = write_chunks(hits, args.output, fmt=args.format)
+
+    print(f"{n_hits} hits written to {args.output}")
+
+if __name__ == "__main__":
+    main()
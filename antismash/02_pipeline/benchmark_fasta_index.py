@@ -0,0 +1,109 @@
+import os
+import random
+import argparse
+import tempfile
+from Bio import SeqIO
+from benchmark_parse_json import timeit
+from fasta_index import MappedFasta
+
+def write_fasta_batch(out_dir: str, n_mags: int, n_contigs: int, contig_length: int, n_genes: int, seed: int = 0) -> dict:
+    """
+    Write synthetic MAG FASTA files (60 bases per line) and draw gene intervals on them.
+
+    Returns
+    -------
+    genes : dict
+        {fasta_path: [(sequence_index, start, end, strand), ...]}, 1-based coordinates.
+    """
+
+    rng = random.Random(seed)
+    genes = {}
+    for mag in range(1, n_mags + 1):
+        path = os.path.join(out_dir, f"MAG{mag:05d}.fasta")
+        with open(path, "w") as f:
+            for contig in range(1, n_contigs + 1):
+                sequence = "".join(rng.choices("ACGT", k=contig_length))
+                f.write(f">MAG{mag:05d}_{contig}\n")
+                f.write("\n".join(sequence[i:i + 60] for i in range(0, contig_length, 60)) + "\n")
+        genes[path] = []
+        for _ in range(n_genes):
+            start = rng.randint(1, contig_length - 3000)
+            genes[path].append((rng.randint(1, n_contigs), start, start + rng.randint(300, 3000), rng.choice("+-")))
+    return genes
+
+def seqio_per_gene(genes: dict) -> list:
+    """Path of 04_get_ctg_sequences.py before the index: the MAG FASTA is parsed again for each gene."""
+    sequences = []
+    for path, intervals in genes.items():
+        for sequence_index, start, end, strand in intervals:
+            with open(path, "r") as f:
+                records = list(SeqIO.parse(f, "fasta"))
+            subsequence = records[sequence_index - 1].seq[start - 1:end]
+            if strand == "-":
+                subsequence = subsequence.reverse_complement()
+            sequences.append(str(subsequence))
+    return sequences
+
+def seqio_per_mag(genes: dict) -> list:
+    """The MAG FASTA is parsed once, and each gene is sliced and reverse complemented as a Seq."""
+    sequences = []
+    for path, intervals in genes.items():
+        with open(path, "r") as f:
+            records = list(SeqIO.parse(f, "fasta"))
+        for sequence_index, start, end, strand in intervals:
+            subsequence = records[sequence_index - 1].seq[start - 1:end]
+            if strand == "-":
+                subsequence = subsequence.reverse_complement()
+            sequences.append(str(subsequence))
+    return sequences
+
+def mapped_batch(genes: dict) -> list:
+    """One memory-mapped batch per MAG, through the .fai index."""
+    sequences = []
+    for path, intervals in genes.items():
+        with MappedFasta(path) as fasta:
+            sequences.extend(fasta.fetch_batch([(fasta.entries[sequence_index - 1], start, end, strand)
+                                                for sequence_index, start, end, strand in intervals]))
+    return sequences
+
+def check_sequences(genes: dict, expected: list, observed: list) -> None:
+    """Raise a RuntimeError naming the first gene whose sequence differs between two extractions."""
+    labels = [f"{os.path.basename(path)} contig {sequence_index} {start}-{end} ({strand})"
+              for path, intervals in genes.items() for sequence_index, start, end, strand in intervals]
+    if len(expected) != len(labels) or len(observed) != len(labels):
+        raise RuntimeError(f"{len(labels)} genes, but {len(expected)} and {len(observed)} sequences extracted")
+    for label, expected_sequence, observed_sequence in zip(labels, expected, observed):
+        if expected_sequence != observed_sequence:
+            raise RuntimeError(f"Different sequences for gene {label}: {len(expected_sequence)} bases with SeqIO, "
+                               f"{len(observed_sequence)} with the .fai index")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gene sequence extraction with Bio.SeqIO and with the memory-mapped .fai engine.")
+    parser.add_argument('--mags', type=int, default=10, help='Number of MAG FASTA files (default: 10)')
+    parser.add_argument('--contigs', type=int, default=100, help='Number of contigs per MAG (default: 100)')
+    parser.add_argument('--length', type=int, default=25000, help='Length of the contigs (default: 25000)')
+    parser.add_argument('--genes', type=int, default=50, help='Number of genes per MAG (default: 50)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported (default: 3)')
+    parser.add_argument('--skip-per-gene', action='store_true', help='Do not time the per-gene SeqIO parse, which is slow')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        genes = write_fasta_batch(path, args.mags, args.contigs, args.length, args.genes)
+
+        # The index is built once, as it is kept next to the FASTA files
+        check_sequences(genes, seqio_per_mag(genes), mapped_batch(genes))
+
+        timings = {}
+        if not args.skip_per_gene:
+            timings["SeqIO, one parse per gene"] = timeit(seqio_per_gene, genes, repeat=1)
+        timings["SeqIO, one parse per MAG"] = timeit(seqio_per_mag, genes, repeat=args.repeat)
+        timings["mmap + .fai, one batch per MAG"] = timeit(mapped_batch, genes, repeat=args.repeat)
+
+    print(f"{args.mags} MAGs, {args.mags * args.genes} genes")
+    reference = max(timings.values())
+    for name, seconds in timings.items():
+        print(f"{name:32s} {seconds:.3f} s ({reference / seconds:.1f}x)")
+
+if __name__ == "__main__":
+    main()
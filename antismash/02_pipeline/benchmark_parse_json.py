@@ -0,0 +1,206 @@
+import os
+import io
+import json
+import time
+import contextlib
+import argparse
+import tempfile
+import pandas as pd
+from functions import *
+from synthetic_antismash import write_batch
+
+# Extractors of functions.py before the rows were buffered, kept as the baseline: each one builds
+# DataFrames per hit, contig or record (pd.DataFrame, pd.concat, pd.merge) from its own walk of the record.
+# Their region_summary (merged on sequence only) and similarity_score (last region only) rows differ
+# from parse_json, as in the original code; the other tables have the same rows.
+
+def original_blast_scores(json_file, idx):
+    list_blast = []
+    blast = json_file["records"][idx]["modules"]["antismash.modules.clusterblast"]["general"]["results"]
+    for region in range(len(blast)):
+        ranking = blast[region]['ranking']
+        for hit in range(len(ranking)):
+            blast_info = ranking[hit][1]['pairings']
+            for score in blast_info:
+                ctg_name = score[0].split("|")[4]
+                coordinate = score[0].split("|")[2]
+                blast_data = dict(score[2])
+                blast_data['coordinate'] = coordinate
+                blast_data['sequence'] = json_file["records"][idx]['id']
+                blast_data['region'] = f"{idx+1}.{region+1}"
+                blast_data['ctg'] = ctg_name
+                list_blast.append(blast_data)
+    return pd.DataFrame(list_blast)
+
+def original_mibig_entries(json_file, idx):
+    try:
+        modules = json_file["records"][idx]["modules"]["antismash.modules.clusterblast"]["knowncluster"]
+    except (KeyError, IndexError) as e:
+        print(f"Error accessing modules or record: {e}")
+        return pd.DataFrame()
+
+    df_mibig_list = []
+    if "mibig_entries" in modules:
+        for region in modules['mibig_entries'].keys():
+            mibig_entries = modules['mibig_entries'][region]
+            for ctg_name in mibig_entries.keys():
+                df_tag_id = pd.DataFrame(mibig_entries[ctg_name])
+                df_tag_id = df_tag_id.drop(columns=[3], axis=1)
+                df_tag_id['sequence'] = json_file["records"][idx]['id']
+                df_tag_id['region'] = f"{idx+1}.{int(region)}"
+                df_tag_id['ctg'] = ctg_name
+                df_mibig_list.append(df_tag_id)
+    else:
+        print(f"No 'mibig_entries' found for record {idx}")
+
+    if not df_mibig_list:
+        return pd.DataFrame()
+    df_mibig = pd.concat(df_mibig_list, axis=0, ignore_index=True)
+    return df_mibig.rename(columns={0: "mibig_protein", 1: "description", 2: "mibig_cluster", 4: "mibig_product",
+                                    5: "percentage_id", 6: "blast_score", 7: "percentage_coverage", 8: "evalue"})
+
+def original_query_to_reference_match(json_file, idx):
+    ctg = []
+    try:
+        results = json_file['records'][idx]['modules']['antismash.modules.cluster_compare']['db_results']['MIBiG']['by_region']
+    except KeyError as e:
+        print(f"KeyError: {e}")
+        return pd.DataFrame()
+
+    for region in results.keys():
+        for bgc in results[region]['ProtoToRegion_RiQ']['hits'].keys():
+            ctg_table = results[region]['ProtoToRegion_RiQ']['hits'][bgc]
+            ctg_table_df = pd.DataFrame(ctg_table).transpose()
+            ctg_table_df['sequence'] = json_file['records'][idx]['id']
+            ctg.append(ctg_table_df)
+    return pd.concat(ctg, axis=0).reset_index().rename(columns={"index": "protein"}) if ctg else pd.DataFrame()
+
+def original_similarity_score_w_annotation(json_file, idx):
+    try:
+        results = json_file['records'][idx]['modules']['antismash.modules.cluster_compare']['db_results']['MIBiG']['by_region']
+    except KeyError as e:
+        print(f"KeyError: {e}")
+        return pd.DataFrame()
+
+    data_score = {}
+    data_annotation = []
+    similarity_score = None
+    for region_idx in results.keys():
+        for analysis in results[region_idx].keys():
+            scores_by_region = results[region_idx][analysis].get('scores_by_region', {})
+            if scores_by_region:
+                data_score[analysis] = scores_by_region
+                similarity_score = pd.DataFrame(data_score).reset_index().rename(columns={"index": "reference"})
+                similarity_score['position'] = similarity_score['reference'].apply(lambda x: x.split(": ")[1])
+                similarity_score['reference'] = similarity_score['reference'].apply(lambda x: x.split(": ")[0])
+                similarity_score['region'] = f"{idx+1}.{region_idx}"
+                similarity_score['sequence'] = json_file['records'][idx]['id']
+            else:
+                similarity_score = None
+
+            for hit in results[region_idx][analysis].get('reference_regions', {}).values():
+                data_annotation.append({
+                    'reference': hit.get('accession'),
+                    'type': '; '.join(hit.get('products')),
+                    'compound': hit.get('description'),
+                    'organism': hit.get('organism')
+                })
+
+    if similarity_score is not None and data_annotation:
+        return pd.merge(similarity_score, pd.DataFrame(data_annotation), on="reference", how="left").drop_duplicates()
+    return pd.DataFrame()
+
+def original_region_summary(json_file, idx):
+    record = json_file['records'][idx]
+    rows = [[record['description'], f"{idx+1}.{i+1}", area['products']] for i, area in enumerate(record['areas'])]
+    region_type = pd.DataFrame(rows, columns=['sequence', 'region', 'type'])
+
+    rows = []
+    ranking = record['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking']
+    for hit in ranking:
+        rows.append([record['id'], hit[0]['description'], hit[0]['cluster_type'], hit[1]['similarity']])
+    most_similar_known_cluster_df = pd.DataFrame(rows, columns=['sequence', 'most_similar_known_cluster',
+                                                                'most_similar_known_cluster_type', 'similarity'])
+    return pd.merge(region_type, most_similar_known_cluster_df, on='sequence', how='left')
+
+def original_cluster_blast_result(json_file, idx):
+    try:
+        results = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['general']['results']
+    except KeyError as e:
+        print(f"KeyError: {e}")
+        return pd.DataFrame()
+
+    data_annotation = []
+    data_metrics = []
+    for result in results:
+        for reference, score in result['ranking']:
+            data_annotation.append({
+                'accession': reference.get('accession'),
+                'cluster_label': reference.get('cluster_label'),
+                'description': reference.get('description'),
+                'cluster_type': reference.get('cluster_type'),
+                'number_of_genes_in_ref': len(reference.get('proteins'))
+            })
+            data_metrics.append({key: score.get(key) for key in ('hits', 'core_gene_hits', 'synteny_score', 'core_bonus', 'similarity')})
+
+    df_clusterblast = pd.concat([pd.DataFrame(data_annotation), pd.DataFrame(data_metrics)], axis=1)
+    df_clusterblast['sequence'] = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['general']['record_id']
+    return df_clusterblast
+
+ORIGINAL_EXTRACTORS = [original_region_summary, original_query_to_reference_match, original_similarity_score_w_annotation,
+                       original_blast_scores, original_mibig_entries, original_cluster_blast_result]
+
+# Current extractors, one walk of the record per table but rows buffered in each builder
+BUFFERED_EXTRACTORS = [get_region_summary, get_query_to_reference_match, get_similarity_score_w_annotation,
+                       get_blast_scores, get_mibig_entries, get_cluster_blast_result]
+
+def parse_per_record(path: str, extractors: list = ORIGINAL_EXTRACTORS) -> tuple:
+    """
+    Build the tables with one call of each extractor per record, one DataFrame per record and table,
+    concatenated at the end.
+    """
+    tables = [[] for _ in extractors]
+    for elt in sorted(os.listdir(path)):
+        with open(os.path.join(path, elt), 'r') as f:
+            json_file = json.load(f)
+        for idx in get_index(json_file):
+            for table, extractor in zip(tables, extractors):
+                table.append(extractor(json_file, idx))
+    return tuple(pd.concat(table, ignore_index=True) if table else pd.DataFrame() for table in tables)
+
+def timeit(function, *args, repeat: int = 3) -> float:
+    """Best wall time of `repeat` calls, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # Progress messages are not part of the measure
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the original per-hit DataFrame extractors with buffered rows in parse_json on a synthetic batch.")
+    parser.add_argument('--mags', type=int, default=50, help='Number of JSON files (default: 50)')
+    parser.add_argument('--records', type=int, default=20, help='Number of records per JSON file (default: 20)')
+    parser.add_argument('--hits', type=int, default=10, help='Maximum number of hits per region (default: 10)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported (default: 3)')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        write_batch(path, n_mags=args.mags, n_records=args.records, n_hits=args.hits)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = sum(len(df) for df in parse_json(path))
+
+        original = timeit(parse_per_record, path, ORIGINAL_EXTRACTORS, repeat=args.repeat)
+        six_passes = timeit(parse_per_record, path, BUFFERED_EXTRACTORS, repeat=args.repeat)
+        buffered = timeit(parse_json, path, repeat=args.repeat)
+
+    print(f"{args.mags} files, {rows} rows")
+    print(f"original extractors, DataFrames per hit/contig/record: {original:.2f} s")
+    print(f"six passes, buffered rows, one DataFrame per record:    {six_passes:.2f} s ({original / six_passes:.1f}x)")
+    print(f"parse_json, one pass, one DataFrame per table:          {buffered:.2f} s ({original / buffered:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+from functions import *
+from synthetic_antismash import write_batch
+
+# Scales of the synthetic batch: write_batch arguments
+SCALES = {
+    "small": {"n_mags": 10, "n_records": 20, "n_regions": 2, "n_hits": 5},
+    "medium": {"n_mags": 20, "n_records": 20, "n_regions": 3, "n_hits": 10},
+    "large": {"n_mags": 50, "n_records": 40, "n_regions": 4, "n_hits": 25}
+}
+
+EXTRACTORS = {
+    "get_region_summary": get_region_summary,
+    "get_query_to_reference_match": get_query_to_reference_match,
+    "get_similarity_score_w_annotation": get_similarity_score_w_annotation,
+    "get_blast_scores": get_blast_scores,
+    "get_mibig_entries": get_mibig_entries,
+    "get_cluster_blast_result": get_cluster_blast_result
+}
+
+def measure(function, *args, repeat: int = 3) -> dict:
+    """
+    Best wall time of `repeat` calls and peak memory allocated by one call (tracemalloc).
+
+    Returns
+    -------
+    result : dict
+        {"time_s": float, "peak_mb": float}
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        # Progress messages are not part of the measure
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        times.append(time.perf_counter() - start)
+
+    # Memory is measured on a separate call, as tracing slows the calls down
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"time_s": min(times), "peak_mb": peak / 2**20}
+
+def load_files(path: str) -> list:
+    files = []
+    for elt in sorted(os.listdir(path)):
+        with open(os.path.join(path, elt), 'r') as f:
+            files.append(json.load(f))
+    return files
+
+def run_extractor(extractor, files: list) -> None:
+    for json_file in files:
+        for idx in get_index(json_file):
+            extractor(json_file, idx)
+
+def run_suite(path: str, repeat: int = 3, workers: int = 2) -> dict:
+    """
+    Time and profile the JSON decoding, each extractor on all records, and parse_json end to end.
+
+    Parameters
+    ----------
+    path : str
+        Directory of JSON files.
+    repeat : int
+        Number of timed runs of each step, the best one is kept.
+    workers : int
+        Number of processes of the parallel parse_json step (its peak memory is the one of the main process).
+
+    Returns
+    -------
+    results : dict
+        {step: {"time_s": float, "peak_mb": float}}
+    """
+
+    results = {"json.load": measure(load_files, path, repeat=repeat)}
+    files = load_files(path)
+    for name, extractor in EXTRACTORS.items():
+        results[name] = measure(run_extractor, extractor, files, repeat=repeat)
+    del files
+
+    results["parse_json"] = measure(parse_json, path, repeat=repeat)
+    results["parse_json stream"] = measure(lambda: parse_json(path, stream=True), repeat=repeat)
+    if workers > 1:
+        results[f"parse_json workers={workers}"] = measure(lambda: parse_json(path, workers=workers), repeat=repeat)
+    return results
+
+# Differences below these are measurement noise, whatever the tolerance
+_MIN_TIME_S = 0.01
+_MIN_MEMORY_MB = 1.0
+
+def compare(results: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list:
+    """
+    Steps slower or using more memory than the baseline beyond the tolerances (fractions, e.g. 0.2 for +20%).
+
+    Returns
+    -------
+    regressions : list of str
+    """
+    regressions = []
+    for step, result in results.items():
+        reference = baseline.get(step)
+        if reference is None:
+            continue
+        if result["time_s"] > max(reference["time_s"] * (1 + time_tolerance), reference["time_s"] + _MIN_TIME_S):
+            regressions.append(f"{step}: time {reference['time_s']:.3f} s -> {result['time_s']:.3f} s")
+        if result["peak_mb"] > max(reference["peak_mb"] * (1 + memory_tolerance), reference["peak_mb"] + _MIN_MEMORY_MB):
+            regressions.append(f"{step}: peak memory {reference['peak_mb']:.1f} MB -> {result['peak_mb']:.1f} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extractors and parse_json of functions.py on a synthetic antiSMASH batch.")
+    parser.add_argument('--scale', choices=list(SCALES), default='medium', help='Size of the synthetic batch (default: medium)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each step, the best one is kept (default: 3)')
+    parser.add_argument('--workers', type=int, default=2, help='Number of processes of the parallel parse_json step, 1 to skip it (default: 2)')
+    parser.add_argument('--baseline', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"),
+                        help='Baseline file (default: benchmark_baseline.json next to this script)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the baseline of this scale')
+    parser.add_argument('--time-tolerance', type=float, default=0.2, help='Allowed slowdown before a regression is reported (default: 0.2)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1, help='Allowed memory increase before a regression is reported (default: 0.1)')
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        write_batch(path, **SCALES[args.scale])
+        results = run_suite(path, repeat=args.repeat, workers=args.workers)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+    baseline = baselines.get(args.scale, {})
+
+    print(f"{'step':36s} {'time (s)':>10s} {'peak (MB)':>10s} {'vs baseline':>12s}")
+    for step, result in results.items():
+        change = ""
+        if step in baseline:
+            change = f"{(result['time_s'] / baseline[step]['time_s'] - 1) * 100:+.0f}%"
+        print(f"{step:36s} {result['time_s']:10.3f} {result['peak_mb']:10.2f} {change:>12s}")
+
+    if args.save_baseline:
+        baselines[args.scale] = results
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    if not baseline:
+        print(f"No baseline for scale {args.scale}, save one with --save-baseline")
+
+if __name__ == "__main__":
+    main()
@@ -3,8 +3,18 @@
 #SBATCH --job-name=blast_ctg
 #SBATCH --output=/local/scratch/amaros/antismash/logs/%x_%A_%a.out
 #SBATCH --error=/local/scratch/amaros/antismash/logs/%x_%A_%a.err
-#SBATCH --mem=32GB
+#SBATCH --mem=8GB
+#SBATCH --cpus-per-task=4
+#SBATCH --array=0-31
 
+# One shard of the query per array task. A task that was killed can be run again alone
+# (sbatch --array=<id> blast_ctg.sh), finished shards are skipped, and the last task to
+# finish writes the merged output. On the first submission, the first task to start splits
+# the query (under a lock on shards.json.lock) and the other tasks wait for its shards.
 cd /local/scratch/amaros/antismash/02_pipeline/
 
-/usr/local/packages/python-3.11/bin/python3 05_blast_ctg.py
+/usr/local/packages/python-3.11/bin/python3 05_blast_ctg.py \
+    /local/scratch/mfrance/VIRGO2/12_package/VIRGO2.fa \
+    /local/scratch/amaros/antismash/05_blast_DB/antismash_blast_db_nucl/antimsash_make_db_nucl \
+    /local/scratch/amaros/antismash/03_results/VIRGO2_vs_antismash_DB_nucl.txt \
+    --shards 32 --threads ${SLURM_CPUS_PER_TASK:-4} --shard ${SLURM_ARRAY_TASK_ID}
@@ -0,0 +1,281 @@
+import os
+import pandas as pd
+
+# Columns of the BLAST tabular output (-outfmt 6) and their types
+OUTFMT6_COLUMNS = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+                   "qstart", "qend", "sstart", "send", "evalue", "bitscore"]
+OUTFMT6_DTYPES = {
+    "qseqid": str, "sseqid": str, "pident": "float32", "length": "int32", "mismatch": "int32", "gapopen": "int32",
+    "qstart": "int64", "qend": "int64", "sstart": "int64", "send": "int64", "evalue": "float64", "bitscore": "float32"
+}
+
+# Fields of the gene headers written by 04_get_ctg_sequences.py: sequence/ctg/Start/End/Strand
+GENE_HEADER_COLUMNS = ["sequence", "ctg", "Start", "End", "Strand"]
+
+def split_gene_headers(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Replace a column of gene headers (sequence/ctg/Start/End/Strand) by one column per field.
+
+    The gene_coverage column is added, the percentage of the gene covered by the alignment.
+
+    Parameters
+    ----------
+    df : DataFrame
+        BLAST hits.
+    column : str
+        'sseqid' if the antiSMASH genes are the database, 'qseqid' if they are the query.
+
+    Returns
+    -------
+    df : DataFrame
+    """
+
+    # A gene is hit by many queries, so each distinct header is split once
+    codes, headers = pd.factorize(df[column])
+    split = [header.rsplit("/", 4) for header in headers]
+    if split and min(map(len, split)) != len(GENE_HEADER_COLUMNS):
+        raise ValueError(f"Column {column} does not hold sequence/ctg/Start/End/Strand gene headers")
+    fields = (pd.DataFrame(split, columns=GENE_HEADER_COLUMNS)
+                .astype({"Start": "int64", "End": "int64"})
+                .take(codes)
+                .set_axis(df.index))
+
+    position = df.columns.get_loc(column)
+    df = pd.concat([df.iloc[:, :position], fields, df.iloc[:, position + 1:]], axis=1)
+    df["gene_coverage"] = (df["length"] / (df["End"] - df["Start"] + 1) * 100).astype("float32")
+    return df
+
+def read_blast_chunks(path: str, chunksize: int = 1_000_000, max_evalue: float = None, min_pident: float = None,
+                      min_coverage: float = None, header_col: str = "sseqid", query_lengths: dict = None,
+                      min_query_coverage: float = None):
+    """
+    Read a BLAST tabular output (-outfmt 6) by chunks of typed columns, keeping only the hits that pass the filters.
+
+    Parameters
+    ----------
+    path : str
+        BLAST output, e.g. the output of 05_blast_ctg.py.
+    chunksize : int
+        Number of lines read at once.
+    max_evalue : float, optional
+        Keep hits with evalue <= max_evalue.
+    min_pident : float, optional
+        Keep hits with pident >= min_pident.
+    min_coverage : float, optional
+        Keep hits covering at least this percentage of the antiSMASH gene. Requires header_col.
+    header_col : str or None
+        Column with the gene headers of 04_get_ctg_sequences.py, split by split_gene_headers.
+        None to keep both ids as they are.
+    query_lengths : dict, optional
+        Length of each query sequence, e.g. from fasta_index.load_fai. Adds the query_coverage column.
+    min_query_coverage : float, optional
+        Keep hits covering at least this percentage of the query. Requires query_lengths.
+
+    Yields
+    ------
+    df : DataFrame
+        Hits of one chunk, in file order.
+    """
+
+    if min_coverage is not None and header_col is None:
+        raise ValueError("min_coverage requires the gene headers (header_col)")
+    if min_query_coverage is not None and query_lengths is None:
+        raise ValueError("min_query_coverage requires query_lengths")
+
+    reader = pd.read_csv(path, sep="\t", header=None, names=OUTFMT6_COLUMNS, dtype=OUTFMT6_DTYPES,
+                         chunksize=chunksize, comment="#")
+    for chunk in reader:
+        keep = pd.Series(True, index=chunk.index)
+        if max_evalue is not None:
+            keep &= chunk["evalue"] <= max_evalue
+        if min_pident is not None:
+            keep &= chunk["pident"] >= min_pident
+        chunk = chunk[keep] if not keep.all() else chunk
+
+        if query_lengths is not None:
+            query_length = chunk["qseqid"].map(query_lengths)
+            chunk = chunk.assign(query_coverage=((chunk["qend"] - chunk["qstart"]).abs() + 1) / query_length * 100)
+            if min_query_coverage is not None:
+                chunk = chunk[chunk["query_coverage"] >= min_query_coverage]
+
+        if chunk.empty:
+            continue
+
+        if header_col is not None:
+            chunk = split_gene_headers(chunk, header_col)
+            if min_coverage is not None:
+                chunk = chunk[chunk["gene_coverage"] >= min_coverage]
+
+        if not chunk.empty:
+            yield chunk.reset_index(drop=True)
+
+def _top_k(df: pd.DataFrame, key: str, k: int) -> pd.DataFrame:
+    """Best k hits (highest bitscore, then lowest evalue) of each query, queries in order of first appearance."""
+    run = df[key].ne(df[key].shift()).cumsum()
+    order = (df.assign(_run=run)
+               .sort_values(["_run", "bitscore", "evalue"], ascending=[True, False, True], kind="stable"))
+    return order.groupby("_run", sort=False).head(k).drop(columns="_run")
+
+def reduce_top_k(chunks, k: int = 1, key: str = "qseqid"):
+    """
+    Keep the best k hits of each query from a stream of chunks of hits.
+
+    BLAST writes the hits of each query together, so the hits of a query are reduced as soon as
+    the next query starts, and only the hits of the last query of a chunk are carried to the next one.
+    Memory is bounded by the chunk size, plus the ids of the queries already reduced, used to check
+    that the hits of a query are not split in the file.
+
+    Parameters
+    ----------
+    chunks : iterable of DataFrames
+        Output of read_blast_chunks.
+    k : int or None
+        Number of hits kept per query. None keeps all hits.
+    key : str
+        Column identifying the query.
+
+    Yields
+    ------
+    df : DataFrame
+        Best hits of the queries completed by a chunk, in query order.
+    """
+
+    if k is None:
+        yield from chunks
+        return
+
+    carry = None
+    done = set()
+    for chunk in chunks:
+        df = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+        last = df[key].iloc[-1]
+        complete = df[key].ne(last).to_numpy()
+        queries = df.loc[complete, key]
+
+        # The hits of a query must be contiguous for the reduction to be exact
+        n_runs = int(queries.ne(queries.shift()).sum())
+        unique = queries.unique()
+        n_last = int((~complete).sum())
+        if (n_runs != len(unique) or complete[-n_last:].any() or last in done
+                or any(query in done for query in unique)):
+            raise ValueError("The hits of each query must be contiguous, as written by BLAST")
+        done.update(unique)
+
+        carry = _top_k(df[~complete], key, k)
+        if complete.any():
+            yield _top_k(df[complete], key, k).reset_index(drop=True)
+
+    if carry is not None:
+        yield carry.reset_index(drop=True)
+
+def write_chunks(chunks, output: str, fmt: str = "csv") -> int:
+    """
+    Write a stream of DataFrames with the same columns to one CSV or Parquet file.
+
+    Parameters
+    ----------
+    chunks : iterable of DataFrames
+    output : str
+        Output file, written to a temporary file first and renamed at the end.
+    fmt : str
+        'csv' or 'parquet' (zstd-compressed, one row group per chunk).
+
+    Returns
+    -------
+    n_rows : int
+    """
+
+    tmp_path = f"{output}.tmp"
+    n_rows = 0
+    if fmt == "csv":
+        with open(tmp_path, "w") as f:
+            for i, df in enumerate(chunks):
+                df.to_csv(f, header=i == 0, index=False)
+                n_rows += len(df)
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to write Parquet files (pip install pyarrow)")
+
+        writer = None
+        try:
+            for df in chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema, compression="zstd")
+                writer.write_table(table.cast(writer.schema))
+                n_rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(pa.table({column: pa.array([], type=pa.string()) for column in OUTFMT6_COLUMNS}), tmp_path)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    os.replace(tmp_path, output)
+    return n_rows
+
+def _filter_gene_coverage(chunks, header_col: str, min_coverage: float):
+    """Keep the hits covering at least min_coverage percent of the antiSMASH gene, without splitting the headers of the output."""
+    for chunk in chunks:
+        chunk = chunk[split_gene_headers(chunk, header_col)["gene_coverage"].to_numpy() >= min_coverage]
+        if not chunk.empty:
+            yield chunk.reset_index(drop=True)
+
+def iter_hits(path: str, top_k: int = 1, chunksize: int = 1_000_000, header_col: str = "sseqid",
+              min_coverage: float = None, **filters):
+    """
+    Stream the best hits of a BLAST tabular output: filters, then best hits of each query, then gene header columns.
+
+    The gene headers are only split after the reduction to the best hits, so that the query id
+    (qseqid) is still there to group the hits, even when it holds the gene headers. min_coverage
+    is applied before the reduction, from the gene coordinates of the headers.
+
+    Parameters
+    ----------
+    path : str
+        BLAST output (-outfmt 6).
+    top_k : int or None
+        Number of hits kept per query, None for all hits.
+    chunksize : int
+        Number of lines read at once.
+    header_col, min_coverage, **filters
+        See read_blast_chunks (max_evalue, min_pident, query_lengths, min_query_coverage).
+
+    Yields
+    ------
+    df : DataFrame
+    """
+
+    if min_coverage is not None and header_col is None:
+        raise ValueError("min_coverage requires the gene headers (header_col)")
+    chunks = read_blast_chunks(path, chunksize=chunksize, header_col=None, **filters)
+    if min_coverage is not None:
+        chunks = _filter_gene_coverage(chunks, header_col, min_coverage)
+    for chunk in reduce_top_k(chunks, k=top_k):
+        yield chunk if header_col is None else split_gene_headers(chunk, header_col)
+
+def load_blast(path: str, top_k: int = 1, chunksize: int = 1_000_000, **filters) -> pd.DataFrame:
+    """
+    Load the best hits of a BLAST tabular output in memory.
+
+    Parameters
+    ----------
+    path : str
+        BLAST output (-outfmt 6).
+    top_k : int or None
+        Number of hits kept per query, None for all hits.
+    chunksize : int
+        Number of lines read at once.
+    **filters
+        Passed to iter_hits (header_col, max_evalue, min_pident, min_coverage, query_lengths, min_query_coverage).
+
+    Returns
+    -------
+    df : DataFrame
+    """
+    chunks = list(iter_hits(path, top_k=top_k, chunksize=chunksize, **filters))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=OUTFMT6_COLUMNS)
@@ -0,0 +1,287 @@
+import os
+import mmap
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# One line of a samtools .fai index
+FaiEntry = namedtuple("FaiEntry", ["name", "length", "offset", "line_bases", "line_width"])
+
+# Complement of IUPAC nucleotide codes, lower and upper case
+_COMPLEMENT = bytes.maketrans(b"ACGTURYKMBVDHNSWacgturykmbvdhnsw", b"TGCAAYRMKVBHDNSWtgcaayrmkvbhdnsw")
+_COMPLEMENT_TABLE = np.frombuffer(_COMPLEMENT, dtype=np.uint8)
+
+def build_fai(fasta_path: str) -> list:
+    """
+    Index a FASTA file the way `samtools faidx` does.
+
+    Parameters
+    ----------
+    fasta_path : str
+        Path to the FASTA file. All sequence lines of a record, except the last one,
+        must have the same length. Blank lines are only allowed at the end of a record.
+
+    Returns
+    -------
+    entries : list of FaiEntry
+        One entry per record, in file order.
+    """
+
+    entries = []
+    name = None
+
+    def add_entry():
+        entries.append(FaiEntry(name, length, offset, line_bases, line_width))
+
+    with open(fasta_path, "rb") as f:
+        position = 0
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    add_entry()
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ""
+                offset = position + len(line)
+                length = line_bases = line_width = 0
+                last_line = blank_line = False
+            elif name is not None and not line.strip():
+                blank_line = True
+            elif name is not None:
+                if blank_line:
+                    raise ValueError(f"Blank line inside sequence {name} of {fasta_path}")
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases == 0:
+                    line_bases, line_width = bases, len(line)
+                elif last_line or bases > line_bases:
+                    raise ValueError(f"Different line length in sequence {name} of {fasta_path}")
+                # Only the last line of a record may be shorter
+                last_line = bases < line_bases
+                length += bases
+            position += len(line)
+        if name is not None:
+            add_entry()
+
+    return entries
+
+def write_fai(entries: list, fai_path: str) -> None:
+    with open(fai_path, "w") as f:
+        for entry in entries:
+            f.write("\t".join(str(value) for value in entry) + "\n")
+
+def read_fai(fai_path: str) -> list:
+    with open(fai_path, "r") as f:
+        return [FaiEntry(name, int(length), int(offset), int(line_bases), int(line_width))
+                for name, length, offset, line_bases, line_width in (line.rstrip("\n").split("\t")[:5] for line in f)]
+
+def load_fai(fasta_path: str, index_dir: str = None) -> list:
+    """
+    Load the .fai index of a FASTA file, building and saving it if it is missing or older than the FASTA.
+
+    Parameters
+    ----------
+    fasta_path : str
+        Path to the FASTA file.
+    index_dir : str, optional
+        Directory of the index. By default the index is saved next to the FASTA file ({fasta_path}.fai).
+        If the index cannot be written, it is only kept in memory.
+
+    Returns
+    -------
+    entries : list of FaiEntry
+    """
+
+    fai_path = f"{fasta_path}.fai" if index_dir is None else os.path.join(index_dir, f"{os.path.basename(fasta_path)}.fai")
+    if os.path.exists(fai_path) and os.path.getmtime(fai_path) >= os.path.getmtime(fasta_path):
+        return read_fai(fai_path)
+
+    entries = build_fai(fasta_path)
+    try:
+        write_fai(entries, fai_path)
+    except OSError as e:
+        print(f"Could not save index {fai_path}: {e}")
+    return entries
+
+def reverse_complement(sequence: str) -> str:
+    return sequence.encode().translate(_COMPLEMENT)[::-1].decode()
+
+class MappedFasta:
+    """
+    Random access to the sequences of a memory-mapped FASTA file through its .fai index.
+
+    Subsequences are located from the line length of their record, so nothing is parsed,
+    and batches of intervals are copied and reverse complemented in bulk with NumPy.
+
+    Parameters
+    ----------
+    fasta_path : str
+        Path to the FASTA file.
+    index_dir : str, optional
+        Directory of the index, see load_fai.
+    """
+
+    def __init__(self, fasta_path: str, index_dir: str = None):
+        self.fasta_path = fasta_path
+        self.entries = load_fai(fasta_path, index_dir)
+        self.by_name = {entry.name: entry for entry in self.entries}
+        self.file = open(fasta_path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(fasta_path) else b""
+        self.data = np.frombuffer(self.map, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The array is a view of the map and must be released first
+        self.data = None
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def _entry(self, contig) -> FaiEntry:
+        return contig if isinstance(contig, FaiEntry) else self.by_name[contig]
+
+    def _span(self, entry: FaiEntry, start: int, end: int) -> tuple:
+        """
+        Byte span and number of bases of the 1-based, inclusive coordinates of a record,
+        clipped as with slicing.
+        """
+        start = min(max(start - 1, 0), entry.length)
+        end = min(max(end, start), entry.length)
+        if end == start or entry.line_bases == 0:
+            return entry.offset, entry.offset, 0
+
+        def offset(position):
+            return entry.offset + (position // entry.line_bases) * entry.line_width + position % entry.line_bases
+
+        return offset(start), offset(end), end - start
+
+    def slices(self, intervals) -> list:
+        """
+        Raw bytes of each interval, as views of the map without any copy.
+
+        The views still contain the line breaks of the file, and must be released before close().
+
+        Parameters
+        ----------
+        intervals : iterable of (contig, start, end) or (contig, start, end, strand)
+            contig is a record name or a FaiEntry, start and end are 1-based and inclusive.
+
+        Returns
+        -------
+        slices : list of memoryview
+        """
+        view = memoryview(self.map)
+        return [view[begin:stop] for begin, stop, _ in (self._span(self._entry(contig), start, end)
+                                                        for contig, start, end, *_ in intervals)]
+
+    def fetch_batch(self, intervals) -> list:
+        """
+        Subsequences of a batch of intervals, like record.seq[start - 1:end].
+
+        Parameters
+        ----------
+        intervals : iterable of (contig, start, end, strand)
+            contig is a record name or a FaiEntry, start and end are 1-based and inclusive,
+            strand is '-' for the reverse complement.
+
+        Returns
+        -------
+        sequences : list of str
+            In the order of the intervals.
+        """
+
+        intervals = list(intervals)
+        if not intervals:
+            return []
+
+        spans = [self._span(self._entry(contig), start, end) for contig, start, end, _ in intervals]
+        ends = np.cumsum([n_bases for *_, n_bases in spans]).tolist()
+
+        # All intervals are copied once from the map, then the line breaks are dropped
+        with memoryview(self.map) as view:
+            raw = b"".join([view[begin:stop] for begin, stop, _ in spans]).replace(b"\n", b"").replace(b"\r", b"")
+        forward = raw.decode()
+
+        # The reverse complement of the whole batch is computed at once with the complement table,
+        # the interval [start, end) of the batch is then [total - end, total - start) of it
+        reverse = None
+        if any(strand == "-" for *_, strand in intervals):
+            reverse = _COMPLEMENT_TABLE[np.frombuffer(raw, dtype=np.uint8)[::-1]].tobytes().decode()
+
+        total = len(forward)
+        sequences = []
+        start = 0
+        for (*_, strand), end in zip(intervals, ends):
+            sequences.append(reverse[total - end:total - start] if strand == "-" else forward[start:end])
+            start = end
+        return sequences
+
+    def fetch(self, contig, start: int, end: int, strand: str = "+") -> str:
+        """Subsequence of one interval, see fetch_batch."""
+        return self.fetch_batch([(contig, start, end, strand)])[0]
+
+def coordinate_intervals(df: pd.DataFrame, contig_col: str = "sequence", coordinate_col: str = "coordinate",
+                         strand_col: str = None) -> list:
+    """
+    Intervals of a table with antiSMASH 'start-end' coordinates (0-based start), e.g. blast_score.
+
+    Parameters
+    ----------
+    df : DataFrame
+    contig_col : str
+        Column with the record name (the FASTA header of the contig).
+    coordinate_col : str
+        Column with the 'start-end' coordinates.
+    strand_col : str, optional
+        Column with the strand, all intervals are on the '+' strand if not given.
+
+    Returns
+    -------
+    intervals : list of (contig, start, end, strand)
+        1-based, inclusive coordinates, as expected by MappedFasta.fetch_batch.
+    """
+
+    coordinates = df[coordinate_col].astype(str).str.split("-", n=1, expand=True).astype("int64")
+    strands = df[strand_col] if strand_col is not None else ["+"] * len(df)
+    return list(zip(df[contig_col], (coordinates[0] + 1).tolist(), coordinates[1].tolist(), strands))
+
+def get_sequences(df: pd.DataFrame, fasta_dir: str, mag_col: str = "mag", index_dir: str = None, **kwargs) -> pd.Series:
+    """
+    Nucleotide sequence of each row of a table with antiSMASH coordinates, e.g. the regions of blast_score.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Table with a MAG column (parse_json(..., with_mag=True)) and the columns of coordinate_intervals.
+    fasta_dir : str
+        Directory containing one {mag}.fasta file per MAG.
+    mag_col : str
+        Column with the MAG name.
+    index_dir : str, optional
+        Directory of the .fai indexes, see load_fai.
+    **kwargs
+        Passed to coordinate_intervals (contig_col, coordinate_col, strand_col).
+
+    Returns
+    -------
+    sequences : Series
+        Aligned on the index of df.
+    """
+
+    sequences = pd.Series(index=df.index, dtype=object)
+    for mag, rows in df.groupby(mag_col, sort=False):
+        with MappedFasta(os.path.join(fasta_dir, f"{mag}.fasta"), index_dir) as fasta:
+            sequences[rows.index] = fasta.fetch_batch(coordinate_intervals(rows, **kwargs))
+    return sequences
+
+def write_fasta_record(f, header: str, sequence: str, width: int = 60) -> None:
+    """Write one record to an open FASTA file, with lines of `width` characters as Bio.SeqIO does."""
+    f.write(f">{header}\n")
+    for i in range(0, len(sequence), width):
+        f.write(sequence[i:i + width])
+        f.write("\n")
@@ -1,6 +1,14 @@
 import os
+import re
 import pandas as pd
 import json
+import hashlib
+import pickle
+import shutil
+import time
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
 
 def get_index(json_file: dict) -> list:
     """
@@ -26,6 +34,655 @@ def get_index(json_file: dict) -> list:
 
     return index
 
+# Strings (with escapes) and brackets are the only tokens needed to follow the nesting of a JSON document.
+# The closing quote is optional so that a string cut at the end of the buffer can be detected.
+_JSON_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\]]')
+_KEY_END = re.compile(r'\s*(:)?')
+_CHUNK_SIZE = 1 << 20
+
+# Permissions of the files written by _write_atomic, as with open() (mkstemp creates them 0600)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def scan_records(f):
+    """
+    Scan the 'records' array of an antiSMASH JSON file one record at a time, without decoding the file.
+
+    The file is read in chunks and only the text of the current record is kept in memory.
+    While scanning, the number of subkeys of the record 'modules' is counted, so that callers
+    can discard records that get_index would reject before decoding them.
+
+    Parameters
+    ----------
+    f : file object
+        antiSMASH JSON file opened in text mode.
+
+    Yields
+    ------
+    idx : int
+        Index of the record in the JSON file.
+    text : str
+        Raw JSON text of the record.
+    n_modules : int
+        Number of subkeys in the record 'modules'.
+    """
+
+    buf = ""
+    pos = 0
+    eof = False
+    depth = 0
+    records_key = False     # last top-level key read was 'records'
+    in_records = False      # inside the top-level 'records' array
+    record_start = None     # position of the current record in buf
+    modules_key = False     # last record key read was 'modules'
+    modules_depth = None    # depth of the 'modules' object of the current record
+    n_modules = 0
+    idx = 0
+
+    def read_more():
+        nonlocal buf, pos, record_start, eof
+        # Drop what was already scanned, except the current record
+        keep = pos if record_start is None else record_start
+        pos -= keep
+        if record_start is not None:
+            record_start -= keep
+        # Read at least as much as kept so that growing a large record stays linear
+        chunk = f.read(max(_CHUNK_SIZE, len(buf) - keep))
+        eof = chunk == ""
+        buf = buf[keep:] + chunk
+
+    while True:
+        match = _JSON_TOKEN.search(buf, pos)
+        if match is None or (match.group(0)[0] == '"' and match.group(1) is None):
+            if eof:
+                if match is not None:
+                    raise ValueError("Unterminated string in JSON file")
+                raise ValueError("Unexpected end of JSON file")
+            read_more()
+            continue
+
+        token = match.group(0)
+
+        if token[0] == '"':
+            # Only strings at the depths of interest need to be checked for being keys
+            if not (depth == 1 or (record_start is not None and
+                                   (depth == 3 or (modules_depth is not None and depth == modules_depth + 1)))):
+                pos = match.end()
+                continue
+            colon = _KEY_END.match(buf, match.end())
+            if colon.end() == len(buf) and not eof:
+                read_more()
+                continue
+            pos = colon.end()
+            if colon.group(1) is None:
+                continue
+            if depth == 1:
+                records_key = token == '"records"'
+            elif depth == 3:
+                modules_key = token == '"modules"'
+            else:
+                n_modules += 1
+
+        elif token in "{[":
+            pos = match.end()
+            if depth == 1 and token == "[" and records_key:
+                in_records = True
+            elif in_records and depth == 2 and token == "{":
+                record_start = match.start()
+                modules_key = False
+                n_modules = 0
+            elif record_start is not None and depth == 3 and token == "{" and modules_key:
+                modules_depth = depth
+            depth += 1
+
+        else:
+            pos = match.end()
+            depth -= 1
+            if record_start is not None and depth == modules_depth:
+                modules_depth = None
+                modules_key = False
+            elif record_start is not None and depth == 2:
+                yield idx, buf[record_start:pos], n_modules
+                idx += 1
+                record_start = None
+            elif in_records and depth == 1:
+                # End of the records array: the rest of the file is not needed
+                return
+            elif depth == 0:
+                return
+
+def iter_records(file_path: str):
+    """
+    Stream the records of an antiSMASH JSON file that would be kept by get_index.
+
+    Records with 2 'modules' subkeys or less are skipped without being decoded,
+    so that peak memory is about the size of one record instead of the whole file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the antiSMASH JSON file.
+
+    Yields
+    ------
+    idx : int
+        Index of the record in the JSON file.
+    record : dict
+        Decoded record.
+    """
+
+    with open(file_path, 'r') as f:
+        for idx, text, n_modules in scan_records(f):
+            if n_modules > 2:
+                yield idx, json.loads(text)
+
+def has_relevant_record(file_path: str) -> bool:
+    """
+    Check if an antiSMASH JSON file has at least one record that get_index would keep.
+
+    The file is scanned with scan_records without being decoded, and the scan stops at the first
+    record with more than 2 'modules' subkeys.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the antiSMASH JSON file.
+
+    Returns
+    -------
+    bool
+    """
+
+    with open(file_path, 'r') as f:
+        return any(n_modules > 2 for _, _, n_modules in scan_records(f))
+
+_CLUSTERBLAST = "antismash.modules.clusterblast"
+_CLUSTER_COMPARE = "antismash.modules.cluster_compare"
+
+# Value of the cells of a column missing from a row, as in DataFrames built from lists of dicts
+_MISSING = float("nan")
+
+class ColumnBuffer:
+    """
+    Rows of a table stored as one list per column, turned into a DataFrame only once with to_frame.
+
+    Columns are kept in order of first appearance and cells of columns missing from a row are NaN,
+    as with pd.DataFrame(list_of_dicts) or pd.concat of DataFrames.
+    """
+
+    def __init__(self, columns: list = ()):
+        self.columns = {column: [] for column in columns}
+        self.n_rows = 0
+
+    def _pad(self):
+        for values in self.columns.values():
+            if len(values) < self.n_rows:
+                values.extend([_MISSING] * (self.n_rows - len(values)))
+
+    def append(self, row: dict) -> None:
+        """Append a row given as a {column: value} dictionary."""
+        columns = self.columns
+        for column, value in row.items():
+            values = columns.get(column)
+            if values is None:
+                values = columns[column] = [_MISSING] * self.n_rows
+            values.append(value)
+        self.n_rows += 1
+        if len(row) != len(columns):
+            self._pad()
+
+    def extend(self, other: "ColumnBuffer") -> None:
+        """Append all rows of another buffer."""
+        for column, values in other.columns.items():
+            if column not in self.columns:
+                self.columns[column] = [_MISSING] * self.n_rows
+            self.columns[column].extend(values)
+        self.n_rows += other.n_rows
+        self._pad()
+
+    def assign(self, column: str, value) -> None:
+        """Set a column to a constant value."""
+        self.columns[column] = [value] * self.n_rows
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columns) if self.columns else pd.DataFrame()
+
+class TableBuilder:
+    """
+    Base class of the tables built from antiSMASH records by visit_record.
+
+    visit_record walks each record once and calls the methods below for the parts of the record
+    it visits. A table only overrides the methods it needs and appends its rows to `rows`.
+    Builders of different files are combined with merge, and the table is built once with to_frame.
+    New tables are added with the register_table decorator.
+
+    Attributes
+    ----------
+    name : str
+        Table name, used for the output file names.
+    columns : list of str
+        Columns known in advance, so that the table has them even without rows.
+    rows : ColumnBuffer
+        Rows of all visited records.
+    record : dict
+        Record being visited.
+    idx : int
+        Index of the record in the JSON file.
+    """
+
+    name = None
+    columns = ()
+
+    def __init__(self):
+        self.rows = ColumnBuffer(self.columns)
+
+    def start_record(self, record: dict, idx: int) -> None:
+        self.record = record
+        self.idx = idx
+
+    def missing(self, section: str, error: KeyError) -> None:
+        """Called when a section ('areas', 'general', 'knowncluster', 'mibig_entries' or 'cluster_compare') is not in the record."""
+
+    def area(self, region_idx: int, area: dict) -> None:
+        """Called for each element of record['areas'], region_idx starting at 0."""
+
+    def general_hit(self, region_idx: int, reference: dict, score: dict) -> None:
+        """Called for each ClusterBlast hit ([reference, score] pair of the 'ranking' list), region_idx starting at 0."""
+
+    def knowncluster_hit(self, region_idx: int, reference: dict, score: dict) -> None:
+        """Called for each KnownClusterBlast hit ([reference, score] pair of the 'ranking' list), region_idx starting at 0."""
+
+    def mibig_entries(self, region: str, ctg_name: str, entries: list) -> None:
+        """Called for each gene of the KnownClusterBlast 'mibig_entries', region as a string starting at '1'."""
+
+    def cluster_compare(self, region: str, analysis: str, result: dict) -> None:
+        """Called for each analysis of the MIBiG cluster_compare results, region as a string starting at '1'."""
+
+    def end_record(self) -> None:
+        """Called once the record is visited."""
+
+    def merge(self, other: "TableBuilder") -> None:
+        """Append the rows of a builder of the same table, e.g. built from another file."""
+        self.rows.extend(other.rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Build the table from the rows of all visited records."""
+        return self.rows.to_frame()
+
+    def __getstate__(self):
+        # Builders are sent back from the worker processes and saved in partitions, without the last record
+        state = self.__dict__.copy()
+        state.pop("record", None)
+        return state
+
+# Tables built by parse_json, in output order
+TABLE_BUILDERS = []
+
+def register_table(builder: type) -> type:
+    """Class decorator adding a TableBuilder to the tables built by parse_json."""
+    if builder.name in table_names():
+        raise ValueError(f"A table named {builder.name} is already registered")
+    TABLE_BUILDERS.append(builder)
+    return builder
+
+def table_names() -> list:
+    """Names of the tables built by parse_json, in output order."""
+    return [builder.name for builder in TABLE_BUILDERS]
+
+def _handlers(builders: list, method: str) -> list:
+    """Bound methods of the builders overriding `method`, so that no-op calls are skipped."""
+    return [getattr(builder, method) for builder in builders
+            if getattr(type(builder), method) is not getattr(TableBuilder, method)]
+
+def _timed(method, timings: dict):
+    """Wrap a bound method of a builder to add its run time to timings[builder.name]."""
+    name = method.__self__.name
+
+    def timed(*args):
+        start = time.perf_counter()
+        method(*args)
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    return timed
+
+def visit_record(record: dict, idx: int, builders: list, timings: dict = None) -> list:
+    """
+    Walk an antiSMASH record once and feed all table builders.
+
+    The 'areas', the clusterblast 'general' and 'knowncluster' results and the MIBiG
+    cluster_compare results of the record are each visited once, whatever the number of builders.
+
+    Parameters
+    ----------
+    record : dict
+        Record of an antiSMASH JSON file.
+    idx : int
+        Index of the record in the JSON file.
+    builders : list of TableBuilder
+        The rows of the record are appended to the builders.
+    timings : dict, optional
+        If given, the time spent in the methods of each builder is added to timings[builder.name], in seconds.
+    """
+
+    def handlers_of(method, overridden_only=True):
+        methods = _handlers(builders, method) if overridden_only else [getattr(builder, method) for builder in builders]
+        return methods if timings is None else [_timed(handler, timings) for handler in methods]
+
+    for handler in handlers_of("start_record", overridden_only=False):
+        handler(record, idx)
+
+    def section(name, keys):
+        data = record
+        try:
+            for key in keys:
+                data = data[key]
+        except KeyError as e:
+            for builder in builders:
+                builder.missing(name, e)
+            return None
+        return data
+
+    handlers = handlers_of("area")
+    if handlers:
+        areas = section("areas", ["areas"])
+        for region_idx, area in enumerate(areas or []):
+            for handler in handlers:
+                handler(region_idx, area)
+
+    handlers = handlers_of("general_hit")
+    if handlers:
+        general = section("general", ["modules", _CLUSTERBLAST, "general", "results"])
+        for region_idx, result in enumerate(general or []):
+            for hit in result["ranking"]:
+                for handler in handlers:
+                    handler(region_idx, hit[0], hit[1])
+
+    hit_handlers = handlers_of("knowncluster_hit")
+    mibig_handlers = handlers_of("mibig_entries")
+    if hit_handlers or mibig_handlers:
+        knowncluster = section("knowncluster", ["modules", _CLUSTERBLAST, "knowncluster"])
+        if knowncluster is not None:
+            for region_idx, result in enumerate(knowncluster.get("results", [])):
+                for hit in result["ranking"]:
+                    for handler in hit_handlers:
+                        handler(region_idx, hit[0], hit[1])
+
+            if "mibig_entries" in knowncluster:
+                for region, mibig_entries in knowncluster["mibig_entries"].items():
+                    # 'mibig_entries' is a dictionary with ctg_# as keys
+                    for ctg_name, entries in mibig_entries.items():
+                        for handler in mibig_handlers:
+                            handler(region, ctg_name, entries)
+            else:
+                for builder in builders:
+                    builder.missing("mibig_entries", KeyError("mibig_entries"))
+
+    handlers = handlers_of("cluster_compare")
+    if handlers:
+        by_region = section("cluster_compare", ["modules", _CLUSTER_COMPARE, "db_results", "MIBiG", "by_region"])
+        for region, analyses in (by_region or {}).items():
+            for analysis, result in analyses.items():
+                for handler in handlers:
+                    handler(region, analysis, result)
+
+    for handler in handlers_of("end_record", overridden_only=False):
+        handler()
+
+@register_table
+class RegionSummary(TableBuilder):
+    """
+    Products of each region with its most similar known clusters ('Overview' of the HTML output).
+
+    One row per region and KnownClusterBlast hit of that region, keeping the top_k best hits
+    (all hits if top_k is None). Regions without hits have one row with empty hit columns.
+    """
+
+    name = "region_summary"
+    columns = ['sequence', 'region', 'type', 'most_similar_known_cluster', 'most_similar_known_cluster_type', 'similarity']
+
+    def __init__(self, top_k: int = 1):
+        super().__init__()
+        self.top_k = top_k
+
+    def start_record(self, record, idx):
+        super().start_record(record, idx)
+        self.products = []
+        # region_idx -> [(description, cluster_type, similarity)], ranked by antiSMASH
+        self.known_clusters = {}
+
+    def missing(self, section, error):
+        if section in ("areas", "knowncluster"):
+            raise error
+
+    def area(self, region_idx, area):
+        self.products.append(area['products'])
+
+    def knowncluster_hit(self, region_idx, reference, score):
+        hits = self.known_clusters.setdefault(region_idx, [])
+        if self.top_k is None or len(hits) < self.top_k:
+            hits.append((reference['description'], reference['cluster_type'], score['similarity']))
+
+    def end_record(self):
+        for region_idx, products in enumerate(self.products):
+            for cluster, cluster_type, similarity in self.known_clusters.get(region_idx) or [(_MISSING, _MISSING, _MISSING)]:
+                self.rows.append({
+                    'sequence': self.record['id'],
+                    'region': f"{self.idx+1}.{region_idx+1}",
+                    'type': products,
+                    'most_similar_known_cluster': cluster,
+                    'most_similar_known_cluster_type': cluster_type,
+                    'similarity': similarity
+                })
+
+@register_table
+class QueryToReference(TableBuilder):
+    """Matching between the query and the reference proteins ('MIBiG comparison' tab of the HTML output)."""
+
+    name = "query_to_reference"
+
+    def missing(self, section, error):
+        if section == "cluster_compare":
+            print(f"KeyError: {error}")
+
+    def cluster_compare(self, region, analysis, result):
+        if analysis != 'ProtoToRegion_RiQ':
+            return
+        for ctg_table in result['hits'].values():
+            # One row per protein, with one column per key of the inner dictionaries
+            keys = {}
+            for values in ctg_table.values():
+                keys.update(dict.fromkeys(values))
+            for protein, values in ctg_table.items():
+                row = {'protein': protein}
+                for key in keys:
+                    row[key] = values.get(key, _MISSING)
+                row['sequence'] = self.record['id']
+                self.rows.append(row)
+
+@register_table
+class SimilarityScore(TableBuilder):
+    """
+    Similarity scores of each cluster_compare analysis with the annotation of each reference.
+
+    One row per region and reference region, with one column per analysis. The annotations of the
+    references are kept once per accession for the whole run, as the same MIBiG references are
+    found in many records.
+    """
+
+    name = "similarity_score"
+
+    def __init__(self):
+        super().__init__()
+        # accession -> (type, compound, organism)
+        self.annotations = {}
+
+    def start_record(self, record, idx):
+        super().start_record(record, idx)
+        self.region = None
+        self.scores = {}
+
+    def missing(self, section, error):
+        if section == "cluster_compare":
+            print(f"KeyError: {error}")
+
+    def _add_region_rows(self):
+        for row in self.scores.values():
+            row['region'] = f"{self.idx+1}.{self.region}"
+            row['sequence'] = self.record['id']
+            self.rows.append(row)
+        self.scores = {}
+
+    def cluster_compare(self, region_idx, analysis, result):
+        if region_idx != self.region:
+            self._add_region_rows()
+            self.region = region_idx
+
+        # Scores of all analyses of the region, one row per reference region
+        for reference, score in result.get('scores_by_region', {}).items():
+            row = self.scores.get(reference)
+            if row is None:
+                row = self.scores[reference] = {'reference': reference}
+            row[analysis] = score
+
+        for hit in result.get('reference_regions', {}).values():
+            accession = hit.get('accession')
+            if accession not in self.annotations:
+                self.annotations[accession] = ('; '.join(hit.get('products')), hit.get('description'), hit.get('organism'))
+
+    def end_record(self):
+        self._add_region_rows()
+
+    def merge(self, other):
+        super().merge(other)
+        for accession, annotation in other.annotations.items():
+            self.annotations.setdefault(accession, annotation)
+
+    def to_frame(self):
+        df = self.rows.to_frame()
+        if df.empty:
+            return df
+
+        # References are given as 'accession: position'
+        reference = df['reference'].str.split(": ", n=1, expand=True)
+        df['reference'] = reference[0]
+        df['position'] = reference[1] if reference.shape[1] > 1 else None
+
+        # One column per analysis, in order of appearance
+        record_columns = ['position', 'region', 'sequence'] + (['mag'] if 'mag' in df.columns else [])
+        analyses = [column for column in df.columns if column != 'reference' and column not in record_columns]
+        df = df[['reference'] + analyses + record_columns]
+
+        annotations = pd.DataFrame.from_dict(self.annotations, orient='index', columns=['type', 'compound', 'organism'])
+        df = df.join(annotations, on='reference')
+        return df.drop_duplicates(ignore_index=True)
+
+@register_table
+class BlastScores(TableBuilder):
+    """BLAST scores of the ClusterBlast pairings."""
+
+    name = "blast_score"
+
+    def missing(self, section, error):
+        if section == "general":
+            raise error
+
+    def general_hit(self, region_idx, reference, score):
+        region = f"{self.idx+1}.{region_idx+1}"
+        for pairing in score['pairings']:
+            query = pairing[0].split("|")
+            blast_data = dict(pairing[2])
+            blast_data['coordinate'] = query[2]
+            blast_data['sequence'] = self.record['id']
+            blast_data['region'] = region
+            blast_data['ctg'] = query[4]
+            self.rows.append(blast_data)
+
+# Names of the fields of the 'mibig_entries' lists, the 4th one (region) is not kept
+_MIBIG_FIELDS = {
+    0: "mibig_protein",
+    1: "description",
+    2: "mibig_cluster",
+    4: "mibig_product",
+    5: "percentage_id",
+    6: "blast_score",
+    7: "percentage_coverage",
+    8: "evalue"
+}
+
+@register_table
+class MibigEntries(TableBuilder):
+    """MIBiG hits of each gene, as in the HTML pages of the knownclusterblast folder."""
+
+    name = "mibig_entries"
+
+    def missing(self, section, error):
+        if section == "knowncluster":
+            print(f"Error accessing modules or record: {error}")
+        elif section == "mibig_entries":
+            print(f"No 'mibig_entries' found for record {self.idx}")
+
+    def mibig_entries(self, region, ctg_name, entries):
+        region = f"{self.idx+1}.{int(region)}"
+        for entry in entries:
+            row = {_MIBIG_FIELDS.get(i, i): value for i, value in enumerate(entry) if i != 3}
+            row['sequence'] = self.record['id']
+            row['region'] = region
+            row['ctg'] = ctg_name
+            self.rows.append(row)
+
+@register_table
+class ClusterBlast(TableBuilder):
+    """Reference clusters and metrics of the ClusterBlast hits."""
+
+    name = "cluster_blast"
+    columns = ['accession', 'cluster_label', 'description', 'cluster_type', 'number_of_genes_in_ref',
+               'hits', 'core_gene_hits', 'synteny_score', 'core_bonus', 'similarity', 'sequence']
+
+    def missing(self, section, error):
+        if section == "general":
+            print(f"KeyError: {error}")
+
+    def general_hit(self, region_idx, reference, score):
+        self.rows.append({
+            'accession': reference.get('accession'),
+            'cluster_label': reference.get('cluster_label'),
+            'description': reference.get('description'),
+            'cluster_type': reference.get('cluster_type'),
+            'number_of_genes_in_ref': len(reference.get('proteins')),
+            'hits': score.get('hits'),
+            'core_gene_hits': score.get('core_gene_hits'),
+            'synteny_score': score.get('synteny_score'),
+            'core_bonus': score.get('core_bonus'),
+            'similarity': score.get('similarity'),
+            'sequence': self.record['modules'][_CLUSTERBLAST]['general']['record_id']
+        })
+
+@register_table
+class KnownCluster(TableBuilder):
+    """
+    All KnownClusterBlast hits of each region: MIBiG accession (BGC id), description, type and similarity.
+
+    Unlike cluster_blast, whose references are antiSMASH database records, the references are MIBiG
+    clusters, and unlike region_summary, all the hits ranked by antiSMASH are kept.
+    """
+
+    name = "known_cluster"
+    columns = ['sequence', 'region', 'accession', 'description', 'cluster_type', 'similarity']
+
+    def knowncluster_hit(self, region_idx, reference, score):
+        self.rows.append({
+            'sequence': self.record['id'],
+            'region': f"{self.idx+1}.{region_idx+1}",
+            'accession': reference.get('accession'),
+            'description': reference.get('description'),
+            'cluster_type': reference.get('cluster_type'),
+            'similarity': score.get('similarity')
+        })
+
+def _build_table(json_file: dict, idx: int, builder: TableBuilder) -> pd.DataFrame:
+    """Build one table from one record."""
+    visit_record(json_file["records"][idx], idx, [builder])
+    return builder.to_frame()
+
 def get_blast_scores(json_file, idx):
     """
     Get BLAST scores from antiSMASH.
@@ -42,24 +699,7 @@ def get_blast_scores(json_file, idx):
     df_blast : DataFrame
         DataFrame of results.
     """
-    list_blast = []
-
-    blast = json_file["records"][idx]["modules"]["antismash.modules.clusterblast"]["general"]["results"]
-    for region in range(len(blast)):
-        ranking = blast[region]['ranking']
-        for hit in range(len(ranking)):
-            blast_info = ranking[hit][1]['pairings']
-            for score in blast_info :
-                ctg_name = score[0].split("|")[4]
-                coordinate = score[0].split("|")[2]
-                blast_data = score[2]
-                blast_data['coordinate'] = coordinate
-                blast_data['sequence'] = json_file["records"][idx]['id']
-                blast_data['region'] = f"{idx+1}.{region+1}"
-                blast_data['ctg'] = ctg_name
-                list_blast.append(blast_data)
-    df = pd.DataFrame(list_blast)
-    return df
+    return _build_table(json_file, idx, BlastScores())
 
 def get_mibig_entries(json_file: dict, idx: int) -> pd.DataFrame:
     """
@@ -77,50 +717,7 @@ def get_mibig_entries(json_file: dict, idx: int) -> pd.DataFrame:
     pd.DataFrame
         DataFrame of MIBiG entries.
     """
-    
-    try:
-        # Access modules for the given index
-        modules = json_file["records"][idx]["modules"]["antismash.modules.clusterblast"]["knowncluster"]
-    except (KeyError, IndexError) as e:
-        print(f"Error accessing modules or record: {e}")
-        return pd.DataFrame()
-
-    df_mibig_list = []
-
-    # Check if 'mibig_entries' exists in the modules
-    if "mibig_entries" in modules:
-        for region in modules['mibig_entries'].keys():
-            mibig_entries = modules['mibig_entries'][region]  # 'mibig_entries' is a dictionary with ctg_# as keys
-            # Add mibig_entries for the current tag_id
-            for ctg_name in mibig_entries.keys():
-                df_tag_id = pd.DataFrame(mibig_entries[ctg_name])
-                df_tag_id = df_tag_id.drop(columns=[3],axis=1)
-                df_tag_id['sequence'] = json_file["records"][idx]['id']
-                df_tag_id['region'] = f"{idx+1}.{int(region)}"
-                df_tag_id['ctg'] = ctg_name
-                df_mibig_list.append(df_tag_id)
-    else:
-        print(f"No 'mibig_entries' found for record {idx}")
-        
-    # Concatenate all DataFrames for mibig entries
-    if df_mibig_list:
-            df_mibig = pd.concat(df_mibig_list, axis=0, ignore_index=True)
-            df_mibig = df_mibig.rename(columns={
-                    0: "mibig_protein",
-                    1: "description",
-                    2: "mibig_cluster",
-                    # 3: "region",
-                    4: "mibig_product",
-                    5: "percentage_id",
-                    6: "blast_score",
-                    7: "percentage_coverage",
-                    8: "evalue"
-                })
-            # df_mibig['sequence'] = json_file["records"][idx]['id']
-    else:
-            df_mibig = pd.DataFrame()
-
-    return df_mibig
+    return _build_table(json_file, idx, MibigEntries())
 
 def get_query_to_reference_match(json_file: dict, idx: int) -> pd.DataFrame:
     """
@@ -142,26 +739,7 @@ def get_query_to_reference_match(json_file: dict, idx: int) -> pd.DataFrame:
     df : DataFrame
         DataFrame of results.
     """
-
-    ctg = []
-
-    try:
-        results = json_file['records'][idx]['modules']['antismash.modules.cluster_compare']['db_results']['MIBiG']['by_region']
-    except KeyError as e:
-        print(f"KeyError: {e}")
-        return pd.DataFrame()
-    
-    for region in results.keys():
-        for bgc in results[region]['ProtoToRegion_RiQ']['hits'].keys():
-            ctg_table = results[region]['ProtoToRegion_RiQ']['hits'][bgc]
-            ctg_table_df = pd.DataFrame(ctg_table).transpose()
-            ctg_table_df['sequence'] = json_file['records'][idx]['id']
-            ctg.append(ctg_table_df)
-
-    df = pd.concat(ctg, axis=0).reset_index().rename(columns={"index":"protein"}) if ctg else pd.DataFrame()
-    return df
-
-
+    return _build_table(json_file, idx, QueryToReference())
 
 def get_similarity_score_w_annotation(json_file: dict, idx: int) -> pd.DataFrame:
     """
@@ -182,117 +760,177 @@ def get_similarity_score_w_annotation(json_file: dict, idx: int) -> pd.DataFrame
     df : DataFrame
         DataFrame of results.
     """
-    try:
-        results = json_file['records'][idx]['modules']['antismash.modules.cluster_compare']['db_results']['MIBiG']['by_region']
-    except KeyError as e:
-        print(f"KeyError: {e}")
-        return pd.DataFrame()
-
-    data_score = {}
-    data_annotation = []  # Initialize as an empty list
-
-    for region_idx in results.keys():
-        for analysis in results[region_idx].keys():
-            scores_by_region = results[region_idx][analysis].get('scores_by_region', {})
-            if scores_by_region:
-                data_score[analysis] = scores_by_region
-                similarity_score = pd.DataFrame(data_score).reset_index().rename(columns={"index": "reference"})
-                similarity_score['position'] = similarity_score['reference'].apply(lambda x: x.split(": ")[1])
-                similarity_score['reference'] = similarity_score['reference'].apply(lambda x: x.split(": ")[0])
-                similarity_score['region'] = f"{idx+1}.{region_idx}"
-                similarity_score['sequence'] = json_file['records'][idx]['id']
-            else:
-                similarity_score = None
-
-            reference_regions = results[region_idx][analysis].get('reference_regions', {})
-            if reference_regions:
-                for bgc in reference_regions.keys():
-                    hit = reference_regions[bgc]
-                    entry = {
-                        'reference': hit.get('accession'),
-                        'type': '; '.join(hit.get('products')),
-                        'compound': hit.get('description'),
-                        'organism': hit.get('organism')
-                    }
-                    data_annotation.append(entry)  # Append to the list only when valid data is found
-
-    if similarity_score is not None and data_annotation:
-        df = pd.merge(similarity_score, pd.DataFrame(data_annotation), on="reference", how="left")
-        df = df.drop_duplicates()
-    else:
-        df = pd.DataFrame()  # Return an empty DataFrame if there's no valid data
-
-    return df
-
+    return _build_table(json_file, idx, SimilarityScore())
 
 def get_region_summary(json_file: dict, idx: int) -> pd.DataFrame:
+    return _build_table(json_file, idx, RegionSummary())
 
-    rows = []
-    for i,j in enumerate(json_file['records'][idx]['areas']):
-            rows.append([json_file['records'][idx]['description'], f"{idx+1}.{i+1}",j['products']])
-    region_type = pd.DataFrame(rows, columns=['sequence', 'region','type'])
-
-    rows = []
-    if json_file['records'][idx]['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking'] != []:
+def get_cluster_blast_result(json_file: dict, idx: int) -> pd.DataFrame:
+    return _build_table(json_file, idx, ClusterBlast())
 
-            for hits_rank in range(len(json_file['records'][idx]['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking'])):
-                sequence = json_file['records'][idx]['id']
-                most_similar_known_cluster = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking'][hits_rank][0]['description']
-                most_similar_known_cluster_type = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking'][hits_rank][0]['cluster_type']
-                similarity = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['knowncluster']['results'][0]['ranking'][hits_rank][1]['similarity']
+def _new_builders(table_options: dict = None) -> list:
+    """One builder per registered table, with its options."""
+    table_options = table_options or {}
+    return [builder(**table_options.get(builder.name, {})) for builder in TABLE_BUILDERS]
 
-                rows.append([sequence,most_similar_known_cluster,most_similar_known_cluster_type,similarity])
+def parse_json_file(file_path: str, stream: bool = False, table_options: dict = None, stats: dict = None) -> tuple:
+    """
+    Build all registered tables from the records of one antiSMASH JSON file kept by get_index.
 
-    most_similar_known_cluster_df = pd.DataFrame(rows, columns=['sequence', 'most_similar_known_cluster', 'most_similar_known_cluster_type', 'similarity'])
+    Parameters
+    ----------
+    file_path : str
+        Path to the antiSMASH JSON file.
+    stream : bool
+        If True, records are read one at a time with iter_records instead of loading the whole file,
+        so that peak memory is about the size of one record.
+    table_options : dict, optional
+        Keyword arguments of the table builders, by table name, e.g. {"region_summary": {"top_k": 3}}.
+    stats : dict, optional
+        If given, filled with the file size, the number of records kept, the time spent decoding
+        (decode_s) and visiting (visit_s) the records, the time spent in each table builder
+        (extractors_s) and the number of rows of each table (rows).
 
-    region_summary = pd.merge(region_type, most_similar_known_cluster_df, on='sequence', how='left')
-    
-    return region_summary
+    Returns
+    -------
+    builders : tuple of TableBuilder
+        Builders of each table of TABLE_BUILDERS (region_summary, query_to_reference, similarity_score,
+        blast_score, mibig_entries, cluster_blast, known_cluster and registered plug-ins), holding the rows of the file.
+    """
 
+    builders = _new_builders(table_options)
+    start = time.perf_counter()
 
-def get_cluster_blast_result(json_file: dict, idx: int) -> pd.DataFrame:
+    if stream:
+        records = iter_records(file_path)
+    else:
+        with open(file_path, 'r') as f:
+            json_file = json.load(f)
+        # Get indices for records with desired key conditions
+        records = ((idx, json_file["records"][idx]) for idx in get_index(json_file))
+
+    if stats is None:
+        for idx, record in records:
+            visit_record(record, idx, builders)
+        return tuple(builders)
+
+    # Same loop, timing the decoding (next record) apart from the visit
+    timings = {builder.name: 0.0 for builder in builders}
+    decode_time = time.perf_counter() - start
+    visit_time = 0.0
+    n_records = 0
+    records = iter(records)
+    while True:
+        start = time.perf_counter()
+        item = next(records, None)
+        visit_start = time.perf_counter()
+        decode_time += visit_start - start
+        if item is None:
+            break
+        visit_record(item[1], item[0], builders, timings)
+        visit_time += time.perf_counter() - visit_start
+        n_records += 1
+
+    stats.update(size=os.path.getsize(file_path), records=n_records, decode_s=decode_time, visit_s=visit_time,
+                 extractors_s=timings, rows={builder.name: builder.rows.n_rows for builder in builders})
+    return tuple(builders)
+
+def _rss_mb() -> float:
+    """Resident memory of the current process in MB (peak resident memory where /proc is not available)."""
     try:
-        results = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['general']['results']
-    except KeyError as e:
-        print(f"KeyError: {e}")
-        return pd.DataFrame()
-    
-    data_annotation = []
-    for region_idx in range(len(results)):
-            for hit_idx in range(len(results[region_idx]['ranking'])):
-                hit = results[region_idx]['ranking'][hit_idx][0]
-                entry = {
-                    'accession': hit.get('accession'),
-                    'cluster_label': hit.get('cluster_label'),
-                    'description': hit.get('description'),
-                    'cluster_type': hit.get('cluster_type'),
-                    'number_of_genes_in_ref': len(hit.get('proteins'))
-                }
-                data_annotation.append(entry)
-
-
-    data_metrics = []
-    for region_idx in range(len(results)):
-            for hit_idx in range(len(results[region_idx]['ranking'])):
-                hit = results[region_idx]['ranking'][hit_idx][1]
-                entry = {
-                    'hits': hit.get('hits'),
-                    'core_gene_hits': hit.get('core_gene_hits'),
-                    'synteny_score': hit.get('synteny_score'),
-                    'core_bonus': hit.get('core_bonus'),
-                    'similarity':hit.get('similarity')
-                }
-                data_metrics.append(entry)
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
-    df_annotation = pd.DataFrame(data_annotation)
-    df_metrics = pd.DataFrame(data_metrics)
+def _parse_json_file_safe(file_path: str, stream: bool = False, table_options: dict = None, trace: bool = False) -> tuple:
+    """
+    Run parse_json_file in a worker process, returning the error message instead of raising
+    so that a failure in one file does not stop the other workers.
+    With trace, the stats of parse_json_file and the RSS of the process after the file are returned too.
+    """
+    stats = {} if trace else None
+    try:
+        tables, error = parse_json_file(file_path, stream=stream, table_options=table_options, stats=stats), None
+    except Exception as e:
+        tables, error = None, str(e)
+    if trace:
+        stats["rss_mb"] = _rss_mb()
+    return tables, error, stats
+
+def iter_parsed_files(path: str, files: list, stream: bool = False, workers: int = 1, table_options: dict = None,
+                      trace: bool = False):
+    """
+    Parse the given files of a directory, in a process pool if workers > 1.
+
+    Yields
+    ------
+    elt : str
+        File name.
+    builders : tuple of TableBuilder or None
+        Output of parse_json_file, None if the file could not be parsed.
+    stats : dict or None
+        With trace, the stats of parse_json_file, rss_mb and the error if any.
+    """
 
-    df_clusterblast = pd.concat([df_annotation, df_metrics], axis=1)
-    df_clusterblast['sequence'] = json_file['records'][idx]['modules']['antismash.modules.clusterblast']['general']['record_id']
+    file_paths = [os.path.join(path, elt) for elt in files]
 
-    return df_clusterblast
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is not None:
+            # Results come back in the order of the files
+            results = executor.map(_parse_json_file_safe, file_paths, [stream] * len(files), [table_options] * len(files),
+                                   [trace] * len(files), chunksize=max(1, len(files) // (workers * 4)))
 
-def parse_json(path):
+        for elt, file_path in zip(files, file_paths):
+            print(f"Processing file: {elt}")
+            if executor is not None:
+                tables, error, stats = next(results)
+            else:
+                tables, error, stats = _parse_json_file_safe(file_path, stream, table_options, trace)
+            if error is not None:
+                print(f"Error reading {elt}: {error}. Skipping file.")
+                if stats is not None:
+                    stats["error"] = error
+            yield elt, tables, stats
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def assign_mag(builders: tuple, elt: str) -> None:
+    """Add a 'mag' column, named after the JSON file, to the tables of the file."""
+    mag = os.path.splitext(elt)[0]
+    for builder in builders:
+        builder.rows.assign("mag", mag)
+
+def _trace_event(trace_file, event: str, **fields) -> None:
+    """Write one event to a JSON-lines trace file opened by parse_json, if any. Lines are flushed so that the trace of a killed job is complete."""
+    if trace_file is not None:
+        trace_file.write(json.dumps(dict(event=event, time=time.time(), **fields)) + "\n")
+        trace_file.flush()
+
+def _open_trace(trace: str):
+    return open(trace, 'w') if trace else contextlib.nullcontext()
+
+def _to_frames(builders: list, trace_file=None) -> tuple:
+    """One DataFrame per table; with a trace file, the build time and size of each table are traced."""
+    if trace_file is None:
+        return tuple(builder.to_frame() for builder in builders)
+    frames, build_time = [], {}
+    for builder in builders:
+        start = time.perf_counter()
+        frames.append(builder.to_frame())
+        build_time[builder.name] = time.perf_counter() - start
+    _trace_event(trace_file, "build", build_s=build_time, rows={builder.name: len(df) for builder, df in zip(builders, frames)},
+                 rss_mb=_rss_mb())
+    return tuple(frames)
+
+def _trace_file_event(trace_file, elt: str, stats: dict) -> None:
+    if stats is not None:
+        _trace_event(trace_file, "file", file=elt, **stats)
+
+def parse_json(path, stream=False, workers=1, with_mag=False, table_options=None, trace=None):
     """
     Extract data from MIBiG Comparison tab in antiSMASH HTML output.
     
@@ -302,62 +940,367 @@ def parse_json(path):
     ----------
     path : str
         path to the directory containing all antiSMASH directories outputs
+    stream : bool
+        If True, parse each file one record at a time (see parse_json_file).
+    workers : int
+        Number of processes used to parse the files. Results are merged in sorted file order,
+        so the output is the same as with a single process.
+    with_mag : bool
+        If True, add a 'mag' column with the name of the JSON file (without extension) to all tables.
+    table_options : dict, optional
+        Keyword arguments of the table builders, by table name, e.g. {"region_summary": {"top_k": 3}}.
+    trace : str, optional
+        JSON-lines file of instrumentation events: one "file" event per file (size, decode and visit time,
+        time per table builder, rows per table, RSS of the parsing process), then the "build" time of
+        each table and an "end" event. See summarize_trace.
 
     Returns
     -------
-    query_to_reference_df : DataFrame
-        DataFrame of results.
-    similarity_score_df : DataFrame
-        DataFrame of results.
-    blast_score_df : DataFrame
-        DataFrame of results.
-    mibig_entries_df : DataFrame
-        DataFrame of results.  
+    tables : tuple of DataFrames
+        One DataFrame per table, in the order of table_names(): region_summary, query_to_reference,
+        similarity_score, blast_score, mibig_entries, cluster_blast, known_cluster and registered plug-ins.
     """
 
-    # Initialize empty lists
-    region_summary = []
-    query_to_reference = []
-    similarity_score = []
-    blast_score = []
-    mibig_entries = []
-    cluster_blast = []
+    # Rows of all files, one builder per table
+    tables = _new_builders(table_options)
 
     # Iterate over all directories in the specified path
     ignore_patterns = {".DS_Store", ".cache"}
 
-    # print(os.listdir(path))
-    for elt in sorted(os.listdir(path)):
+    files = [elt for elt in sorted(os.listdir(path)) if elt not in ignore_patterns]
 
-        if elt not in ignore_patterns :
-            print(f"Processing file: {elt}")
-            try:
-                with open(os.path.join(path, elt), 'r') as f:   #,f"{elt}.json"
-                    json_file = json.load(f)
-            except Exception as e:
-                print(f"Error reading {elt}: {e}. Skipping file.")
+    with _open_trace(trace) as trace_file:
+        start = time.perf_counter()
+        _trace_event(trace_file, "start", path=os.path.abspath(path), n_files=len(files), stream=stream, workers=workers)
+
+        for elt, file_tables, stats in iter_parsed_files(path, files, stream=stream, workers=workers,
+                                                          table_options=table_options, trace=trace_file is not None):
+            _trace_file_event(trace_file, elt, stats)
+            if file_tables is None:
                 continue
-            
-            # Get indices for records with desired key conditions
-            indices = get_index(json_file)
-
-            # Iterate over all sequences with results
-            for idx in indices :
-                region_summary.append(get_region_summary(json_file, idx))
-                query_to_reference.append(get_query_to_reference_match(json_file, idx))
-                similarity_score.append(get_similarity_score_w_annotation(json_file, idx))
-                blast_score.append(get_blast_scores(json_file, idx))
-                mibig_entries.append(get_mibig_entries(json_file, idx))
-                cluster_blast.append(get_cluster_blast_result(json_file, idx))
-
-    region_summary_df = pd.concat(region_summary, ignore_index=True) if region_summary else pd.DataFrame()
-    query_to_reference_df = pd.concat(query_to_reference, ignore_index=True) if query_to_reference else pd.DataFrame()
-    similarity_score_df = pd.concat(similarity_score, ignore_index=True) if similarity_score else pd.DataFrame()
-    blast_score_df = pd.concat(blast_score, ignore_index=True) if blast_score else pd.DataFrame()
-    mibig_entries_df = pd.concat(mibig_entries, ignore_index=True) if mibig_entries else pd.DataFrame()
-    cluster_blast_df = pd.concat(cluster_blast, ignore_index=True) if cluster_blast else pd.DataFrame()
-
-    return region_summary_df, query_to_reference_df, similarity_score_df, blast_score_df, mibig_entries_df, cluster_blast_df
+            if with_mag:
+                assign_mag(file_tables, elt)
+            for table, file_table in zip(tables, file_tables):
+                table.merge(file_table)
+
+        # One DataFrame per table
+        frames = _to_frames(tables, trace_file)
+        _trace_event(trace_file, "end", wall_s=time.perf_counter() - start, rss_mb=_rss_mb() if trace_file else None)
+    return frames
+
+
+def file_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _write_atomic(file_path: str, write) -> None:
+    """
+    Call write(f) on a temporary file then move it to file_path, so that an interrupted run never leaves a partial file.
+
+    The temporary file has a unique name (mkstemp) in the directory of file_path, so that two runs
+    writing the same file do not write to the same temporary file.
+    """
+
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(file_path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(file_path) or ".")
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _save_manifest(manifest: dict, manifest_path: str) -> None:
+    _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest, indent=1).encode()))
+
+# Format of the partitions saved by parse_json_incremental (3: TableBuilder per table)
+_PARTITION_VERSION = 3
+
+def parse_json_incremental(path, state_dir, stream=False, workers=1, with_mag=False, table_options=None, trace=None):
+    """
+    Incremental version of parse_json.
+
+    The tables of each JSON file are saved as a partition in `state_dir`, and a manifest records the path,
+    size, mtime and SHA-256 of each parsed file. On a re-run, only new or changed files are parsed,
+    the partitions of deleted files are dropped, and the combined tables are rebuilt from the partitions.
+    The manifest is saved after each parsed file, so an interrupted run resumes where it stopped.
+
+    Parameters
+    ----------
+    path : str
+        path to the directory containing all antiSMASH JSON files
+    state_dir : str
+        path to the directory holding the manifest and the partitions
+    stream : bool
+        If True, parse each file one record at a time (see parse_json_file).
+    workers : int
+        Number of processes used to parse the new or changed files.
+    with_mag : bool
+        If True, add a 'mag' column with the name of the JSON file (without extension) to all tables.
+    table_options : dict, optional
+        Keyword arguments of the table builders, by table name (see parse_json).
+    trace : str, optional
+        JSON-lines file of instrumentation events of the parsed files (see parse_json).
+
+    Returns
+    -------
+    Same DataFrames as parse_json, identical to a full re-parse.
+    """
+
+    partitions_dir = os.path.join(state_dir, "partitions")
+    os.makedirs(partitions_dir, exist_ok=True)
+    manifest_path = os.path.join(state_dir, "manifest.json")
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    else:
+        manifest = {"files": {}}
+    # Partitions hold the rows of each table, they are rebuilt if tables were registered or removed,
+    # if their options changed or if they were saved in another format
+    table_options = table_options or {}
+    if (manifest.get("tables") != table_names() or manifest.get("table_options", {}) != table_options
+            or manifest.get("version") != _PARTITION_VERSION):
+        manifest = {"version": _PARTITION_VERSION, "tables": table_names(), "table_options": table_options, "files": {}}
+    entries = manifest["files"]
+
+    ignore_patterns = {".DS_Store", ".cache"}
+    files = [elt for elt in sorted(os.listdir(path)) if elt not in ignore_patterns]
+
+    # Drop the partitions of deleted files
+    deleted = sorted(set(entries) - set(files))
+    for elt in deleted:
+        partition = os.path.join(state_dir, entries.pop(elt)["partition"])
+        if os.path.exists(partition):
+            os.remove(partition)
+
+    # Find new or changed files. The hash is only computed when size or mtime changed.
+    to_parse = []
+    for elt in files:
+        file_path = os.path.join(path, elt)
+        stat = os.stat(file_path)
+        entry = entries.get(elt)
+        if entry is not None and os.path.exists(os.path.join(state_dir, entry["partition"])):
+            if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            sha256 = file_hash(file_path)
+            if entry["sha256"] == sha256:
+                entry.update(path=os.path.abspath(file_path), size=stat.st_size, mtime=stat.st_mtime)
+                continue
+        to_parse.append(elt)
+
+    with _open_trace(trace) as trace_file:
+        start = time.perf_counter()
+        _trace_event(trace_file, "start", path=os.path.abspath(path), n_files=len(to_parse), stream=stream, workers=workers,
+                     unchanged=len(files) - len(to_parse), deleted=len(deleted))
+        print(f"{len(to_parse)} new or changed file(s), {len(files) - len(to_parse)} unchanged, {len(deleted)} deleted")
+        _save_manifest(manifest, manifest_path)
+
+        for elt, tables, stats in iter_parsed_files(path, to_parse, stream=stream, workers=workers,
+                                                    table_options=table_options, trace=trace_file is not None):
+            _trace_file_event(trace_file, elt, stats)
+            file_path = os.path.join(path, elt)
+            partition = os.path.join("partitions", f"{elt}.pkl")
+            if tables is None:
+                # Failed files are not part of the output, they will be retried on the next run
+                entries.pop(elt, None)
+                if os.path.exists(os.path.join(state_dir, partition)):
+                    os.remove(os.path.join(state_dir, partition))
+            else:
+                stat = os.stat(file_path)
+                _write_atomic(os.path.join(state_dir, partition), lambda f: pickle.dump(tables, f, protocol=pickle.HIGHEST_PROTOCOL))
+                entries[elt] = {
+                    "path": os.path.abspath(file_path),
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "sha256": file_hash(file_path),
+                    "partition": partition
+                }
+            _save_manifest(manifest, manifest_path)
+
+        # Rebuild the combined tables from the partitions, in sorted file order
+        combined = _new_builders(table_options)
+        for elt in files:
+            if elt not in entries:
+                continue
+            with open(os.path.join(state_dir, entries[elt]["partition"]), 'rb') as f:
+                tables = pickle.load(f)
+            if with_mag:
+                assign_mag(tables, elt)
+            for table, file_table in zip(combined, tables):
+                table.merge(file_table)
+
+        frames = _to_frames(combined, trace_file)
+        _trace_event(trace_file, "end", wall_s=time.perf_counter() - start, rss_mb=_rss_mb() if trace_file else None)
+    return frames
+
+
+def summarize_trace(trace_path: str, top: int = 10) -> tuple:
+    """
+    Summarize a trace file of parse_json or parse_json_incremental.
+
+    The trace may be incomplete, e.g. if the job was killed; the summary covers the files parsed so far.
+
+    Parameters
+    ----------
+    trace_path : str
+        JSON-lines file written with the trace argument.
+    top : int
+        Number of files reported.
+
+    Returns
+    -------
+    files : DataFrame
+        The `top` slowest files: size, records, decode and visit time, rows, RSS after the file and error.
+    extractors : DataFrame
+        Per table: total time in the builder over all files, time to build the DataFrame and rows,
+        heaviest first.
+    """
+
+    with open(trace_path, 'r') as f:
+        events = [json.loads(line) for line in f if line.strip()]
+
+    files = [event for event in events if event["event"] == "file"]
+    file_rows = pd.DataFrame([{
+        "file": event["file"],
+        "size_mb": event.get("size", 0) / 2**20,
+        "records": event.get("records", 0),
+        "decode_s": event.get("decode_s", 0.0),
+        "visit_s": event.get("visit_s", 0.0),
+        "total_s": event.get("decode_s", 0.0) + event.get("visit_s", 0.0),
+        "rows": sum(event.get("rows", {}).values()),
+        "rss_mb": event.get("rss_mb"),
+        "error": event.get("error")
+    } for event in files], columns=["file", "size_mb", "records", "decode_s", "visit_s", "total_s", "rows", "rss_mb", "error"])
+    file_rows = file_rows.sort_values("total_s", ascending=False, kind="stable").head(top).reset_index(drop=True)
+
+    extractors = {}
+    for event in files:
+        for name, seconds in event.get("extractors_s", {}).items():
+            extractor = extractors.setdefault(name, {"table": name, "visit_s": 0.0, "build_s": 0.0, "rows": 0})
+            extractor["visit_s"] += seconds
+            extractor["rows"] += event.get("rows", {}).get(name, 0)
+    for event in events:
+        if event["event"] == "build":
+            for name, seconds in event["build_s"].items():
+                extractors.setdefault(name, {"table": name, "visit_s": 0.0, "build_s": 0.0, "rows": 0})["build_s"] += seconds
+    extractor_rows = pd.DataFrame(list(extractors.values()), columns=["table", "visit_s", "build_s", "rows"])
+    extractor_rows["total_s"] = extractor_rows["visit_s"] + extractor_rows["build_s"]
+    extractor_rows = extractor_rows.sort_values("total_s", ascending=False, kind="stable").reset_index(drop=True)
+
+    return file_rows, extractor_rows
+
+def print_trace_summary(trace_path: str, top: int = 10) -> None:
+    """Print the slowest files and the heaviest table builders of a trace file (see summarize_trace)."""
+    files, extractors = summarize_trace(trace_path, top=top)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.3f}".format):
+        print(f"Slowest files ({trace_path}):")
+        print(files.to_string(index=False) if not files.empty else "  no file parsed")
+        print("Heaviest tables (time in the builders over all files, and to build the DataFrame):")
+        print(extractors.to_string(index=False) if not extractors.empty else "  none")
+
+
+def _to_arrow(df: pd.DataFrame):
+    """
+    Convert a DataFrame to a pyarrow Table with typed columns.
+
+    Object columns holding values of mixed types (e.g. numbers and strings from different
+    antiSMASH versions) cannot be typed by pyarrow, they are stored as strings.
+    """
+    import pyarrow as pa
+
+    columns = {}
+    for column in df.columns:
+        try:
+            columns[str(column)] = pa.array(df[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            columns[str(column)] = pa.array(df[column].map(lambda x: x if x is None else str(x)), from_pandas=True)
+    return pa.table(columns)
+
+def write_tables(tables: tuple, out_dir: str, fmt: str = "csv") -> None:
+    """
+    Save the tables returned by parse_json.
+
+    Parameters
+    ----------
+    tables : tuple of DataFrames
+        Output of parse_json, in the order of table_names().
+    out_dir : str
+        Output directory.
+    fmt : str
+        'csv' writes one {table}.csv per table.
+        'parquet' writes one zstd-compressed Parquet dataset per table, partitioned by the 'mag' column
+        ({table}/mag=.../*.parquet). The tables must have been parsed with with_mag=True.
+    """
+
+    if fmt == "csv":
+        for name, df in zip(table_names(), tables):
+            df.to_csv(os.path.join(out_dir, f"{name}.csv"), index=False)
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to write Parquet files (pip install pyarrow)")
+
+        for name, df in zip(table_names(), tables):
+            dataset_dir = os.path.join(out_dir, name)
+            # Partitions of a previous run would be mixed with the new ones
+            if os.path.exists(dataset_dir):
+                shutil.rmtree(dataset_dir)
+            if df.empty:
+                continue
+            if "mag" not in df.columns:
+                raise ValueError(f"Table {name} has no 'mag' column, parse the JSON files with with_mag=True")
+            pq.write_to_dataset(_to_arrow(df), dataset_dir, partition_cols=["mag"], compression="zstd")
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+def load_table(out_dir: str, name: str, columns: list = None, mags: list = None) -> pd.DataFrame:
+    """
+    Load one table written by write_tables, reading only the requested columns and MAGs.
+
+    The Parquet dataset is used if present, otherwise the CSV file.
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory passed to write_tables.
+    name : str
+        Table name, one of table_names().
+    columns : list of str, optional
+        Columns to load. All columns by default.
+    mags : list of str, optional
+        MAGs to load (names of the JSON files without extension). All MAGs by default.
+        Only the partitions of these MAGs are read. Requires the Parquet format.
+
+    Returns
+    -------
+    df : DataFrame
+    """
+
+    if name not in table_names():
+        raise ValueError(f"Unknown table: {name}. Expected one of {', '.join(table_names())}")
+
+    dataset_dir = os.path.join(out_dir, name)
+    if os.path.isdir(dataset_dir):
+        filters = [("mag", "in", list(mags))] if mags is not None else None
+        df = pd.read_parquet(dataset_dir, columns=columns, filters=filters)
+        if "mag" in df.columns:
+            # Partition values are read back as categories
+            df["mag"] = df["mag"].astype(str)
+        return df
+
+    if mags is not None:
+        raise ValueError("Selecting MAGs requires tables written with fmt='parquet'")
+    return pd.read_csv(os.path.join(out_dir, f"{name}.csv"), usecols=columns)
 
 
 
@@ -7,14 +7,18 @@
 
 cd /local/scratch/amaros/antismash/02_pipeline/
 
+# The whole pipeline, skipping the stages that are up to date:
+# /usr/local/packages/python-3.11/bin/python3 run_pipeline.py pipeline.json --jobs 2
+
 # Filter JSON with/without results
-/usr/local/packages/python-3.11/bin/python3 01_process_antismash_output.py /local/scratch/amaros/antismash/results_antismash/ /local/scratch/amaros/antismash/03_results/jsons/
+/usr/local/packages/python-3.11/bin/python3 01_process_antismash_output.py /local/scratch/amaros/antismash/results_antismash/ /local/scratch/amaros/antismash/03_results/jsons/ --workers ${SLURM_CPUS_PER_TASK:-1}
 
 # Parse JSON
-# /usr/local/packages/python-3.11/bin/python3 02_process_antismash_json.py /local/scratch/amaros/antismash/03_results/jsons/ /local/scratch/amaros/antismash/03_results/csv_files/
+# /usr/local/packages/python-3.11/bin/python3 02_process_antismash_json.py /local/scratch/amaros/antismash/03_results/jsons/ /local/scratch/amaros/antismash/03_results/csv_files/ --stream
 
 # Python scripts
-# /usr/local/packages/python-3.11/bin/python3 03_get_ctg_coordinates.py
-# /usr/local/packages/python-3.11/bin/python3 04_get_ctg_sequences.py
-# /usr/local/packages/python-3.11/bin/python3 05_blast_ctg.py
+# /usr/local/packages/python-3.11/bin/python3 03_get_ctg_coordinates.py /local/scratch/amaros/antismash/results_antismash/ /local/scratch/amaros/antismash/03_results/ctg_coordinates.csv --workers ${SLURM_CPUS_PER_TASK:-1}
+# /usr/local/packages/python-3.11/bin/python3 04_get_ctg_sequences.py /local/scratch/amaros/antismash/03_results/ctg_coordinates.csv /local/projects-t3/LSVF/VIRGO2/final_bins/ /local/scratch/amaros/antismash/03_results/antismash_genes_sequences.fasta --index-dir /local/scratch/amaros/antismash/fai
+# /usr/local/packages/python-3.11/bin/python3 05_blast_ctg.py /local/scratch/mfrance/VIRGO2/12_package/VIRGO2.fa /local/scratch/amaros/antismash/05_blast_DB/antismash_blast_db_nucl/antimsash_make_db_nucl /local/scratch/amaros/antismash/03_results/VIRGO2_vs_antismash_DB_nucl.txt --workers 8 --threads 4
 
+# /usr/local/packages/python-3.11/bin/python3 06_parse_blast_results.py /local/scratch/amaros/antismash/03_results/VIRGO2_vs_antismash_DB_nucl.txt /local/scratch/amaros/antismash/03_results/VIRGO2_vs_antismash_best_hits.parquet --max-evalue 1e-5 --format parquet
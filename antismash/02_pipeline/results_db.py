@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import pandas as pd
+from functions import assign_mag, file_hash, iter_parsed_files, table_names
+
+# Version of the schema below, the database is rebuilt when it changes
+SCHEMA_VERSION = 2
+
+# Columns of each table of the database. Tables of parse_json are stored with the 'mag' column
+# (JSON file name without extension) used to replace the rows of a file when it changes.
+# query_to_reference and similarity_score are stored in long format, one row per score, instead of
+# one column per reference protein or analysis.
+SCHEMA = {
+    "region_summary": ["mag", "sequence", "region", "type", "most_similar_known_cluster",
+                       "most_similar_known_cluster_type", "similarity"],
+    "region_type": ["mag", "sequence", "region", "type"],
+    "query_to_reference": ["mag", "sequence", "protein", "reference_protein", "score"],
+    "similarity_score": ["mag", "sequence", "region", "reference", "position", "analysis", "score"],
+    "blast_score": ["mag", "sequence", "region", "ctg", "coordinate", "name", "genecluster", "annotation",
+                    "perc_coverage", "perc_ident", "blastscore", "evalue", "locus_tag"],
+    "mibig_entries": ["mag", "sequence", "region", "ctg", "mibig_protein", "description", "mibig_cluster",
+                      "mibig_product", "percentage_id", "blast_score", "percentage_coverage", "evalue"],
+    "cluster_blast": ["mag", "sequence", "accession", "cluster_label", "description", "cluster_type",
+                      "number_of_genes_in_ref", "hits", "core_gene_hits", "synteny_score", "core_bonus", "similarity"],
+    "known_cluster": ["mag", "sequence", "region", "accession", "description", "cluster_type", "similarity"],
+    "mibig_annotation": ["reference", "type", "compound", "organism"]
+}
+
+# Indexes on the columns used in lookups: sequence, region, MIBiG accession, contig and product type
+INDEXES = {
+    "region_summary": [("mag",), ("sequence", "region"), ("most_similar_known_cluster_type",)],
+    "region_type": [("mag",), ("type",), ("sequence", "region")],
+    "query_to_reference": [("mag",), ("sequence",), ("reference_protein",)],
+    "similarity_score": [("mag",), ("sequence", "region"), ("reference", "score")],
+    "blast_score": [("mag",), ("sequence", "region"), ("ctg",)],
+    "mibig_entries": [("mag",), ("sequence", "region"), ("ctg",), ("mibig_cluster",), ("mibig_product",)],
+    "cluster_blast": [("mag",), ("sequence",), ("accession", "similarity"), ("cluster_type",)],
+    "known_cluster": [("mag",), ("sequence", "region"), ("accession", "similarity")]
+}
+
+def _create_schema(con: sqlite3.Connection) -> None:
+    con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    con.execute("CREATE TABLE files (file TEXT PRIMARY KEY, mag TEXT, size INTEGER, mtime REAL, sha256 TEXT)")
+    for table, columns in SCHEMA.items():
+        key = " PRIMARY KEY" if table == "mibig_annotation" else ""
+        con.execute(f"CREATE TABLE {table} ({columns[0]}{key}, {', '.join(columns[1:])})")
+    for table, indexes in INDEXES.items():
+        for columns in indexes:
+            con.execute(f"CREATE INDEX idx_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})")
+
+def connect(db_path: str, table_options: dict = None) -> sqlite3.Connection:
+    """
+    Open the database, creating it if needed.
+
+    The database is emptied and created again if it was built with another schema version, other
+    tables or other table options, so that the next update parses all files again.
+    """
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode=WAL")
+    meta = {"version": SCHEMA_VERSION, "tables": table_names(), "table_options": table_options or {}}
+
+    current = None
+    if con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='meta'").fetchone():
+        current = {key: json.loads(value) for key, value in con.execute("SELECT key, value FROM meta")}
+    if current != meta:
+        with con:
+            for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+                con.execute(f"DROP TABLE {name}")
+            _create_schema(con)
+            con.executemany("INSERT INTO meta VALUES (?, ?)", [(key, json.dumps(value)) for key, value in meta.items()])
+    return con
+
+def _records(df: pd.DataFrame, columns: list) -> list:
+    """Rows of the given columns as tuples of Python values, None for missing columns and values."""
+    df = df.reindex(columns=columns).astype(object)
+    return list(df.where(df.notna(), None).itertuples(index=False, name=None))
+
+def _long(df: pd.DataFrame, id_columns: list, var_name: str, value_name: str) -> pd.DataFrame:
+    """Melt the score columns of a wide table, dropping missing scores."""
+    return df.melt(id_vars=id_columns, var_name=var_name, value_name=value_name).dropna(subset=[value_name])
+
+def file_rows(builders: tuple) -> dict:
+    """
+    Rows of the database tables from the table builders of one file (output of parse_json_file with the mag column).
+
+    Returns
+    -------
+    rows : dict
+        {table: list of tuples in the order of SCHEMA[table]}
+    """
+
+    frames = dict(zip(table_names(), (builder.to_frame() for builder in builders)))
+    rows = {}
+
+    df = frames["region_summary"]
+    if not df.empty:
+        region_type = df[["mag", "sequence", "region", "type"]].explode("type").drop_duplicates()
+        rows["region_type"] = _records(region_type.dropna(subset=["type"]), SCHEMA["region_type"])
+        df = df.assign(type=df["type"].map(lambda types: "; ".join(types) if isinstance(types, list) else types))
+    rows["region_summary"] = _records(df, SCHEMA["region_summary"])
+
+    df = frames["query_to_reference"]
+    if not df.empty:
+        df = _long(df, ["mag", "sequence", "protein"], "reference_protein", "score")
+    rows["query_to_reference"] = _records(df, SCHEMA["query_to_reference"])
+
+    df = frames["similarity_score"]
+    if not df.empty:
+        annotations = df[["reference", "type", "compound", "organism"]].drop_duplicates("reference")
+        rows["mibig_annotation"] = _records(annotations, SCHEMA["mibig_annotation"])
+        df = _long(df.drop(columns=["type", "compound", "organism"]), ["mag", "sequence", "region", "reference", "position"],
+                   "analysis", "score")
+    rows["similarity_score"] = _records(df, SCHEMA["similarity_score"])
+
+    for table in ("blast_score", "mibig_entries", "cluster_blast", "known_cluster"):
+        rows[table] = _records(frames[table], SCHEMA[table])
+    return rows
+
+def _replace_file(con: sqlite3.Connection, elt: str, mag: str, rows: dict, entry: dict) -> None:
+    """Replace the rows of a file in one transaction, so that an interrupted update leaves the database consistent."""
+    with con:
+        for table in INDEXES:
+            con.execute(f"DELETE FROM {table} WHERE mag = ?", (mag,))
+        for table, table_rows in rows.items():
+            placeholders = ", ".join("?" * len(SCHEMA[table]))
+            verb = "INSERT OR IGNORE" if table == "mibig_annotation" else "INSERT"
+            con.executemany(f"{verb} INTO {table} VALUES ({placeholders})", table_rows)
+        if entry is None:
+            con.execute("DELETE FROM files WHERE file = ?", (elt,))
+        else:
+            con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                        (elt, mag, entry["size"], entry["mtime"], entry["sha256"]))
+
+def update_db(db_path: str, path: str, stream: bool = False, workers: int = 1, table_options: dict = None) -> dict:
+    """
+    Add the parsed antiSMASH JSON files of a directory to the SQLite database, incrementally.
+
+    As with parse_json_incremental, the size, mtime and SHA-256 of each file are recorded; only new or
+    changed files are parsed, their rows replace the previous ones, and the rows of deleted files are removed.
+    Each file is committed on its own, so an interrupted update resumes where it stopped.
+
+    Parameters
+    ----------
+    db_path : str
+        SQLite database, created if needed.
+    path : str
+        Directory of antiSMASH JSON files.
+    stream : bool
+        If True, parse each file one record at a time (see parse_json_file).
+    workers : int
+        Number of processes used to parse the files.
+    table_options : dict, optional
+        Keyword arguments of the table builders, by table name (see parse_json).
+
+    Returns
+    -------
+    counts : dict
+        Number of parsed, unchanged, deleted and failed files.
+    """
+
+    con = connect(db_path, table_options)
+    try:
+        entries = {elt: {"mag": mag, "size": size, "mtime": mtime, "sha256": sha256}
+                   for elt, mag, size, mtime, sha256 in con.execute("SELECT * FROM files")}
+
+        ignore_patterns = {".DS_Store", ".cache"}
+        files = [elt for elt in sorted(os.listdir(path)) if elt not in ignore_patterns]
+
+        deleted = sorted(set(entries) - set(files))
+        for elt in deleted:
+            _replace_file(con, elt, entries[elt]["mag"], {}, None)
+
+        # The hash is only computed when size or mtime changed
+        to_parse = []
+        for elt in files:
+            file_path = os.path.join(path, elt)
+            stat = os.stat(file_path)
+            entry = entries.get(elt)
+            if entry is not None:
+                if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                    continue
+                if entry["sha256"] == file_hash(file_path):
+                    with con:
+                        con.execute("UPDATE files SET size = ?, mtime = ? WHERE file = ?", (stat.st_size, stat.st_mtime, elt))
+                    continue
+            to_parse.append(elt)
+
+        print(f"{len(to_parse)} new or changed file(s), {len(files) - len(to_parse)} unchanged, {len(deleted)} deleted")
+
+        failed = 0
+        for elt, builders, _ in iter_parsed_files(path, to_parse, stream=stream, workers=workers, table_options=table_options):
+            mag = os.path.splitext(elt)[0]
+            if builders is None:
+                # Failed files are removed from the database and retried on the next update
+                _replace_file(con, elt, mag, {}, None)
+                failed += 1
+                continue
+            assign_mag(builders, elt)
+            file_path = os.path.join(path, elt)
+            stat = os.stat(file_path)
+            _replace_file(con, elt, mag, file_rows(builders),
+                          {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": file_hash(file_path)})
+    finally:
+        con.close()
+
+    return {"parsed": len(to_parse) - failed, "unchanged": len(files) - len(to_parse), "deleted": len(deleted), "failed": failed}
+
+class ResultsDB:
+    """
+    Read-only queries on a database built by update_db.
+
+    Examples
+    --------
+    >>> with ResultsDB("antismash.sqlite") as db:
+    ...     hits = db.mags_hitting("BGC0000001", min_similarity=50)
+    ...     regions = db.select("region_type", type="terpene")
+    """
+
+    def __init__(self, db_path: str):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self.con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.con.close()
+
+    def query(self, sql: str, params: tuple = ()) -> pd.DataFrame:
+        """Run any SELECT statement and return the result as a DataFrame."""
+        return pd.read_sql_query(sql, self.con, params=params)
+
+    def select(self, table: str, columns: list = None, **filters) -> pd.DataFrame:
+        """
+        Rows of a table matching all filters.
+
+        Parameters
+        ----------
+        table : str
+            Table of SCHEMA.
+        columns : list of str, optional
+            Columns returned, all by default.
+        **filters
+            column=value for an equality, column=[values] for any of the values.
+
+        Returns
+        -------
+        df : DataFrame
+        """
+
+        if table not in SCHEMA:
+            raise ValueError(f"Unknown table {table}, expected one of {list(SCHEMA)}")
+        unknown = [column for column in list(columns or []) + list(filters) if column not in SCHEMA[table]]
+        if unknown:
+            raise ValueError(f"Unknown columns of {table}: {unknown}")
+
+        conditions, params = [], []
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(f"{column} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT {', '.join(columns) if columns else '*'} FROM {table}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        return self.query(sql, tuple(params))
+
+    def mags_hitting(self, accession: str, min_similarity: float = 0) -> pd.DataFrame:
+        """
+        MAGs, sequences and regions with a KnownClusterBlast hit to a MIBiG cluster (BGC id), best first.
+
+        The similarity is the percentage of the genes of the MIBiG cluster found in the region. The
+        general ClusterBlast hits (antiSMASH database records) are in the cluster_blast table.
+        """
+        return self.query("SELECT mag, sequence, region, cluster_type, similarity FROM known_cluster "
+                          "WHERE accession = ? AND similarity >= ? ORDER BY similarity DESC", (accession, min_similarity))
+
+    def regions(self, product_type: str = None, sequence: str = None) -> pd.DataFrame:
+        """Regions of a product type and/or sequence, with their most similar known cluster."""
+        conditions, params = [], []
+        if product_type is not None:
+            conditions.append("t.type = ?")
+            params.append(product_type)
+        if sequence is not None:
+            conditions.append("r.sequence = ?")
+            params.append(sequence)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.query("SELECT DISTINCT r.* FROM region_summary r JOIN region_type t "
+                          f"ON r.mag = t.mag AND r.sequence = t.sequence AND r.region = t.region {where}", tuple(params))
+
+    def contig_hits(self, ctg: str) -> pd.DataFrame:
+        """MIBiG hits of a gene (contig name of the antiSMASH output)."""
+        return self.select("mibig_entries", ctg=ctg)
+
+def main():
+    parser = argparse.ArgumentParser(description="Index parsed antiSMASH results in a SQLite database and query it.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update = subparsers.add_parser("update", help="Add new or changed JSON files to the database")
+    update.add_argument('path', type=str, help='Directory of antiSMASH JSON files (output of 01_process_antismash_output.py)')
+    update.add_argument('db', type=str, help='SQLite database, created if needed')
+    update.add_argument('--stream', action='store_true', help='Read JSON files one record at a time')
+    update.add_argument('--workers', type=int, default=1, help='Number of processes used to parse the JSON files (default: 1)')
+    update.add_argument('--top-k', type=int, default=1,
+                        help='Number of most similar known clusters reported per region in region_summary, 0 for all (default: 1)')
+
+    hits = subparsers.add_parser("hits", help="MAGs hitting a MIBiG cluster")
+    hits.add_argument('db', type=str, help='SQLite database')
+    hits.add_argument('accession', type=str, help='MIBiG accession, e.g. BGC0000001')
+    hits.add_argument('--min-similarity', type=float, default=0, help='Minimum KnownClusterBlast similarity, in %% (default: 0)')
+
+    sql = subparsers.add_parser("sql", help="Run a SELECT statement")
+    sql.add_argument('db', type=str, help='SQLite database')
+    sql.add_argument('statement', type=str, help='SQL statement')
+
+    args = parser.parse_args()
+
+    if args.command == "update":
+        counts = update_db(args.db, args.path, stream=args.stream, workers=args.workers,
+                           table_options={"region_summary": {"top_k": args.top_k or None}})
+        print(f"{args.db}: {counts['parsed']} file(s) indexed, {counts['deleted']} removed, {counts['failed']} failed")
+        return
+
+    with ResultsDB(args.db) as db:
+        start = time.perf_counter()
+        df = db.mags_hitting(args.accession, args.min_similarity) if args.command == "hits" else db.query(args.statement)
+        elapsed = time.perf_counter() - start
+    print(df.to_string(index=False))
+    print(f"{len(df)} row(s) in {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import resource
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# A stage of the pipeline. inputs and outputs are file paths, directories (all files below them)
+# or (directory, glob pattern) pairs. after lists the stages whose outputs are inputs of this one.
+Stage = namedtuple("Stage", ["name", "command", "inputs", "outputs", "after"])
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# This module does not import pandas (functions.py): the stages run in processes started from it,
+# and the peak RSS of a process includes the memory of its parent at fork time.
+
+def _file_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _write_atomic(file_path: str, write) -> None:
+    """Call write(f) on a temporary file then move it to file_path."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, file_path)
+
+def _script(name: str) -> str:
+    return os.path.join(SCRIPT_DIR, name)
+
+def pipeline_stages(config: dict) -> list:
+    """
+    Stages 01 to 06 of the antiSMASH pipeline.
+
+    Parameters
+    ----------
+    config : dict
+        Paths of the pipeline (see pipeline.example.json), the number of workers and
+        the extra options of each stage ({"options": {"02_parse_jsons": ["--stream"]}}).
+
+    Returns
+    -------
+    stages : list of Stage
+    """
+
+    python = config.get("python", sys.executable)
+    workers = ["--workers", str(config.get("workers", 1))]
+    options = config.get("options", {})
+    blast_db = config["blast_db"]
+
+    stages = [
+        Stage("01_filter_jsons",
+              [python, _script("01_process_antismash_output.py"), config["antismash_results"], config["jsons_dir"]] + workers,
+              [_script("01_process_antismash_output.py"), _script("functions.py"), (config["antismash_results"], "*/*.json")],
+              [(config["jsons_dir"], "*.json")], []),
+        Stage("02_parse_jsons",
+              [python, _script("02_process_antismash_json.py"), config["jsons_dir"], config["tables_dir"]] + workers,
+              [_script("02_process_antismash_json.py"), _script("functions.py"), (config["jsons_dir"], "*.json")],
+              [config["tables_dir"]], ["01_filter_jsons"]),
+        Stage("03_ctg_coordinates",
+              [python, _script("03_get_ctg_coordinates.py"), config["antismash_results"], config["ctg_coordinates"]] + workers,
+              [_script("03_get_ctg_coordinates.py"), (config["antismash_results"], "*/clusterblast/*")],
+              [config["ctg_coordinates"]], []),
+        Stage("04_ctg_sequences",
+              [python, _script("04_get_ctg_sequences.py"), config["ctg_coordinates"], config["fasta_dir"], config["gene_sequences"]],
+              [_script("04_get_ctg_sequences.py"), _script("fasta_index.py"), config["ctg_coordinates"], (config["fasta_dir"], "*.fasta")],
+              [config["gene_sequences"]], ["03_ctg_coordinates"]),
+        Stage("04_blast_db",
+              [config.get("makeblastdb", "makeblastdb"), "-in", config["gene_sequences"], "-dbtype", "nucl", "-out", blast_db],
+              [config["gene_sequences"]],
+              [(os.path.dirname(blast_db) or ".", f"{os.path.basename(blast_db)}.*")], ["04_ctg_sequences"]),
+        Stage("05_blast",
+              [python, _script("05_blast_ctg.py"), config["query_fasta"], blast_db, config["blast_output"]] + workers,
+              [_script("05_blast_ctg.py"), config["query_fasta"], (os.path.dirname(blast_db) or ".", f"{os.path.basename(blast_db)}.*")],
+              [config["blast_output"]], ["04_blast_db"]),
+        Stage("06_best_hits",
+              [python, _script("06_parse_blast_results.py"), config["blast_output"], config["best_hits"]],
+              [_script("06_parse_blast_results.py"), _script("blast_tabular.py"), config["blast_output"]],
+              [config["best_hits"]], ["05_blast"]),
+    ]
+    if "results_db" in config:
+        stages.append(Stage("02_results_db",
+                            [python, _script("results_db.py"), "update", config["jsons_dir"], config["results_db"]] + workers,
+                            [_script("results_db.py"), _script("functions.py"), (config["jsons_dir"], "*.json")],
+                            [config["results_db"]], ["01_filter_jsons"]))
+    return [stage._replace(command=stage.command + options.get(stage.name, [])) for stage in stages]
+
+class HashCache:
+    """
+    SHA-256 of files, recomputed only when their size or modification time changes.
+
+    Parameters
+    ----------
+    cache_path : str
+        JSON file of the cache, {path: [size, mtime_ns, sha256]}.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                self.cache = json.load(f)
+
+    def file_hash(self, path: str) -> str:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.cache.get(path)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        sha = _file_hash(path)
+        self.cache[path] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+    def files(self, spec) -> list:
+        """Files of an input or output: a file, all files below a directory, or (directory, pattern)."""
+        if isinstance(spec, (tuple, list)):
+            directory, pattern = spec
+            return sorted(path for path in glob.glob(os.path.join(directory, pattern), recursive=True) if os.path.isfile(path))
+        if os.path.isdir(spec):
+            return sorted(os.path.join(root, name) for root, _, names in os.walk(spec) for name in names)
+        return [spec] if os.path.exists(spec) else []
+
+    def spec_hash(self, spec) -> str:
+        """Hash of the names and contents of the files of an input or output, None if there is none."""
+        files = self.files(spec)
+        if not files:
+            return None
+        sha = hashlib.sha256()
+        for path in files:
+            sha.update(f"{path}\t{self.file_hash(path)}\n".encode())
+        return sha.hexdigest()
+
+    def save(self) -> None:
+        _write_atomic(self.cache_path, lambda f: f.write(json.dumps(self.cache).encode()))
+
+def stage_key(stage: Stage, hashes: HashCache) -> str:
+    """Hash of the command of a stage and of the contents of its inputs. None if an input is missing."""
+    inputs = [hashes.spec_hash(spec) for spec in stage.inputs]
+    if any(sha is None for sha in inputs):
+        return None
+    return hashlib.sha256(json.dumps({"command": stage.command, "inputs": inputs}).encode()).hexdigest()
+
+def outputs_hash(stage: Stage, hashes: HashCache) -> str:
+    outputs = [hashes.spec_hash(spec) for spec in stage.outputs]
+    if any(sha is None for sha in outputs):
+        return None
+    return hashlib.sha256(json.dumps(outputs).encode()).hexdigest()
+
+def run_stage(command: list, log_path: str) -> tuple:
+    """
+    Run the command of a stage, with its output in log_path.
+
+    This runs in a process of its own, so the maximum RSS of its children is the peak RSS
+    of the stage, including the processes started by the stage.
+
+    Returns
+    -------
+    returncode, wall_time, peak_rss : int, float, float
+        Exit status, wall time in seconds and peak RSS in MB.
+    """
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        try:
+            returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+        except OSError as e:
+            log.write(f"{e}\n")
+            returncode = 127
+    wall_time = time.perf_counter() - start
+    return returncode, wall_time, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+def run_pipeline(stages: list, state_dir: str, jobs: int = 1, force: list = (), dry_run: bool = False) -> dict:
+    """
+    Run the stages whose inputs or command changed since their last successful run, in dependency order.
+
+    Stages whose dependencies are done run concurrently, up to `jobs` at a time. A stage is skipped
+    when the hash of its command and inputs is the one of its last successful run and its outputs
+    are unchanged. Every run or skip is appended to {state_dir}/runs.jsonl with its wall time and
+    peak RSS, and stage logs are written to {state_dir}/logs/.
+
+    Parameters
+    ----------
+    stages : list of Stage
+    state_dir : str
+        Directory of the pipeline state.
+    jobs : int
+        Maximum number of stages running at the same time.
+    force : list of str
+        Names of stages run even if they are up to date.
+    dry_run : bool
+        Only print what would run. Stages after a stage that would run are reported as pending.
+
+    Returns
+    -------
+    status : dict
+        {stage name: 'skipped', 'done', 'failed', 'blocked' or 'pending'}
+    """
+
+    os.makedirs(os.path.join(state_dir, "logs"), exist_ok=True)
+    state_path = os.path.join(state_dir, "pipeline_state.json")
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    hashes = HashCache(os.path.join(state_dir, "hash_cache.json"))
+    names = {stage.name for stage in stages}
+    by_name = {stage.name: stage for stage in stages}
+
+    def record(stage_name, status, returncode=None, wall_time=None, peak_rss=None):
+        line = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "stage": stage_name, "status": status,
+                "returncode": returncode, "wall_time_s": wall_time, "peak_rss_mb": peak_rss}
+        with open(os.path.join(state_dir, "runs.jsonl"), "a") as f:
+            f.write(json.dumps(line) + "\n")
+        message = f"{stage_name}: {status}"
+        if wall_time is not None:
+            message += f" in {wall_time:.1f} s, peak RSS {peak_rss:.0f} MB"
+        print(message)
+
+    status = {}
+    running = {}
+    with ProcessPoolExecutor(max_workers=max(1, jobs), max_tasks_per_child=1) as executor:
+        while len(status) < len(stages):
+            for stage in stages:
+                if stage.name in status or stage.name in running.values():
+                    continue
+                # Dependencies outside of the selected stages are expected to be up to date
+                after = [name for name in stage.after if name in names]
+                if any(status.get(name) in ("failed", "blocked", "pending") for name in after):
+                    status[stage.name] = "pending" if dry_run else "blocked"
+                    record(stage.name, status[stage.name])
+                    continue
+                if not all(status.get(name) in ("skipped", "done") for name in after):
+                    continue
+
+                key = stage_key(stage, hashes)
+                previous = state.get(stage.name, {})
+                if (stage.name not in force and key is not None and previous.get("key") == key
+                        and previous.get("outputs") == outputs_hash(stage, hashes)):
+                    status[stage.name] = "skipped"
+                    record(stage.name, "skipped")
+                elif dry_run:
+                    status[stage.name] = "pending"
+                    print(f"{stage.name}: would run {' '.join(stage.command)}")
+                else:
+                    log_path = os.path.join(state_dir, "logs", f"{stage.name}.log")
+                    running[executor.submit(run_stage, stage.command, log_path)] = stage.name
+                    print(f"{stage.name}: running (log: {log_path})")
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = by_name[running.pop(future)]
+                returncode, wall_time, peak_rss = future.result()
+                if returncode == 0:
+                    status[stage.name] = "done"
+                    state[stage.name] = {"key": stage_key(stage, hashes), "outputs": outputs_hash(stage, hashes)}
+                    _write_atomic(state_path, lambda f: f.write(json.dumps(state, indent=1).encode()))
+                else:
+                    status[stage.name] = "failed"
+                record(stage.name, status[stage.name], returncode, wall_time, peak_rss)
+            hashes.save()
+
+    hashes.save()
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the antiSMASH pipeline (01 to 06), skipping the stages that are up to date.")
+    parser.add_argument('config', type=str, help='JSON file with the paths of the pipeline (see pipeline.example.json)')
+    parser.add_argument('--state-dir', type=str, default=None,
+                        help='Directory of the pipeline state, logs and run records (default: "state_dir" of the config)')
+    parser.add_argument('--jobs', type=int, default=2, help='Maximum number of stages running at the same time (default: 2)')
+    parser.add_argument('--stages', nargs='+', default=None, help='Only consider these stages (default: all)')
+    parser.add_argument('--force', nargs='+', default=[], help='Run these stages even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the stages that would run')
+
+    args = parser.parse_args()
+
+    with open(args.config, "r") as f:
+        config = json.load(f)
+
+    stages = pipeline_stages(config)
+    known = [stage.name for stage in stages]
+    for name in (args.stages or []) + args.force:
+        if name not in known:
+            parser.error(f"Unknown stage {name}, expected one of {', '.join(known)}")
+    if args.stages is not None:
+        stages = [stage for stage in stages if stage.name in args.stages]
+
+    status = run_pipeline(stages, args.state_dir or config["state_dir"], jobs=args.jobs, force=args.force, dry_run=args.dry_run)
+    if any(value in ("failed", "blocked") for value in status.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from functions import load_table
+
+# Value columns of each source table, and the column holding the product type of the references
+SOURCES = {
+    "known_cluster": {"reference": "accession", "values": ["similarity"], "product": "cluster_type"},
+    "cluster_blast": {"reference": "accession", "values": ["similarity", "synteny_score", "hits", "core_gene_hits"],
+                      "product": "cluster_type"},
+    "similarity_score": {"reference": "reference", "values": None, "product": "type"}
+}
+
+AGGREGATIONS = ("max", "mean", "sum", "count")
+
+class SparseMatrix:
+    """
+    Sparse matrix of scores of sequences or MAGs (rows) against references (columns), e.g. MIBiG clusters.
+
+    Only the cells with a score are stored, as coordinates sorted by row then column, so memory and
+    files grow with the number of hits instead of rows x columns.
+
+    Attributes
+    ----------
+    row_labels, col_labels : ndarray of str
+        Labels of the rows and columns.
+    rows, cols : ndarray of int32
+        Row and column of each stored cell.
+    values : ndarray of float32
+        Value of each stored cell.
+    col_groups : dict
+        Group of each column label, e.g. the product type of each reference, used by rollup.
+    value_name : str
+        Name of the values, e.g. 'max similarity'.
+    """
+
+    def __init__(self, row_labels, col_labels, rows, cols, values, col_groups: dict = None, value_name: str = "value"):
+        self.row_labels = np.asarray(row_labels, dtype=str)
+        self.col_labels = np.asarray(col_labels, dtype=str)
+        order = np.lexsort((cols, rows))
+        self.rows = np.asarray(rows, dtype=np.int32)[order]
+        self.cols = np.asarray(cols, dtype=np.int32)[order]
+        self.values = np.asarray(values, dtype=np.float32)[order]
+        self.col_groups = col_groups or {}
+        self.value_name = value_name
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.row_labels), len(self.col_labels)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.values)
+
+    def __repr__(self):
+        return f"SparseMatrix({self.shape[0]} x {self.shape[1]}, {self.nnz} cells, {self.value_name})"
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame, row: str, col: str, value: str, how: str = "max",
+                  col_groups: dict = None, value_name: str = None) -> "SparseMatrix":
+        """
+        Build the matrix from a long table, aggregating the values of the same row and column.
+
+        Parameters
+        ----------
+        df : DataFrame
+            One row per score.
+        row, col, value : str
+            Columns of the row labels, column labels and values.
+        how : str
+            Aggregation of duplicate cells: 'max', 'mean', 'sum' or 'count'.
+        col_groups : dict, optional
+            Group of each column label (see rollup).
+        value_name : str, optional
+            Name of the values, '{how} {value}' by default.
+
+        Returns
+        -------
+        matrix : SparseMatrix
+        """
+
+        if how not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation {how}, expected one of {AGGREGATIONS}")
+        df = df[[row, col, value]].dropna()
+        row_codes, row_labels = pd.factorize(df[row], sort=True)
+        col_codes, col_labels = pd.factorize(df[col], sort=True)
+        cells = (pd.DataFrame({"row": row_codes, "col": col_codes, "value": df[value].to_numpy(dtype=np.float64)})
+                   .groupby(["row", "col"], sort=False)["value"].agg(how)
+                   .reset_index())
+        return cls(row_labels, col_labels, cells["row"], cells["col"], cells["value"],
+                   col_groups=col_groups, value_name=value_name or f"{how} {value}")
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long table of the stored cells: row, col and value."""
+        return pd.DataFrame({"row": self.row_labels[self.rows], "col": self.col_labels[self.cols], "value": self.values})
+
+    def to_dense(self, rows: list = None, cols: list = None) -> pd.DataFrame:
+        """
+        Dense DataFrame of some rows and columns, e.g. for a heatmap. Cells without a score are NaN.
+
+        Parameters
+        ----------
+        rows, cols : list of str, optional
+            Labels to keep, all by default. Selecting them keeps the dense table small.
+        """
+
+        keep = np.ones(self.nnz, dtype=bool)
+        row_labels, col_labels = self.row_labels, self.col_labels
+        if rows is not None:
+            keep &= np.isin(self.row_labels[self.rows], rows)
+            row_labels = np.asarray(rows, dtype=str)
+        if cols is not None:
+            keep &= np.isin(self.col_labels[self.cols], cols)
+            col_labels = np.asarray(cols, dtype=str)
+        dense = pd.DataFrame(np.nan, index=pd.Index(row_labels, name="row"), columns=col_labels, dtype=np.float32)
+        row_positions = dense.index.get_indexer(self.row_labels[self.rows[keep]])
+        col_positions = dense.columns.get_indexer(self.col_labels[self.cols[keep]])
+        dense.values[row_positions, col_positions] = self.values[keep]
+        return dense
+
+    def to_scipy(self):
+        """The matrix as a scipy.sparse CSR matrix, with missing cells as 0."""
+        try:
+            from scipy.sparse import csr_matrix
+        except ImportError:
+            raise ImportError("scipy is required to convert the matrix to scipy.sparse (pip install scipy)")
+        return csr_matrix((self.values, (self.rows, self.cols)), shape=self.shape)
+
+    def rollup(self, row_groups: dict = None, col_groups: dict = None, how: str = "max") -> "SparseMatrix":
+        """
+        Aggregate rows and/or columns by group, e.g. MAGs by taxon or references by product type.
+
+        Parameters
+        ----------
+        row_groups : dict, optional
+            Group of each row label, e.g. {MAG: taxon}. Rows without a group are dropped.
+        col_groups : dict, optional
+            Group of each column label. 'product' uses the product types of the references (col_groups of the matrix).
+            Columns without a group are dropped.
+        how : str
+            Aggregation of the cells of a group: 'max', 'mean', 'sum' or 'count' (number of cells with a score).
+
+        Returns
+        -------
+        matrix : SparseMatrix
+        """
+
+        if col_groups == "product":
+            col_groups = self.col_groups
+        df = self.to_frame()
+        if row_groups is not None:
+            df["row"] = df["row"].map(row_groups)
+        if col_groups is not None:
+            df["col"] = df["col"].map(col_groups)
+        dropped = int(df[["row", "col"]].isna().any(axis=1).sum())
+        if dropped:
+            print(f"{dropped} cells without a group are not part of the rollup")
+        return SparseMatrix.from_long(df, "row", "col", "value", how=how, value_name=f"{how} of {self.value_name}")
+
+    def save(self, path: str) -> None:
+        """Save the matrix as a compressed .npz file (coordinates, values, labels and column groups)."""
+        np.savez_compressed(path, rows=self.rows, cols=self.cols, values=self.values,
+                            row_labels=self.row_labels, col_labels=self.col_labels,
+                            meta=np.array(json.dumps({"col_groups": self.col_groups, "value_name": self.value_name})))
+
+    @classmethod
+    def load(cls, path: str) -> "SparseMatrix":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(data["row_labels"], data["col_labels"], data["rows"], data["cols"], data["values"],
+                       col_groups=meta["col_groups"], value_name=meta["value_name"])
+
+def mag_of(sequences: pd.Series) -> pd.Series:
+    """MAG of each antiSMASH record id, the id without its last '_<contig index>' field (e.g. MAG00001_4 -> MAG00001)."""
+    return sequences.str.rsplit("_", n=1).str[0]
+
+def build_matrix(tables_dir: str, source: str = "known_cluster", value: str = "similarity", by: str = "mag",
+                 how: str = "max") -> SparseMatrix:
+    """
+    Build the matrix of MAGs or sequences against references from a table written by 02_process_antismash_json.py.
+
+    Only the needed columns are read, and the table is never pivoted.
+
+    Parameters
+    ----------
+    tables_dir : str
+        Output directory of 02_process_antismash_json.py (CSV or Parquet tables).
+    source : str
+        'known_cluster' (KnownClusterBlast similarity of each MIBiG accession),
+        'cluster_blast' (ClusterBlast similarity, synteny_score, hits or core_gene_hits of each antiSMASH
+        database record) or 'similarity_score' (cluster_compare analyses, e.g. RegionToRegion_RiQ, of each reference).
+    value : str
+        Column of the source table used as value.
+    by : str
+        'mag' or 'sequence'. MAGs are taken from the mag column if present, otherwise from the sequence ids.
+    how : str
+        Aggregation of the values of the same row and reference, 'max' by default.
+
+    Returns
+    -------
+    matrix : SparseMatrix
+    """
+
+    if source not in SOURCES:
+        raise ValueError(f"Unknown source {source}, expected one of {list(SOURCES)}")
+    if by not in ("mag", "sequence"):
+        raise ValueError(f"Unknown rows {by}, expected 'mag' or 'sequence'")
+    spec = SOURCES[source]
+    if spec["values"] is not None and value not in spec["values"]:
+        raise ValueError(f"Unknown value {value} for {source}, expected one of {spec['values']}")
+
+    columns = ["sequence", spec["reference"], spec["product"], value]
+    try:
+        df = load_table(tables_dir, source, columns=columns + ["mag"] if by == "mag" else columns)
+    except (ValueError, KeyError):
+        # CSV tables written without the mag column
+        df = load_table(tables_dir, source, columns=columns)
+    if by == "mag" and "mag" not in df.columns:
+        df["mag"] = mag_of(df["sequence"])
+
+    products = (df[[spec["reference"], spec["product"]]].dropna()
+                  .drop_duplicates(spec["reference"])
+                  .set_index(spec["reference"])[spec["product"]].astype(str).to_dict())
+    return SparseMatrix.from_long(df, by, spec["reference"], value, how=how, col_groups=products)
+
+def read_groups(path: str, key: str, group: str) -> dict:
+    """Groups of the rows from a CSV or TSV file, e.g. a taxonomy table with one row per MAG."""
+    df = pd.read_csv(path, sep=None, engine="python", usecols=[key, group])
+    return df.dropna().drop_duplicates(key).set_index(key)[group].astype(str).to_dict()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sparse matrix of MAGs or sequences against MIBiG clusters or other references, and its rollups.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build the matrix from the tables of 02_process_antismash_json.py")
+    build.add_argument('tables_dir', type=str, help='Output directory of 02_process_antismash_json.py')
+    build.add_argument('output', type=str, help='Matrix file (.npz)')
+    build.add_argument('--source', choices=list(SOURCES), default='known_cluster',
+                       help='Source table: known_cluster (MIBiG clusters), cluster_blast (antiSMASH database records) or similarity_score (default: known_cluster)')
+    build.add_argument('--value', type=str, default='similarity',
+                       help='Value column: similarity for known_cluster, similarity, synteny_score, ... for cluster_blast, an analysis (e.g. RegionToRegion_RiQ) for similarity_score (default: similarity)')
+    build.add_argument('--by', choices=['mag', 'sequence'], default='mag', help='Rows of the matrix (default: mag)')
+    build.add_argument('--how', choices=AGGREGATIONS, default='max', help='Aggregation of the values of a cell (default: max)')
+
+    rollup = subparsers.add_parser("rollup", help="Aggregate a matrix by product type and/or taxon")
+    rollup.add_argument('matrix', type=str, help='Matrix file (.npz)')
+    rollup.add_argument('output', type=str, help='Output CSV')
+    rollup.add_argument('--product', action='store_true', help='Aggregate the references by product type')
+    rollup.add_argument('--taxonomy', type=str, default=None, help='CSV or TSV file with the taxon of each row (MAG or sequence)')
+    rollup.add_argument('--key-column', type=str, default='mag', help='Column of the rows in the taxonomy file (default: mag)')
+    rollup.add_argument('--taxon-column', type=str, default='taxon', help='Column of the taxa in the taxonomy file (default: taxon)')
+    rollup.add_argument('--how', choices=AGGREGATIONS, default='max', help='Aggregation of the cells of a group (default: max)')
+    rollup.add_argument('--wide', action='store_true', help='Write one column per reference or product instead of one row per cell')
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        matrix = build_matrix(args.tables_dir, source=args.source, value=args.value, by=args.by, how=args.how)
+        matrix.save(args.output)
+        print(f"{matrix} saved to {args.output}")
+        return
+
+    matrix = SparseMatrix.load(args.matrix)
+    if not args.product and args.taxonomy is None:
+        parser.error("rollup requires --product and/or --taxonomy")
+    row_groups = read_groups(args.taxonomy, args.key_column, args.taxon_column) if args.taxonomy else None
+    result = matrix.rollup(row_groups=row_groups, col_groups="product" if args.product else None, how=args.how)
+    df = result.to_dense() if args.wide else result.to_frame()
+    df.to_csv(args.output, index=args.wide)
+    print(f"{result} written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in for blastn to run 05_blast_ctg.py locally: one outfmt 6 line per query record.")
+    parser.add_argument('-query', required=True)
+    parser.add_argument('-out', required=True)
+    parser.add_argument('-db', default="db")
+    parser.add_argument('-outfmt', default="6")
+    parser.add_argument('-evalue', default="10")
+    parser.add_argument('-num_threads', default="1")
+
+    args = parser.parse_args()
+
+    # STUB_BLASTN_FAIL=<query id> makes the shard of this query fail, STUB_BLASTN_SLEEP delays each shard
+    time.sleep(float(os.environ.get("STUB_BLASTN_SLEEP", 0)))
+    with open(args.query, "r") as query, open(args.out, "w") as out:
+        for line in query:
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+                if name == os.environ.get("STUB_BLASTN_FAIL"):
+                    sys.exit(f"stub failure on {name}")
+                out.write(f"{name}\t{os.path.basename(args.db)}_hit\t100.000\t100\t0\t0\t1\t100\t1\t100\t{args.evalue}\t185\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import json
+import random
+import argparse
+
+PRODUCTS = ["NRPS", "T1PKS", "T3PKS", "lanthipeptide", "RiPP-like", "terpene", "betalactone", "arylpolyene"]
+ANALYSES = ["ProtoToRegion_RiQ", "RegionToRegion_RiQ"]
+
+def make_reference(rng: random.Random, n_references: int) -> dict:
+    """Reference cluster of a ClusterBlast or KnownClusterBlast hit."""
+    number = rng.randint(1, n_references)
+    return {
+        "accession": f"BGC{number:07d}",
+        "cluster_label": f"BGC{number:07d}_c1",
+        "description": f"compound {number}",
+        "cluster_type": rng.choice(PRODUCTS),
+        "tags": [],
+        "proteins": [f"BGC{number:07d}_p{i}" for i in range(rng.randint(1, 20))]
+    }
+
+def make_score(rng: random.Random, record_id: str, ctg: str, n_pairings: int) -> dict:
+    """Score of a ClusterBlast or KnownClusterBlast hit, with its BLAST pairings."""
+    pairings = []
+    for i in range(n_pairings):
+        start = rng.randint(0, 50000)
+        pairings.append([
+            f"input|c1|{start}-{start + rng.randint(300, 3000)}|{rng.choice('+-')}|{ctg}_{i + 1}|hypothetical protein|{ctg}_{i + 1}",
+            i,
+            {
+                "name": f"ref_{i}",
+                "genecluster": "c1",
+                "annotation": "hypothetical protein",
+                "perc_coverage": round(rng.uniform(30, 100), 1),
+                "perc_ident": round(rng.uniform(30, 100), 1),
+                "blastscore": rng.randint(50, 2000),
+                "evalue": rng.choice([0.0, 1e-150, 3.2e-45, 1e-10]),
+                "locus_tag": f"ref_{i}"
+            }
+        ])
+    return {
+        "hits": rng.randint(1, 20),
+        "core_gene_hits": rng.randint(0, 5),
+        "blast_score": rng.randint(100, 20000),
+        "synteny_score": rng.randint(0, 10),
+        "core_bonus": rng.choice([0, 3]),
+        "similarity": rng.randint(1, 100),
+        "pairings": pairings
+    }
+
+def make_record(rng: random.Random, record_id: str, relevant: bool = True, n_regions: int = 3, n_hits: int = 10,
+                n_pairings: int = 5, n_references: int = 2500, seq_length: int = 10000) -> dict:
+    """
+    Build one antiSMASH-shaped record.
+
+    Parameters
+    ----------
+    rng : random.Random
+    record_id : str
+        Record id, e.g. MAG00001_1.
+    relevant : bool
+        If False, the record only has the 2 detection modules and is rejected by get_index.
+    n_regions : int
+        Number of regions (areas) of the record.
+    n_hits : int
+        Maximum number of ClusterBlast / KnownClusterBlast hits per region.
+    n_pairings : int
+        Maximum number of BLAST pairings per hit.
+    n_references : int
+        Number of distinct MIBiG references to draw from.
+    seq_length : int
+        Length of the record sequence.
+
+    Returns
+    -------
+    record : dict
+    """
+
+    ctg = record_id.replace("_", "")
+    record = {
+        "id": record_id,
+        "seq": {"data": "".join(rng.choices("ACGT", k=seq_length))},
+        "features": [
+            {"location": f"[{i * 1000}:{i * 1000 + 900}](+)", "type": "CDS", "id": f"{ctg}_{i + 1}",
+             "qualifiers": {"locus_tag": [f"{ctg}_{i + 1}"], "translation": ["M" * 30]}}
+            for i in range(seq_length // 1000)
+        ],
+        "name": record_id,
+        "description": record_id,
+        "dbxrefs": [],
+        "annotations": {"molecule_type": "DNA"},
+        "letter_annotations": {},
+        "areas": [],
+        "modules": {
+            "antismash.detection.hmm_detection": {"record_id": record_id, "rule_results": {}},
+            "antismash.detection.full_hmmer": {"record_id": record_id, "hits": []}
+        }
+    }
+    if not relevant:
+        return record
+
+    general, knowncluster, by_region = [], [], {}
+    mibig_entries = {}
+    for region in range(1, n_regions + 1):
+        start = (region - 1) * seq_length // n_regions
+        record["areas"].append({
+            "start": start,
+            "end": start + seq_length // n_regions,
+            "products": rng.sample(PRODUCTS, rng.randint(1, 2)),
+            "protoclusters": {},
+            "candidates": []
+        })
+        general.append({
+            "region_number": region,
+            "ranking": [[make_reference(rng, n_references), make_score(rng, record_id, ctg, rng.randint(1, n_pairings))]
+                        for _ in range(rng.randint(0, n_hits))],
+            "total_hits": n_hits
+        })
+        knowncluster.append({
+            "region_number": region,
+            "ranking": [[make_reference(rng, n_references), make_score(rng, record_id, ctg, rng.randint(1, n_pairings))]
+                        for _ in range(rng.randint(0, n_hits))],
+            "total_hits": n_hits
+        })
+        mibig_entries[str(region)] = {
+            f"{ctg}_{gene}": [
+                [f"BGC{number:07d}_p{gene}", "hypothetical protein", f"BGC{number:07d}", f"{region}",
+                 rng.choice(PRODUCTS), rng.randint(30, 100), rng.randint(50, 2000), round(rng.uniform(30, 100), 1), 1e-30]
+                for number in (rng.randint(1, n_references) for _ in range(rng.randint(1, 3)))
+            ]
+            for gene in range(1, rng.randint(1, n_pairings) + 1)
+        }
+
+        references = [f"BGC{rng.randint(1, n_references):07d}" for _ in range(rng.randint(0, n_hits))]
+        by_region[str(region)] = {
+            analysis: {
+                "hits": {
+                    reference: {
+                        f"{ctg}_{gene}": {f"{reference}_p{gene}": round(rng.random(), 3)}
+                        for gene in range(1, rng.randint(1, 4) + 1)
+                    }
+                    for reference in references
+                } if analysis == "ProtoToRegion_RiQ" else {},
+                "scores_by_region": {f"{reference}: {i * 1000}-{i * 1000 + 900}": round(rng.random(), 3)
+                                     for i, reference in enumerate(references)},
+                "reference_regions": {f"{reference}: {i * 1000}-{i * 1000 + 900}": {
+                    "accession": reference,
+                    "products": [rng.choice(PRODUCTS)],
+                    "description": f"compound {reference}",
+                    "organism": "Lactobacillus crispatus"
+                } for i, reference in enumerate(references)}
+            }
+            for analysis in ANALYSES
+        }
+
+    record["modules"]["antismash.modules.clusterblast"] = {
+        "record_id": record_id,
+        "schema_version": 2,
+        "general": {"record_id": record_id, "results": general},
+        "knowncluster": {"record_id": record_id, "results": knowncluster, "mibig_entries": mibig_entries}
+    }
+    record["modules"]["antismash.modules.cluster_compare"] = {
+        "db_results": {"MIBiG": {"by_region": by_region}}
+    }
+    return record
+
+def write_batch(out_dir: str, n_mags: int = 10, n_records: int = 20, relevant_fraction: float = 0.3, seed: int = 0, **kwargs) -> list:
+    """
+    Write a batch of synthetic antiSMASH JSON files, one per MAG.
+
+    Parameters
+    ----------
+    out_dir : str
+        Output directory.
+    n_mags : int
+        Number of JSON files.
+    n_records : int
+        Number of records per JSON file.
+    relevant_fraction : float
+        Fraction of records with results, the others are rejected by get_index.
+    seed : int
+        Seed of the random generator, the same seed gives the same files.
+    **kwargs
+        Passed to make_record (n_regions, n_hits, n_pairings, n_references, seq_length).
+
+    Returns
+    -------
+    paths : list of str
+        Paths of the JSON files.
+    """
+
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for mag in range(1, n_mags + 1):
+        name = f"MAG{mag:05d}"
+        records = [make_record(rng, f"{name}_{i}", relevant=rng.random() < relevant_fraction, **kwargs)
+                   for i in range(1, n_records + 1)]
+        path = os.path.join(out_dir, f"{name}.json")
+        with open(path, 'w') as f:
+            json.dump({"version": "7.1.0", "input_file": f"{name}.fasta", "records": records,
+                       "timings": {}, "taxon": "bacteria", "schema": 1}, f)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic antiSMASH JSON files.")
+    parser.add_argument('out_dir', type=str, help='Output directory')
+    parser.add_argument('--mags', type=int, default=10, help='Number of JSON files (default: 10)')
+    parser.add_argument('--records', type=int, default=20, help='Number of records per JSON file (default: 20)')
+    parser.add_argument('--regions', type=int, default=3, help='Number of regions per record (default: 3)')
+    parser.add_argument('--hits', type=int, default=10, help='Maximum number of hits per region (default: 10)')
+    parser.add_argument('--pairings', type=int, default=5, help='Maximum number of BLAST pairings per hit (default: 5)')
+    parser.add_argument('--references', type=int, default=2500, help='Number of distinct MIBiG references (default: 2500)')
+    parser.add_argument('--seq-length', type=int, default=10000, help='Length of the record sequences (default: 10000)')
+    parser.add_argument('--relevant-fraction', type=float, default=0.3,
+                        help='Fraction of records with clusterblast and cluster_compare results (default: 0.3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+
+    args = parser.parse_args()
+    write_batch(args.out_dir, n_mags=args.mags, n_records=args.records, relevant_fraction=args.relevant_fraction, seed=args.seed,
+                n_regions=args.regions, n_hits=args.hits, n_pairings=args.pairings, n_references=args.references,
+                seq_length=args.seq_length)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import subprocess
+import pandas as pd
+from blast_tabular import iter_hits
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# antiSMASH genes as queries (gene headers in qseqid): gene a is 100 bp, gene b is 200 bp
+HITS = [
+    ["MAG1/ctg1/1/100/+", "virgo1", 99.0, 90, 0, 0, 1, 90, 1, 90, 1e-40, 170.0],
+    ["MAG1/ctg1/1/100/+", "virgo2", 99.0, 50, 0, 0, 1, 50, 1, 50, 1e-50, 190.0],
+    ["MAG1/ctg2/1/200/-", "virgo3", 95.0, 10, 0, 0, 1, 10, 1, 10, 1e-5, 20.0],
+]
+
+def write_hits(tmp_path) -> str:
+    path = os.path.join(tmp_path, "hits.txt")
+    with open(path, 'w') as f:
+        for hit in HITS:
+            f.write("\t".join(map(str, hit)) + "\n")
+    return path
+
+def test_iter_hits_qseqid_headers_with_min_coverage(tmp_path):
+    hits = pd.concat(iter_hits(write_hits(tmp_path), top_k=1, header_col="qseqid", min_coverage=60))
+    # The best hit of gene a (virgo2) only covers 50% of it, so virgo1 is kept; gene b is filtered out
+    assert hits["sseqid"].tolist() == ["virgo1"]
+    assert hits[["sequence", "ctg", "Start", "End", "Strand"]].values.tolist() == [["MAG1", "ctg1", 1, 100, "+"]]
+    assert hits["gene_coverage"].tolist() == [90.0]
+
+def test_parse_blast_results_qseqid_headers_with_min_coverage(tmp_path):
+    output = os.path.join(tmp_path, "hits.csv")
+    subprocess.run([sys.executable, os.path.join(HERE, "06_parse_blast_results.py"), write_hits(tmp_path), output,
+                    "--headers", "qseqid", "--min-coverage", "10"], check=True, cwd=HERE)
+    hits = pd.read_csv(output)
+    assert hits["sseqid"].tolist() == ["virgo2"]
+    assert "qseqid" not in hits.columns
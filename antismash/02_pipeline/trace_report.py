@@ -0,0 +1,14 @@
+import argparse
+from functions import print_trace_summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the slowest files and heaviest tables of a parse_json trace (02_process_antismash_json.py --trace).")
+    parser.add_argument('trace', type=str, help='JSON-lines trace file, possibly of a job that did not finish')
+    parser.add_argument('--top', type=int, default=10, help='Number of files reported (default: 10)')
+
+    args = parser.parse_args()
+
+    print_trace_summary(args.trace, top=args.top)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import multiprocessing
+import cv2
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from cells_recognition import (CELL_RANGES, NUCLEUS_RANGES, KERNEL_SIZE, MIN_AREA, METHODS, detect, segment,
+                               segment_masks, _components)
+
+SIZES = [512, 1024, 2048]
+DENSITY = 100
+CELL_RADIUS = (20, 40)
+NUCLEUS_RATIO = (0.3, 0.45)
+OVERLAP = 0.1
+NOISE = 8.0
+
+# Colors of the synthetic images, as HSV ranges (OpenCV hues, 0 to 180) inside the default thresholds
+BACKGROUND_HSV = (150, 12, 235)
+CELL_HSV = ((0, 5), (120, 220), (150, 230))
+NUCLEUS_HSV = ((105, 130), (170, 240), (90, 200))
+
+def _bgr(hsv: tuple) -> tuple:
+    """BGR color of one (h, s, v) color."""
+    return tuple(int(value) for value in cv2.cvtColor(np.uint8([[hsv]]), cv2.COLOR_HSV2BGR)[0, 0])
+
+def _random_hsv(rng: np.random.Generator, ranges: tuple) -> tuple:
+    return tuple(int(rng.integers(low, high + 1)) for low, high in ranges)
+
+def synthetic_image(height: int, width: int, density: float = DENSITY, cell_radius: tuple = CELL_RADIUS,
+                    nucleus_ratio: tuple = NUCLEUS_RATIO, overlap: float = OVERLAP, noise: float = NOISE,
+                    min_gap: int = 2 * KERNEL_SIZE, seed: int = 0) -> tuple:
+    """
+    Synthetic stained-cell image with its ground truth: red elliptic cells on a pale background, each
+    with one blue elliptic nucleus, plus Gaussian noise.
+
+    Parameters
+    ----------
+    height, width : int
+    density : float
+        Number of cells per megapixel. Fewer cells are drawn when no free position is found.
+    cell_radius : (min, max)
+        Range of the major radius of the cells, in pixels. The minor radius is 70 to 100% of it.
+    nucleus_ratio : (min, max)
+        Range of the radius of the nuclei relative to their cell.
+    overlap : float
+        Fraction of the cells placed anywhere, possibly over other cells. The others are kept at least
+        min_gap pixels away from all cells, so that the closing does not merge them.
+    noise : float
+        Standard deviation of the Gaussian noise added to each channel.
+    min_gap : int
+    seed : int
+
+    Returns
+    -------
+    image : ndarray
+        BGR image (uint8).
+    truth : dict
+        "cell" and "nucleus": label images (int32, 0 for the background), a cell covering its nucleus
+        and later cells covering earlier ones; "n_cell" and "n_nucleus": number of objects still visible.
+    """
+
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), np.uint8)
+    image[:] = _bgr(BACKGROUND_HSV)
+    cell_labels = np.zeros((height, width), np.int32)
+    nucleus_labels = np.zeros((height, width), np.int32)
+
+    placed = []
+    n_cell = int(round(density * height * width / 1e6))
+    for label in range(1, n_cell + 1):
+        radius = rng.uniform(*cell_radius)
+        anywhere = rng.random() < overlap
+        for _ in range(50):
+            x, y = rng.uniform(0, width), rng.uniform(0, height)
+            if anywhere or all(np.hypot(x - px, y - py) >= radius + pr + min_gap for px, py, pr in placed):
+                break
+        else:
+            continue
+        placed.append((x, y, radius))
+
+        axes = (int(round(radius)), int(round(radius * rng.uniform(0.7, 1))))
+        angle = rng.uniform(0, 180)
+        center = (int(round(x)), int(round(y)))
+        cv2.ellipse(image, center, axes, angle, 0, 360, _bgr(_random_hsv(rng, CELL_HSV)), -1)
+        cv2.ellipse(cell_labels, center, axes, angle, 0, 360, label, -1)
+        cv2.ellipse(nucleus_labels, center, axes, angle, 0, 360, 0, -1)
+
+        ratio = rng.uniform(*nucleus_ratio)
+        nucleus_axes = (max(1, int(round(axes[0] * ratio))), max(1, int(round(axes[1] * ratio))))
+        shift = (axes[1] - nucleus_axes[1]) * rng.uniform(0, 0.5)
+        theta = rng.uniform(0, 2 * np.pi)
+        nucleus_center = (int(round(x + shift * np.cos(theta))), int(round(y + shift * np.sin(theta))))
+        nucleus_angle = rng.uniform(0, 180)
+        cv2.ellipse(image, nucleus_center, nucleus_axes, nucleus_angle, 0, 360, _bgr(_random_hsv(rng, NUCLEUS_HSV)), -1)
+        cv2.ellipse(nucleus_labels, nucleus_center, nucleus_axes, nucleus_angle, 0, 360, label, -1)
+
+    if noise > 0:
+        # Row blocks, to keep the noise arrays small on large images
+        for y in range(0, height, 1024):
+            block = image[y:y + 1024].astype(np.int16)
+            block += rng.normal(0, noise, block.shape).round().astype(np.int16)
+            image[y:y + 1024] = np.clip(block, 0, 255).astype(np.uint8)
+
+    truth = {"cell": cell_labels, "nucleus": nucleus_labels,
+             "n_cell": len(np.unique(cell_labels)) - 1, "n_nucleus": len(np.unique(nucleus_labels)) - 1}
+    return image, truth
+
+def predicted_masks(image: np.ndarray, params: dict, method: str) -> dict:
+    """
+    Counts and masks of the detected cells and nuclei.
+
+    With 'contours', the masks are the filled contours of detect; with 'components', the kept components
+    of segment (holes filled), so the masks cover what each method counts.
+    """
+
+    result = {}
+    if method == "contours":
+        contours = detect(image, **params)
+        for kind, kind_contours in contours.items():
+            mask = np.zeros(image.shape[:2], np.uint8)
+            cv2.drawContours(mask, kind_contours, -1, 1, cv2.FILLED)
+            result[kind] = (len(kind_contours), mask.astype(bool))
+    else:
+        masks = segment_masks(image, params["cell_ranges"], params["nucleus_ranges"], params["kernel_size"])
+        for kind, mask in zip(("cell", "nucleus"), masks):
+            labels, keep, _ = _components(mask, params["min_area"])
+            result[kind] = (len(keep), np.isin(labels, keep))
+    return result
+
+def iou(predicted: np.ndarray, truth: np.ndarray) -> float:
+    """Intersection over union of two boolean masks, 1 if both are empty."""
+    union = np.count_nonzero(predicted | truth)
+    return np.count_nonzero(predicted & truth) / union if union else 1.0
+
+def _reset_peak_memory() -> None:
+    """Reset the peak resident memory of the process (Linux), which is otherwise inherited from the parent process."""
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _memory_mb(field: str) -> float:
+    """
+    Resident memory of the process in MB: 'VmRSS' (current) or 'VmHWM' (peak) of /proc/self/status.
+
+    Without /proc, the peak is ru_maxrss and the current memory is unknown (nan).
+    """
+
+    try:
+        with open("/proc/self/status", 'r') as f:
+            status = dict(line.split(":", 1) for line in f)
+        return int(status[field].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        if field != "VmHWM":
+            return np.nan
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def run_size(directory: str, n_images: int, params: dict, method: str) -> dict:
+    """
+    Benchmark one method on the images of one size, written by generate_images.
+
+    Run in a new process, so that the peak memory is that of this method and size only. The images
+    are first segmented one after the other for the timing and the peak memory (increase of the
+    resident memory of the process, reading one image included), then again against the
+    ground truth for the counts and IoU.
+    """
+
+    cv2.setNumThreads(1)
+    _reset_peak_memory()
+    baseline = _memory_mb("VmRSS")
+    elapsed = 0
+    pixels = 0
+    for i in range(n_images):
+        image = np.load(os.path.join(directory, f"image_{i}.npy"))
+        pixels += image.shape[0] * image.shape[1]
+        start = time.perf_counter()
+        if method == "contours":
+            detect(image, **params)
+        else:
+            segment(image, **params)
+        elapsed += time.perf_counter() - start
+        del image
+    row = {"method": method, "n_images": n_images, "images_per_s": n_images / elapsed,
+           "mpixels_per_s": pixels / elapsed / 1e6, "peak_mb": _memory_mb("VmHWM") - baseline}
+
+    scores = []
+    for i in range(n_images):
+        image = np.load(os.path.join(directory, f"image_{i}.npy"))
+        truth = np.load(os.path.join(directory, f"truth_{i}.npz"))
+        score = {}
+        for kind, (count, mask) in predicted_masks(image, params, method).items():
+            score[f"n_{kind}_true"] = int(truth[f"n_{kind}"])
+            score[f"n_{kind}_separable"] = int(truth[f"n_{kind}_separable"])
+            score[f"n_{kind}"] = count
+            score[f"{kind}_count_error"] = count - int(truth[f"n_{kind}"])
+            score[f"{kind}_iou"] = iou(mask, truth[kind])
+        scores.append(score)
+    row.update(pd.DataFrame(scores).mean().to_dict())
+    return row
+
+def generate_images(directory: str, size: int, n_images: int, seed: int, **options) -> None:
+    """Write n_images synthetic images of size x size pixels and their ground truth masks to directory."""
+    for i in range(n_images):
+        image, truth = synthetic_image(size, size, seed=seed + i, **options)
+        np.save(os.path.join(directory, f"image_{i}.npy"), image)
+        # Touching objects are seen as one by any threshold: number of connected components of the truth
+        separable = {kind: cv2.connectedComponents((truth[kind] > 0).astype(np.uint8), connectivity=8)[0] - 1
+                     for kind in ("cell", "nucleus")}
+        np.savez_compressed(os.path.join(directory, f"truth_{i}.npz"),
+                            cell=truth["cell"] > 0, nucleus=truth["nucleus"] > 0,
+                            n_cell=truth["n_cell"], n_nucleus=truth["n_nucleus"],
+                            n_cell_separable=separable["cell"], n_nucleus_separable=separable["nucleus"])
+
+def save_overlay(path: str, image: np.ndarray, truth: dict, params: dict, method: str) -> None:
+    """Write the image with the contours of the ground truth (white) and of the detected objects (green), instead of displaying it."""
+    output = image.copy()
+    for kind, (_, mask) in predicted_masks(image, params, method).items():
+        true_contours, _ = cv2.findContours((truth[kind] > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(output, true_contours, -1, (255, 255, 255), 2)
+        contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(output, contours, -1, (0, 255, 0), 1)
+    cv2.imwrite(path, output)
+
+def benchmark(sizes: list = SIZES, n_images: int = 5, methods: tuple = METHODS, params: dict = None,
+              seed: int = 0, figures: str = None, **options) -> pd.DataFrame:
+    """
+    Speed, peak memory and accuracy of the detection methods on synthetic images of several sizes.
+
+    Parameters
+    ----------
+    sizes : list of int
+        Sides of the square images, in pixels.
+    n_images : int
+        Number of images of each size.
+    methods : tuple
+        Methods of cells_recognition (see count_image).
+    params : dict, optional
+        Keyword arguments of detect and segment.
+    seed : int
+    figures : str, optional
+        Directory where the first image of each size is written with the true and detected contours.
+    **options
+        Options of synthetic_image (density, cell_radius, nucleus_ratio, overlap, noise, min_gap).
+
+    Returns
+    -------
+    results : DataFrame
+        One row per size and method: images/s, Mpixels/s, peak memory (MB), mean true, separable and
+        detected counts, count error (detected - true) and IoU of the cells and of the nuclei.
+    """
+
+    params = {"cell_ranges": CELL_RANGES, "nucleus_ranges": NUCLEUS_RANGES, "kernel_size": KERNEL_SIZE,
+              "min_area": MIN_AREA, **(params or {})}
+    if figures:
+        os.makedirs(figures, exist_ok=True)
+    rows = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_images(directory, size, n_images, seed, **options)
+            if figures:
+                image, truth = synthetic_image(size, size, seed=seed, **options)
+                for method in methods:
+                    save_overlay(os.path.join(figures, f"synthetic_{size}_{method}.png"), image, truth, params, method)
+            for method in methods:
+                # One new process per size and method, for its peak memory
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    row = executor.submit(run_size, directory, n_images, params, method).result()
+                rows.append({"size": size, **row})
+                print(f"{size} x {size}, {method}: {row['images_per_s']:.1f} images/s, {row['peak_mb']:.0f} MB, "
+                      f"cells {row['n_cell']:.1f}/{row['n_cell_true']:.1f} (IoU {row['cell_iou']:.3f}), "
+                      f"nuclei {row['n_nucleus']:.1f}/{row['n_nucleus_true']:.1f} (IoU {row['nucleus_iou']:.3f})")
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cell and nucleus detection on synthetic images with known ground truth.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help=f'Sides of the square images in pixels (default: {SIZES})')
+    parser.add_argument('--images', type=int, default=5, help='Number of images of each size (default: 5)')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS), help='Detection methods (default: all)')
+    parser.add_argument('--density', type=float, default=DENSITY, help=f'Cells per megapixel (default: {DENSITY})')
+    parser.add_argument('--cell-radius', type=float, nargs=2, default=CELL_RADIUS, help=f'Range of the cell radius in pixels (default: {CELL_RADIUS})')
+    parser.add_argument('--nucleus-ratio', type=float, nargs=2, default=NUCLEUS_RATIO,
+                        help=f'Range of the nucleus radius relative to the cell (default: {NUCLEUS_RATIO})')
+    parser.add_argument('--overlap', type=float, default=OVERLAP, help=f'Fraction of the cells that may overlap others (default: {OVERLAP})')
+    parser.add_argument('--noise', type=float, default=NOISE, help=f'Standard deviation of the Gaussian noise (default: {NOISE})')
+    parser.add_argument('--kernel-size', type=int, default=KERNEL_SIZE, help=f'Size of the morphology kernel (default: {KERNEL_SIZE})')
+    parser.add_argument('--min-area', type=float, default=MIN_AREA, help=f'Minimum object area in pixels (default: {MIN_AREA})')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first image (default: 0)')
+    parser.add_argument('--figures', type=str, default=None, help='Directory for images with the true and detected contours')
+    parser.add_argument('--output', type=str, default='benchmark.csv', help='Output table (default: benchmark.csv)')
+
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.images, tuple(args.methods),
+                        params={"kernel_size": args.kernel_size, "min_area": args.min_area}, seed=args.seed,
+                        figures=args.figures, density=args.density, cell_radius=tuple(args.cell_radius),
+                        nucleus_ratio=tuple(args.nucleus_ratio), overlap=args.overlap, noise=args.noise)
+    results.to_csv(args.output, index=False)
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import cv2
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# HSV ranges of cells_recognition.ipynb: red cytoplasm (two ranges, red wraps around hue 0) and blue nuclei.
+# OpenCV hues go from 0 to 180.
+CELL_RANGES = [((0, 70, 50), (10, 255, 255)), ((170, 70, 50), (180, 255, 255))]
+NUCLEUS_RANGES = [((100, 150, 50), (140, 255, 255))]
+KERNEL_SIZE = 5
+MIN_AREA = 50
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+
+def color_mask(hsv_image: np.ndarray, ranges: list) -> np.ndarray:
+    """Union of the cv2.inRange masks of the given (lower, upper) HSV ranges."""
+    mask = None
+    for lower, upper in ranges:
+        range_mask = cv2.inRange(hsv_image, np.array(lower), np.array(upper))
+        mask = range_mask if mask is None else cv2.bitwise_or(mask, range_mask)
+    return mask
+
+def clean_mask(mask: np.ndarray, kernel_size: int = KERNEL_SIZE) -> np.ndarray:
+    """Close then open the mask with a square kernel to fill holes and remove noise."""
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+def find_objects(mask: np.ndarray, min_area: float = MIN_AREA) -> list:
+    """External contours of the mask with an area above min_area."""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [contour for contour in contours if cv2.contourArea(contour) > min_area]
+
+def segment_masks(image: np.ndarray, cell_ranges: list = CELL_RANGES, nucleus_ranges: list = NUCLEUS_RANGES,
+                  kernel_size: int = KERNEL_SIZE) -> tuple:
+    """
+    Cleaned cell and nucleus masks of a BGR image, from one conversion to HSV.
+
+    Returns
+    -------
+    cell_mask, nucleus_mask : ndarray of uint8 (0 or 255)
+    """
+
+    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    return (clean_mask(color_mask(hsv_image, cell_ranges), kernel_size),
+            clean_mask(color_mask(hsv_image, nucleus_ranges), kernel_size))
+
+def detect(image: np.ndarray, cell_ranges: list = CELL_RANGES, nucleus_ranges: list = NUCLEUS_RANGES,
+           kernel_size: int = KERNEL_SIZE, min_area: float = MIN_AREA) -> dict:
+    """
+    Detect cells (red cytoplasm) and nuclei (blue) in a BGR image, as in cells_recognition.ipynb.
+
+    Parameters
+    ----------
+    image : ndarray
+        BGR image, as read by cv2.imread.
+    cell_ranges, nucleus_ranges : list of ((h, s, v), (h, s, v))
+        Lower and upper HSV bounds of the colors of the cells and of the nuclei.
+    kernel_size : int
+        Size of the square kernel of the morphological closing and opening.
+    min_area : float
+        Contours with an area up to min_area pixels are ignored.
+
+    Returns
+    -------
+    contours : dict
+        {"cell": list of contours, "nucleus": list of contours}
+    """
+
+    cell_mask, nucleus_mask = segment_masks(image, cell_ranges, nucleus_ranges, kernel_size)
+    return {"cell": find_objects(cell_mask, min_area), "nucleus": find_objects(nucleus_mask, min_area)}
+
+def fill_holes(mask: np.ndarray) -> np.ndarray:
+    """Mask with its holes filled: the background not connected to the image border becomes foreground."""
+    padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(padded, None, (0, 0), 128)
+    return cv2.compare(padded[1:-1, 1:-1], 128, cv2.CMP_NE)
+
+def _components(mask: np.ndarray, min_area: float) -> tuple:
+    """
+    Labels and statistics of the objects of a mask with its holes filled, keeping objects larger than min_area.
+
+    Returns
+    -------
+    labels : ndarray of int32
+        Label image of connectedComponentsWithStats, including the removed objects.
+    keep : ndarray
+        Labels of the kept objects.
+    objects : dict
+        Statistics of the kept objects (see segment).
+    """
+
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(fill_holes(mask), connectivity=8)
+    keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > min_area) + 1
+    objects = {"area": stats[keep, cv2.CC_STAT_AREA], "bbox": stats[keep, :4], "centroid": centroids[keep]}
+    return labels, keep, objects
+
+def segment(image: np.ndarray, cell_ranges: list = CELL_RANGES, nucleus_ranges: list = NUCLEUS_RANGES,
+            kernel_size: int = KERNEL_SIZE, min_area: float = MIN_AREA) -> dict:
+    """
+    Cells and nuclei of a BGR image with their statistics, from one conversion to HSV (see segment_masks).
+
+    Objects are the 8-connected components of each mask with holes filled, i.e. the regions enclosed by
+    the external contours of detect, and their statistics come from one connectedComponentsWithStats call
+    per mask. Areas are numbers of pixels (cv2.contourArea, used by detect, measures the polygon through
+    the border pixels, which is smaller). Each nucleus is assigned to the cell containing its centroid.
+
+    Parameters
+    ----------
+    image : ndarray
+        BGR image.
+    cell_ranges, nucleus_ranges, kernel_size, min_area
+        See detect. Objects with an area up to min_area pixels are ignored.
+
+    Returns
+    -------
+    objects : dict
+        {"cell": stats, "nucleus": stats}, stats being a dict of arrays with one element per object:
+        area (pixels), bbox (x, y, width, height), centroid (x, y) and, for nuclei, cell (index of the
+        containing cell in the cell arrays, -1 if none).
+    """
+
+    cell_mask, nucleus_mask = segment_masks(image, cell_ranges, nucleus_ranges, kernel_size)
+    cell_labels, kept_cells, cells = _components(cell_mask, min_area)
+    _, _, nuclei = _components(nucleus_mask, min_area)
+
+    # Label of the cell under the centroid of each nucleus, then index of that cell among the kept cells
+    position = np.rint(nuclei["centroid"]).astype(int)
+    under = cell_labels[np.clip(position[:, 1], 0, image.shape[0] - 1), np.clip(position[:, 0], 0, image.shape[1] - 1)]
+    index = np.searchsorted(kept_cells, under)
+    found = (index < len(kept_cells)) & (kept_cells[np.minimum(index, len(kept_cells) - 1)] == under) if len(kept_cells) else np.zeros(len(under), bool)
+    nuclei["cell"] = np.where(found, index, -1)
+    return {"cell": cells, "nucleus": nuclei}
+
+OBJECT_COLUMNS = ["kind", "index", "area", "x", "y", "width", "height", "centroid_x", "centroid_y", "cell"]
+
+def objects_frame(objects: dict) -> pd.DataFrame:
+    """One row per object of segment: kind, index, area, bounding box, centroid and containing cell of the nuclei."""
+    frames = []
+    for kind, stats in objects.items():
+        frames.append(pd.DataFrame({
+            "kind": kind,
+            "index": np.arange(len(stats["area"])),
+            "area": stats["area"],
+            "x": stats["bbox"][:, 0],
+            "y": stats["bbox"][:, 1],
+            "width": stats["bbox"][:, 2],
+            "height": stats["bbox"][:, 3],
+            "centroid_x": stats["centroid"][:, 0],
+            "centroid_y": stats["centroid"][:, 1],
+            "cell": stats.get("cell", np.full(len(stats["area"]), -1))
+        }, columns=OBJECT_COLUMNS))
+    return pd.concat(frames, ignore_index=True)
+
+def _area_stats(areas: np.ndarray, prefix: str) -> dict:
+    return {
+        f"n_{prefix}": len(areas),
+        f"{prefix}_area_total": areas.sum(),
+        f"{prefix}_area_mean": areas.mean() if len(areas) else np.nan,
+        f"{prefix}_area_median": np.median(areas) if len(areas) else np.nan,
+        f"{prefix}_area_min": areas.min() if len(areas) else np.nan,
+        f"{prefix}_area_max": areas.max() if len(areas) else np.nan
+    }
+
+def object_stats(objects: dict) -> dict:
+    """Counts and areas of the cells and nuclei of segment, with the number of nuclei per cell."""
+    cells, nuclei = objects["cell"], objects["nucleus"]
+    row = _area_stats(cells["area"].astype(float), "cell")
+    row.update(_area_stats(nuclei["area"].astype(float), "nucleus"))
+    inside = nuclei["cell"][nuclei["cell"] >= 0]
+    nuclei_per_cell = np.bincount(inside, minlength=len(cells["area"]))
+    row.update({
+        "n_cell_with_nucleus": int((nuclei_per_cell > 0).sum()),
+        "n_nucleus_outside_cell": int(len(nuclei["cell"]) - len(inside)),
+        "nuclei_per_cell_mean": nuclei_per_cell.mean() if len(cells["area"]) else np.nan,
+        "nuclei_per_cell_max": int(nuclei_per_cell.max()) if len(cells["area"]) else 0
+    })
+    return row
+
+def contour_stats(contours: list, prefix: str) -> dict:
+    """Number of contours and summary of their areas, with column names starting with prefix."""
+    return _area_stats(np.array([cv2.contourArea(contour) for contour in contours], dtype=float), prefix)
+
+METHODS = ("contours", "components")
+
+def count_image(image_path: str, params: dict = None, method: str = "contours", with_objects: bool = False):
+    """
+    Counts and object statistics of one image file.
+
+    Errors are returned in the 'error' column instead of raised, so that one unreadable
+    image does not stop a batch.
+
+    Parameters
+    ----------
+    image_path : str
+    params : dict, optional
+        Keyword arguments of detect and segment (cell_ranges, nucleus_ranges, kernel_size, min_area).
+    method : str
+        'contours' (detect: contour areas, the counts of cells_recognition.ipynb) or 'components'
+        (segment: pixel areas, bounding boxes, centroids and number of nuclei per cell).
+    with_objects : bool
+        Also return the table of the objects of segment (objects_frame), with the 'components' method.
+
+    Returns
+    -------
+    row : dict
+    objects : DataFrame or None
+        Only with with_objects.
+    """
+
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, expected one of {METHODS}")
+    row = {"image": image_path}
+    objects = None
+    try:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise ValueError("not a readable image")
+        row["height"], row["width"] = image.shape[:2]
+        if method == "components":
+            segmented = segment(image, **(params or {}))
+            row.update(object_stats(segmented))
+            if with_objects:
+                objects = objects_frame(segmented)
+                objects.insert(0, "image", image_path)
+        else:
+            contours = detect(image, **(params or {}))
+            row.update(contour_stats(contours["cell"], "cell"))
+            row.update(contour_stats(contours["nucleus"], "nucleus"))
+        row["error"] = None
+    except (ValueError, cv2.error) as e:
+        row["error"] = str(e)
+    return (row, objects) if with_objects else row
+
+def collect_images(inputs: list) -> list:
+    """
+    Image files of a list of files, directories (their images) and glob patterns, without duplicates.
+
+    The images are kept in the order of the inputs (sorted within a directory or a pattern). An image
+    given twice, e.g. as a file and through its directory, is kept once, at its first position.
+    """
+
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.extend(sorted(os.path.join(item, name) for name in os.listdir(item)
+                                if name.lower().endswith(IMAGE_EXTENSIONS)))
+        elif os.path.exists(item):
+            paths.append(item)
+        else:
+            paths.extend(sorted(glob.glob(item, recursive=True)))
+    seen = set()
+    images = []
+    for path in paths:
+        real_path = os.path.realpath(path)
+        if real_path not in seen:
+            seen.add(real_path)
+            images.append(path)
+    return images
+
+def _init_worker() -> None:
+    # One OpenCV thread per process, the processes already use all the cores
+    cv2.setNumThreads(1)
+
+def count_images(paths: list, params: dict = None, workers: int = 1, report_every: int = 100,
+                 method: str = "contours", with_objects: bool = False):
+    """
+    Count cells and nuclei of many images, in a process pool if workers > 1.
+
+    Parameters
+    ----------
+    paths : list of str
+        Image files.
+    params : dict, optional
+        Keyword arguments of detect.
+    workers : int
+        Number of processes.
+    report_every : int
+        Print the progress and throughput every report_every images, 0 to disable.
+    method, with_objects
+        See count_image.
+
+    Yields
+    ------
+    row : dict, or (row, objects) with with_objects
+        Output of count_image, in the order of paths.
+    """
+
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) if workers > 1 else None
+    try:
+        if executor is not None:
+            n = len(paths)
+            rows = executor.map(count_image, paths, [params] * n, [method] * n, [with_objects] * n,
+                                chunksize=max(1, min(16, n // (workers * 4))))
+        else:
+            rows = (count_image(path, params, method, with_objects) for path in paths)
+        for i, row in enumerate(rows, 1):
+            yield row
+            if report_every and (i % report_every == 0 or i == len(paths)):
+                elapsed = time.perf_counter() - start
+                print(f"{i}/{len(paths)} images, {i / elapsed:.1f} images/s", file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def parse_ranges(text: str) -> list:
+    """HSV ranges given as 'h,s,v:h,s,v', several ranges separated by ';' (e.g. '0,70,50:10,255,255;170,70,50:180,255,255')."""
+    ranges = []
+    for item in text.split(";"):
+        bounds = [tuple(int(value) for value in bound.split(",")) for bound in item.split(":")]
+        if len(bounds) != 2 or any(len(bound) != 3 for bound in bounds):
+            raise argparse.ArgumentTypeError(f"Invalid HSV range: {item}, expected h,s,v:h,s,v")
+        ranges.append(tuple(bounds))
+    return ranges
+
+def main():
+    parser = argparse.ArgumentParser(description="Count cells (red cytoplasm) and nuclei (blue) in microscopy images.")
+    parser.add_argument('images', nargs='+', help='Image files, directories or glob patterns (quoted)')
+    parser.add_argument('--output', type=str, default='cell_counts.csv', help='Output table, one row per image (default: cell_counts.csv)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes (default: all cores)')
+    parser.add_argument('--cell-ranges', type=parse_ranges, default=CELL_RANGES,
+                        help='HSV ranges of the cells (default: 0,70,50:10,255,255;170,70,50:180,255,255)')
+    parser.add_argument('--nucleus-ranges', type=parse_ranges, default=NUCLEUS_RANGES,
+                        help='HSV ranges of the nuclei (default: 100,150,50:140,255,255)')
+    parser.add_argument('--kernel-size', type=int, default=KERNEL_SIZE, help=f'Size of the morphology kernel (default: {KERNEL_SIZE})')
+    parser.add_argument('--min-area', type=float, default=MIN_AREA, help=f'Minimum contour area in pixels (default: {MIN_AREA})')
+    parser.add_argument('--method', choices=METHODS, default='contours',
+                        help='contours: contour areas, as in cells_recognition.ipynb; '
+                             'components: connected components with pixel areas and nuclei per cell (default: contours)')
+    parser.add_argument('--objects', type=str, default=None,
+                        help='Also write one row per cell and nucleus (area, bounding box, centroid, containing cell) to this CSV, with --method components')
+    parser.add_argument('--report-every', type=int, default=100, help='Print the throughput every N images, 0 to disable (default: 100)')
+
+    args = parser.parse_args()
+
+    paths = collect_images(args.images)
+    if not paths:
+        print("No image found.")
+        sys.exit(1)
+
+    params = {"cell_ranges": args.cell_ranges, "nucleus_ranges": args.nucleus_ranges,
+              "kernel_size": args.kernel_size, "min_area": args.min_area}
+    start = time.perf_counter()
+    with_objects = args.objects is not None
+    if with_objects and args.method != 'components':
+        parser.error("--objects requires --method components")
+    results = count_images(paths, params, workers=args.workers, report_every=args.report_every,
+                           method=args.method, with_objects=with_objects)
+    if with_objects:
+        rows, objects = [], []
+        for row, image_objects in results:
+            rows.append(row)
+            if image_objects is not None:
+                objects.append(image_objects)
+        df = pd.DataFrame(rows)
+        objects = pd.concat(objects, ignore_index=True) if objects else pd.DataFrame(columns=["image"] + OBJECT_COLUMNS)
+        objects.to_csv(args.objects, index=False)
+    else:
+        df = pd.DataFrame(results)
+    elapsed = time.perf_counter() - start
+    df = df[[column for column in df.columns if column != "error"] + ["error"]]
+
+    df.to_csv(args.output, index=False)
+    failed = int(df["error"].notna().sum())
+    print(f"{len(df)} images in {elapsed:.1f} s ({len(df) / elapsed:.1f} images/s), {failed} failed. Counts saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from cells_recognition import (CELL_RANGES, NUCLEUS_RANGES, KERNEL_SIZE, MIN_AREA, color_mask, clean_mask,
+                               contour_stats, parse_ranges)
+
+TILE_SIZE = 2048
+OVERLAP = 256
+
+def open_image(image_path: str) -> tuple:
+    """
+    Open an image without loading it when possible.
+
+    .npy files (H x W x 3 uint8, BGR) are memory-mapped with numpy, TIFF files (RGB) with tifffile
+    if the image data is stored uncompressed. Other images are read with cv2.imread.
+
+    Returns
+    -------
+    image : ndarray or memmap
+    hsv_code : int
+        cv2.cvtColor code converting the image to HSV.
+    """
+
+    extension = os.path.splitext(image_path)[1].lower()
+    if extension == ".npy":
+        return np.load(image_path, mmap_mode="r"), cv2.COLOR_BGR2HSV
+    if extension in (".tif", ".tiff"):
+        try:
+            import tifffile
+        except ImportError:
+            raise ImportError("tifffile is required to memory-map TIFF images (pip install tifffile)")
+        try:
+            return tifffile.memmap(image_path, mode="r"), cv2.COLOR_RGB2HSV
+        except ValueError:
+            print(f"{image_path} is compressed and cannot be memory-mapped, it is read in memory", file=sys.stderr)
+            return tifffile.imread(image_path), cv2.COLOR_RGB2HSV
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"{image_path} is not a readable image")
+    return image, cv2.COLOR_BGR2HSV
+
+def tile_grid(height: int, width: int, tile_size: int = TILE_SIZE) -> list:
+    """Tiles (y0, y1, x0, x1) covering the image without overlap."""
+    return [(y, min(y + tile_size, height), x, min(x + tile_size, width))
+            for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+def window_masks(image: np.ndarray, hsv_code: int, window: tuple, params: dict, kinds: tuple = ("cell", "nucleus")) -> dict:
+    """
+    Cell and/or nucleus masks of a window of the image, identical to the masks of the whole image in that window.
+
+    The window is read with a halo of 2 * kernel_size pixels, more than the reach of the closing and
+    opening, and the masks are cropped back to the window.
+    """
+
+    y0, y1, x0, x1 = window
+    height, width = image.shape[:2]
+    halo = 2 * params["kernel_size"]
+    ry0, ry1, rx0, rx1 = max(0, y0 - halo), min(height, y1 + halo), max(0, x0 - halo), min(width, x1 + halo)
+    hsv_image = cv2.cvtColor(np.ascontiguousarray(image[ry0:ry1, rx0:rx1, :3]), hsv_code)
+    crop = (slice(y0 - ry0, y1 - ry0), slice(x0 - rx0, x1 - rx0))
+    return {kind: np.ascontiguousarray(clean_mask(color_mask(hsv_image, params[f"{kind}_ranges"]), params["kernel_size"])[crop])
+            for kind in kinds}
+
+def _touches(box: tuple, window: tuple, shape: tuple) -> bool:
+    """Whether a bounding box (x, y, w, h) in image coordinates touches an edge of the window that is not an edge of the image."""
+    x, y, w, h = box
+    y0, y1, x0, x1 = window
+    return ((y == y0 and y0 > 0) or (x == x0 and x0 > 0)
+            or (y + h == y1 and y1 < shape[0]) or (x + w == x1 and x1 < shape[1]))
+
+def _first_pixel(contour: np.ndarray) -> tuple:
+    """First pixel of an object in raster order (topmost, then leftmost), as (x, y)."""
+    points = contour[:, 0, :]
+    top = points[points[:, 1] == points[:, 1].min()]
+    return int(top[:, 0].min()), int(top[0, 1])
+
+def _complete_object(image, hsv_code, kind: str, point: tuple, box: tuple, params: dict, margin: int):
+    """
+    Contour of the whole object of a mask containing `point`, for an object cut by the edge of its window.
+
+    The window around the object is enlarged until the object no longer touches its edges.
+    """
+
+    shape = image.shape[:2]
+    x, y, w, h = box
+    while True:
+        window = (max(0, y - margin), min(shape[0], y + h + margin), max(0, x - margin), min(shape[1], x + w + margin))
+        mask = window_masks(image, hsv_code, window, params, kinds=(kind,))[kind]
+        _, labels = cv2.connectedComponents(mask, connectivity=8)
+        obj = (labels == labels[point[1] - window[0], point[0] - window[2]]).astype(np.uint8)
+        contours, _ = cv2.findContours(obj, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(window[2], window[0]))
+        x, y, w, h = cv2.boundingRect(contours[0])
+        if not _touches((x, y, w, h), window, shape):
+            return contours[0]
+        margin *= 2
+
+# Image of the worker processes, opened once per process
+_IMAGE = None
+
+def _init_worker(image_path: str) -> None:
+    global _IMAGE
+    cv2.setNumThreads(1)
+    _IMAGE = open_image(image_path)
+
+def tile_objects(tile: tuple, params: dict, overlap: int = OVERLAP, image: tuple = None) -> dict:
+    """
+    Contours of the objects of one tile, in image coordinates.
+
+    The tile is segmented with `overlap` pixels of context on each side. An object is kept by the tile
+    containing its first pixel (topmost, then leftmost), so that objects seen by several tiles are counted
+    once. Objects cut by the edge of the extended tile are completed by _complete_object.
+
+    Parameters
+    ----------
+    tile : (y0, y1, x0, x1)
+    params : dict
+        cell_ranges, nucleus_ranges, kernel_size and min_area.
+    overlap : int
+        Context around the tile, in pixels. Objects smaller than the overlap are never completed separately.
+    image : (ndarray, hsv_code), optional
+        Output of open_image, the image of the worker process by default.
+
+    Returns
+    -------
+    contours : dict
+        {"cell": list of contours, "nucleus": list of contours}
+    """
+
+    image, hsv_code = image or _IMAGE
+    shape = image.shape[:2]
+    y0, y1, x0, x1 = tile
+    window = (max(0, y0 - overlap), min(shape[0], y1 + overlap), max(0, x0 - overlap), min(shape[1], x1 + overlap))
+    masks = window_masks(image, hsv_code, window, params)
+
+    objects = {}
+    for kind, mask in masks.items():
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(window[2], window[0]))
+        kept = []
+        for contour in contours:
+            first = _first_pixel(contour)
+            if not (y0 <= first[1] < y1 and x0 <= first[0] < x1):
+                continue
+            box = cv2.boundingRect(contour)
+            if _touches(box, window, shape):
+                # Part of an object continuing outside the window. Other parts may be in the window too,
+                # only the part holding the first pixel of the whole object keeps it.
+                whole = _complete_object(image, hsv_code, kind, first, box, params, overlap)
+                if _first_pixel(whole) != first:
+                    continue
+                contour = whole
+            if cv2.contourArea(contour) > params["min_area"]:
+                kept.append(contour)
+        objects[kind] = kept
+    return objects
+
+def detect_tiled(image_path: str, cell_ranges: list = CELL_RANGES, nucleus_ranges: list = NUCLEUS_RANGES,
+                 kernel_size: int = KERNEL_SIZE, min_area: float = MIN_AREA, tile_size: int = TILE_SIZE,
+                 overlap: int = OVERLAP, workers: int = 1) -> dict:
+    """
+    Detect cells and nuclei of a large image tile by tile, in a process pool if workers > 1.
+
+    Each tile is read from the memory-mapped image (see open_image) with its overlap, so memory is
+    bounded by the tile size. The contours are those of cells_recognition.detect on the whole image,
+    except for objects lying inside the hole of another object of the same mask (not returned by
+    detect), which may be returned when the enclosing object spans several tiles.
+
+    Parameters
+    ----------
+    image_path : str
+    cell_ranges, nucleus_ranges, kernel_size, min_area
+        See cells_recognition.detect.
+    tile_size : int
+        Side of the tiles, in pixels.
+    overlap : int
+        Context read around each tile, in pixels, best set above the size of the largest cells.
+    workers : int
+        Number of processes.
+
+    Returns
+    -------
+    contours : dict
+        {"cell": list of contours, "nucleus": list of contours}
+    """
+
+    if overlap < 1:
+        raise ValueError("overlap must be at least 1 pixel")
+    params = {"cell_ranges": cell_ranges, "nucleus_ranges": nucleus_ranges, "kernel_size": kernel_size, "min_area": min_area}
+    image = open_image(image_path)
+    tiles = tile_grid(*image[0].shape[:2], tile_size)
+
+    objects = {"cell": [], "nucleus": []}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(image_path,)) as executor:
+            results = executor.map(tile_objects, tiles, [params] * len(tiles), [overlap] * len(tiles))
+            for result in results:
+                for kind, contours in result.items():
+                    objects[kind].extend(contours)
+    else:
+        for tile in tiles:
+            for kind, contours in tile_objects(tile, params, overlap, image).items():
+                objects[kind].extend(contours)
+    return objects
+
+def main():
+    parser = argparse.ArgumentParser(description="Count cells and nuclei in whole-slide images, tile by tile.")
+    parser.add_argument('images', nargs='+', help='Images: .npy (BGR, memory-mapped), uncompressed TIFF (memory-mapped) or any OpenCV format')
+    parser.add_argument('--output', type=str, default='cell_counts.csv', help='Output table, one row per image (default: cell_counts.csv)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of processes (default: all cores)')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help=f'Side of the tiles in pixels (default: {TILE_SIZE})')
+    parser.add_argument('--overlap', type=int, default=OVERLAP,
+                        help=f'Context read around each tile in pixels, above the size of the largest cells (default: {OVERLAP})')
+    parser.add_argument('--cell-ranges', type=parse_ranges, default=CELL_RANGES, help='HSV ranges of the cells (see cells_recognition.py)')
+    parser.add_argument('--nucleus-ranges', type=parse_ranges, default=NUCLEUS_RANGES, help='HSV ranges of the nuclei (see cells_recognition.py)')
+    parser.add_argument('--kernel-size', type=int, default=KERNEL_SIZE, help=f'Size of the morphology kernel (default: {KERNEL_SIZE})')
+    parser.add_argument('--min-area', type=float, default=MIN_AREA, help=f'Minimum contour area in pixels (default: {MIN_AREA})')
+
+    args = parser.parse_args()
+
+    rows = []
+    for image_path in args.images:
+        start = time.perf_counter()
+        contours = detect_tiled(image_path, args.cell_ranges, args.nucleus_ranges, args.kernel_size, args.min_area,
+                                tile_size=args.tile_size, overlap=args.overlap, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        height, width = open_image(image_path)[0].shape[:2]
+        row = {"image": image_path, "height": height, "width": width}
+        row.update(contour_stats(contours["cell"], "cell"))
+        row.update(contour_stats(contours["nucleus"], "nucleus"))
+        rows.append(row)
+        print(f"{image_path}: {row['n_cell']} cells, {row['n_nucleus']} nuclei in {elapsed:.1f} s "
+              f"({height * width / elapsed / 1e6:.1f} Mpixels/s)")
+
+    pd.DataFrame(rows).to_csv(args.output, index=False)
+    print(f"Counts saved to {args.output}")
+
+if __name__ == "__main__":
+    main()